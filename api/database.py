@@ -15,6 +15,9 @@ print(f"[DEBUG] DATABASE_URL being used: {DATABASE_URL}")
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Forked workers (gunicorn --preload) must not reuse the parent's pooled connections
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 
 def get_db():
     db = SessionLocal()
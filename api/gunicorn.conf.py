@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for Doutora IA (multiple workers, preloaded models)
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master (preload_app) with PRELOAD_MODELS on,
+so the embedding weights are loaded before fork and shared copy-on-write by
+every worker. See WORKERS_GUIDE.md.
+"""
+
+import os
+
+os.environ.setdefault("PRELOAD_MODELS", "true")
+# Also read by services.prefork to split the cores among the workers
+os.environ.setdefault("WEB_CONCURRENCY", "2")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.environ["WEB_CONCURRENCY"])
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+
+def pre_fork(server, worker):
+    from services.prefork import check_single_threaded
+    check_single_threaded()
+
+
+def post_fork(server, worker):
+    from services.prefork import worker_threads
+    server.log.info(f"Worker {worker.pid} started ({worker_threads()} inference threads)")
@@ -3,9 +3,15 @@ Main FastAPI application for Doutora IA
 """
 import os
 import json
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+# Startup timeline (/health/ready); begins before the imports below
+from services.startup import startup_report
+startup_report.begin("imports")
+
 # Carregar variáveis de ambiente do .env
 load_dotenv()
 
@@ -18,7 +24,8 @@ _import_status = {
 from typing import Optional, List
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 from sqlalchemy.orm import Session
 import re
@@ -31,23 +38,34 @@ from schemas import (
     PaymentWebhookRequest, HealthResponse, Citation, CitationType,
     CreateCheckoutRequest, CreateCheckoutResponse, PaymentStatusResponse
 )
-from rag import get_rag_system
 from prompts import get_system_prompt, get_triagem_prompt, get_relatorio_prompt, get_compose_prompt
 # from services.pdf import generate_pdf_report  # Comentado temporariamente para teste
 from services.citations import CitationManager
 from services.payments import PaymentService
 from services.queues import LeadQueue
 from services.auth import get_password_hash
+from services.prefork import preload_enabled, preload_models
 from database import engine, SessionLocal, get_db
 
 # Build version for deployment tracking
 BUILD_VERSION = "2.0.0-auth"  # Change this to track deployments
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Accept traffic right away; models and connections warm up in the background"""
+    startup_report.end("imports")
+    if not startup_report.is_ready:
+        threading.Thread(target=warm_up, name="startup-warm-up", daemon=True).start()
+    yield
+
+
 # Initialize FastAPI
 app = FastAPI(
     title="Doutora IA API",
     description="API for legal case analysis and document generation",
-    version=BUILD_VERSION
+    version=BUILD_VERSION,
+    lifespan=lifespan
 )
 
 # ============================================================
@@ -167,26 +185,22 @@ async def global_options(request: Request, path: str):
 # TEMPORARIAMENTE COMENTADO - tabelas já foram criadas via migrations
 # Base.metadata.create_all(bind=engine)
 
-# OpenAI client for vLLM
-from openai import OpenAI
+# Async LLM gateway for vLLM / Ollama (OpenAI-compatible)
+from services.llm import get_llm_gateway, LLMQueueFullError
 
 VLLM_BASE_URL = os.getenv("VLLM_BASE_URL", "http://localhost:11434/v1")
-VLLM_API_KEY = os.getenv("VLLM_API_KEY", "ollama")
-VLLM_MODEL = os.getenv("VLLM_MODEL", "llama3.1:8b")
 CORPUS_UPDATE_DATE = datetime.now().strftime('%d/%m/%Y')
+# Prompt tokens for RAG evidence in detailed analyses (standard ones use CONTEXT_TOKEN_BUDGET)
+CONTEXT_TOKEN_BUDGET_DETALHADO = int(os.getenv("CONTEXT_TOKEN_BUDGET_DETALHADO", "2400"))
 
-llm_client = OpenAI(
-    base_url=VLLM_BASE_URL,
-    api_key=VLLM_API_KEY
-)
+llm_gateway = get_llm_gateway(VLLM_BASE_URL)
 
-# Initialize services with error handling
-try:
-    rag = get_rag_system()
-except Exception as e:
-    print(f"Warning: Could not initialize RAG system: {e}")
-    rag = None
+# Retrieval services (qdrant_client, numpy, Redis) are created by init_retrieval() during warm-up
+rag = None
+semantic_cache = None
+_retrieval_lock = threading.Lock()
 
+# Initialize services with error handling
 try:
     payment_service = PaymentService()
 except Exception as e:
@@ -206,18 +220,81 @@ except Exception as e:
     citation_manager = None
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
+def init_retrieval():
+    """Import and create the RAG system and the semantic cache (once per process)"""
+    global rag, semantic_cache
+    with _retrieval_lock:
+        if rag is not None:
+            return
+
+        from rag import get_rag_system
+        from services.semantic_cache import SemanticAnalysisCache
+
+        try:
+            rag = get_rag_system()
+        except Exception as e:
+            print(f"Warning: Could not initialize RAG system: {e}")
+            rag = None
+
+        try:
+            semantic_cache = SemanticAnalysisCache(rag)
+        except Exception as e:
+            print(f"Warning: Could not initialize semantic cache: {e}")
+            semantic_cache = None
+
+
+def warm_up():
+    """Create services, load the embedding model and open Qdrant; then flip readiness"""
     try:
-        # Create Qdrant collections if they don't exist
-        if rag and rag.client:
-            rag.create_collections()
-            print("[OK] Qdrant collections ready")
-        else:
-            print("⚠ Qdrant not available - RAG features disabled")
+        with startup_report.phase("services"):
+            init_retrieval()
+
+        # The model loads in its own thread while Qdrant is contacted
+        model = None
+        if rag and os.getenv("EMBEDDING_WARMUP", "true").lower() == "true":
+            from services.model_registry import model_registry
+            model = startup_report.track(
+                "embedding_model", model_registry.warm_up(rag.embedding_model_name, rag.embedding_device)
+            )
+
+        try:
+            with startup_report.phase("qdrant"):
+                # Create Qdrant collections if they don't exist
+                if rag and rag.client:
+                    rag.create_collections()
+                    print("[OK] Qdrant collections ready")
+                else:
+                    print("⚠ Qdrant not available - RAG features disabled")
+        except Exception as e:
+            print(f"Warning: Could not initialize Qdrant: {e}")
+
+        # Context packer tokenizer (a Hugging Face download on a cold cache)
+        if rag:
+            try:
+                with startup_report.phase("tokenizer"):
+                    rag.context_packer.counter.load()
+            except Exception as e:
+                print(f"Warning: Could not load context tokenizer: {e}")
+
+        # Wait for the model (a failed load is reported here and retried on first use)
+        if model is not None:
+            model.exception()
     except Exception as e:
-        print(f"Warning: Could not initialize Qdrant: {e}")
+        print(f"Warning: Startup warm-up failed: {e}")
+    finally:
+        startup_report.mark_ready()
+        print(f"[OK] {startup_report.summary()}")
+
+
+# gunicorn --preload: load model weights once in the master, shared copy-on-write by the workers
+if preload_enabled():
+    with startup_report.phase("preload"):
+        init_retrieval()
+        if rag:
+            try:
+                preload_models(rag.embedding_model_name, rag.embedding_device)
+            except Exception as e:
+                print(f"Warning: Could not preload embedding model: {e}")
 
 
 @app.get("/")
@@ -242,30 +319,37 @@ async def health_check():
     }
 
     # Check database
-    try:
+    def check_database():
         from sqlalchemy import text
         db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        try:
+            db.execute(text("SELECT 1"))
+        finally:
+            db.close()
+
+    try:
+        await run_in_threadpool(check_database)
     except:
         services["database"] = "error"
 
-    # Check Qdrant
+    # Check Qdrant (off the event loop: the first rag.client access connects)
+    def check_qdrant() -> bool:
+        if not (rag and rag.client):
+            return False
+        rag.client.get_collections()
+        return True
+
     try:
-        if rag and rag.client:
-            rag.client.get_collections()
+        if await run_in_threadpool(check_qdrant):
+            if rag.vector_backend == "local-fallback":
+                services["qdrant"] = "fallback"
         else:
             services["qdrant"] = "unavailable"
     except:
         services["qdrant"] = "error"
 
-    # Check LLM
-    try:
-        if llm_client:
-            llm_client.models.list()
-        else:
-            services["llm"] = "unavailable"
-    except:
+    # Check LLM (does not wait for a generation slot)
+    if not await llm_gateway.ping():
         services["llm"] = "error"
 
     status = "healthy" if all(v == "ok" for v in services.values()) else "degraded"
@@ -278,6 +362,46 @@ async def health_check():
     )
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process serves requests (no dependency is checked)"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 503 until the startup warm-up is over, with the per-phase startup timings"""
+    report = startup_report.get_stats()
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **report})
+    return {"status": "degraded" if startup_report.failed_phases() else "ready", **report}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Performance metrics for the retrieval pipeline"""
+    from services.cache import embedding_cache
+    from services.vector_client import client_metrics
+    from services.encoder_backend import describe_encoder
+    from services.model_registry import model_registry
+
+    return {
+        "vector_backend": rag.vector_backend if rag else None,
+        "qdrant": client_metrics.get_stats(),
+        "embedding_encoder": describe_encoder(rag._encoder) if rag else None,
+        "embedding_models": model_registry.get_stats(),
+        "embedding_cache": embedding_cache.get_stats(),
+        "embedding_batcher": rag.batcher.get_stats() if rag and rag.batcher else None,
+        "llm": llm_gateway.get_stats(),
+        "startup": startup_report.get_stats(),
+        "semantic_cache": semantic_cache.get_stats() if semantic_cache else None,
+        "citation_index": rag.citation_index.get_stats() if rag and rag.citation_index else None,
+        "context_compression": rag.compressor.get_stats() if rag and rag._compressor else None,
+        "area_classifier": rag.area_classifier.get_stats() if rag and rag.area_classifier else None,
+        "chunk_store": rag.chunk_store.get_stats() if rag and rag.chunk_store else None
+    }
+
+
 @app.get("/debug/imports")
 async def debug_imports():
     """Debug endpoint to check auth import status"""
@@ -296,133 +420,91 @@ async def analyze_case(
     """
     Analyze a case and provide free triage or detailed analysis
     """
-    # Get RAG context
-    context = ""
-    if rag and rag.client:
-        try:
-            context = rag.get_context_for_case(
-                descricao=request.descricao,
-                limit_per_type=5 if request.detalhado else 3
-            )
-        except Exception as e:
-            print(f"Warning: RAG error: {e}")
-            context = ""
-
-    # Build prompt
-    prompt = get_triagem_prompt(
-        descricao=request.descricao,
-        contexto_rag=context,
-        data_atualizacao=CORPUS_UPDATE_DATE
-    )
+    # Reuse a previous analysis of the same (or a paraphrased) description
+    parsed = await get_cached_case_analysis(request)
 
-    # Call LLM
-    try:
-        response = llm_client.chat.completions.create(
-            model=VLLM_MODEL,
-            messages=[
-                {"role": "system", "content": get_system_prompt(CORPUS_UPDATE_DATE)},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=4096
-        )
+    if parsed is None:
+        # Get RAG context and build prompt
+        context = await get_case_context(request)
+        messages = build_analysis_messages(request.descricao, context)
 
-        analysis_text = response.choices[0].message.content
+        # Call LLM
+        try:
+            analysis_text = await llm_gateway.chat(
+                messages=messages,
+                temperature=0.3,
+                max_tokens=4096
+            )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"LLM error: {str(e)}")
+        except LLMQueueFullError as e:
+            raise HTTPException(status_code=503, detail=f"LLM busy: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"LLM error: {str(e)}")
 
-    # Parse analysis
-    parsed = parse_analysis_response(analysis_text)
+        # Parse analysis
+        parsed = parse_analysis_response(analysis_text)
+        await store_case_analysis(request, parsed)
 
-    # Create case record
-    case = Case(
-        description=request.descricao,
-        area=parsed.get("area", ""),
-        sub_area=parsed.get("sub_area", ""),
-        typification=parsed.get("tipificacao", ""),
-        strategies=parsed.get("estrategias", ""),
-        risks=parsed.get("riscos", ""),
-        probability=parsed.get("probabilidade", ProbabilityLevel.MEDIA),
-        cost_estimate=parsed.get("custos", ""),
-        timeline_estimate=parsed.get("prazos", ""),
-        checklist=parsed.get("checklist", []),
-        draft_petition=parsed.get("rascunho_peticao", ""),
-        citations=parsed.get("citacoes", []),
-        score_prob=parsed.get("score_prob", 50.0),
-        status=CaseStatus.ANALYZED,
-        analyzed_at=datetime.utcnow()
-    )
+    # Persist case and citations (off the event loop)
+    case = await run_in_threadpool(save_case_analysis, db, request, parsed)
 
-    # Link to user if email provided
-    if request.user_email:
-        user = db.query(User).filter(User.email == request.user_email).first()
-        if not user:
-            user = User(email=request.user_email, is_active=True)
-            db.add(user)
-            db.flush()
-        case.user_id = user.id
+    return build_analysis_response(case, parsed)
 
-    db.add(case)
-    db.commit()
-    db.refresh(case)
 
-    # Log citations
-    for cit in parsed.get("citacoes", []):
-        citation_log = CitationLog(
-            source_type="report",
-            source_id=case.id,
-            citation_id=cit.get("id", ""),
-            citation_type=cit.get("tipo", ""),
-            citation_title=cit.get("titulo", ""),
-            citation_text=cit.get("texto", "")
-        )
-        db.add(citation_log)
-
-    db.commit()
-
-    # Normalize citation type to valid enum values
-    _CITATION_TYPE_MAP = {
-        "lei": "lei", "legislação": "lei", "legislacao": "lei",
-        "sumula": "sumula", "súmula": "sumula",
-        "juris": "juris", "jurisprudência": "juris", "jurisprudencia": "juris",
-        "regulatorio": "regulatorio", "regulatório": "regulatorio",
-        "doutrina": "doutrina",
-    }
+@app.post("/analyze_case/stream")
+async def analyze_case_stream(request: AnalyzeCaseRequest):
+    """
+    Streaming variant of /analyze_case (Server-Sent Events)
+
+    Events:
+        start   - sent immediately, before retrieval
+        token   - {"text": ...} LLM output as it is generated
+        section - {"name": ..., "content": ...} each numbered section once complete
+        done    - full AnalysisResponse, after the case is persisted
+        error   - {"detail": ...}
+    """
+    async def event_stream():
+        yield sse_event("start", {"base_atualizada_em": CORPUS_UPDATE_DATE})
+
+        parsed = await get_cached_case_analysis(request)
+
+        if parsed is None:
+            context = await get_case_context(request)
+            messages = build_analysis_messages(request.descricao, context)
+            section_parser = AnalysisStreamParser()
+            chunks = []
+
+            try:
+                async for delta in llm_gateway.stream(messages, temperature=0.3, max_tokens=4096):
+                    chunks.append(delta)
+                    yield sse_event("token", {"text": delta})
+                    for name, content in section_parser.feed(delta):
+                        yield sse_event("section", {"name": name, "content": content})
+            except Exception as e:
+                yield sse_event("error", {"detail": f"LLM error: {str(e)}"})
+                return
+
+            for name, content in section_parser.close():
+                yield sse_event("section", {"name": name, "content": content})
+
+            parsed = parse_analysis_response("".join(chunks))
+            await store_case_analysis(request, parsed)
+
+        # Persist case and citations once the full text is known. The request
+        # scoped session is already closed when streaming, so use our own.
+        db = SessionLocal()
+        try:
+            case = await run_in_threadpool(save_case_analysis, db, request, parsed)
+            response = build_analysis_response(case, parsed)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error saving case: {str(e)}"})
+            return
+        finally:
+            db.close()
 
-    # Convert citations to schema
-    citations_schema = [
-        Citation(
-            id=cit.get("id", ""),
-            tipo=CitationType(_CITATION_TYPE_MAP.get(cit.get("tipo", "lei").lower(), "lei")),
-            titulo=cit.get("titulo", ""),
-            texto=cit.get("texto", ""),
-            artigo_ou_tema=cit.get("artigo_ou_tema"),
-            orgao=cit.get("orgao"),
-            tribunal=cit.get("tribunal"),
-            data=cit.get("data"),
-            fonte_url=cit.get("fonte_url"),
-            hierarquia=cit.get("hierarquia")
-        )
-        for cit in parsed.get("citacoes", [])
-    ]
+        yield sse_event("done", response.model_dump(mode="json"))
 
-    return AnalysisResponse(
-        case_id=case.id,
-        tipificacao=parsed.get("tipificacao", ""),
-        area=parsed.get("area", ""),
-        sub_area=parsed.get("sub_area"),
-        estrategias=parsed.get("estrategias", ""),
-        riscos=parsed.get("riscos", ""),
-        probabilidade=parsed.get("probabilidade", ProbabilityLevel.MEDIA),
-        probabilidade_detalhes=parsed.get("probabilidade_detalhes", ""),
-        custos=parsed.get("custos", ""),
-        prazos=parsed.get("prazos", ""),
-        checklist=parsed.get("checklist", []),
-        rascunho_peticao=parsed.get("rascunho_peticao", ""),
-        citacoes=citations_schema,
-        base_atualizada_em=CORPUS_UPDATE_DATE
-    )
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.post("/report", response_model=ReportResponse)
@@ -466,8 +548,12 @@ async def search(request: SearchRequest):
     """
     Unified search endpoint for laws, jurisprudence, súmulas, regulatory, doctrine
     """
+    if rag is None:
+        raise HTTPException(status_code=503, detail="Search is not available yet")
+
     try:
-        results = rag.search(
+        # Async pipeline: embedding batches are shared and Qdrant is queried over gRPC
+        results = await rag.asearch(
             query=request.query,
             tipo=request.tipo.value if request.tipo else None,
             area=request.area.value if request.area else None,
@@ -475,7 +561,9 @@ async def search(request: SearchRequest):
             tribunal=request.tribunal,
             data_inicio=request.data_inicio,
             data_fim=request.data_fim,
-            limit=request.limit
+            vigente_em=request.vigente_em,
+            limit=request.limit,
+            oversampling=request.oversampling
         )
 
         citations = [
@@ -512,71 +600,60 @@ async def compose_document(
     """
     Generate legal document (initial petition, contestation, appeal)
     """
-    # Build metadata dict
-    metadata = {
-        "autor_nome": request.autor_nome,
-        "autor_qualificacao": request.autor_qualificacao,
-        "reu_nome": request.reu_nome,
-        "reu_qualificacao": request.reu_qualificacao,
-        "foro": request.foro,
-        "vara": request.vara,
-        "valor_causa": f"{request.valor_causa:,.2f}" if request.valor_causa else "0,00",
-        "fatos_resumo": request.fatos_resumo,
-        "citacoes_json": json.dumps([c.model_dump() for c in request.citacoes], ensure_ascii=False),
-        "pedidos_lista": "\n".join(request.pedidos)
-    }
+    metadata = build_compose_metadata(request)
 
     # Get LLM to generate blocks
-    prompt = get_compose_prompt(
-        tipo_peca=request.tipo_peca.value,
-        area=request.area.value,
-        metadata=metadata
-    )
-
     try:
-        response = llm_client.chat.completions.create(
-            model=VLLM_MODEL,
-            messages=[
-                {"role": "system", "content": get_system_prompt(CORPUS_UPDATE_DATE)},
-                {"role": "user", "content": prompt}
-            ],
+        llm_output = await llm_gateway.chat(
+            messages=build_compose_messages(request, metadata),
             temperature=0.2,
             max_tokens=4096
         )
 
-        llm_output = response.choices[0].message.content
-
         # Parse JSON response
-        import json
         blocks = json.loads(llm_output)
 
+    except LLMQueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"LLM busy: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Document generation error: {str(e)}")
 
-    # Generate document using template
-    from services.pdf import generate_document
+    # Generate document using template (off the event loop)
+    return await run_in_threadpool(render_composed_document, request, metadata, blocks)
 
-    doc_path = generate_document(
-        tipo_peca=request.tipo_peca.value,
-        area=request.area.value,
-        metadata=metadata,
-        blocks=blocks,
-        citacoes=request.citacoes,
-        format=request.export_format
-    )
 
-    # Generate unique ID
-    import uuid
-    doc_id = str(uuid.uuid4())
+@app.post("/compose/stream")
+async def compose_document_stream(request: ComposeRequest):
+    """
+    Streaming variant of /compose (Server-Sent Events)
 
-    doc_url = f"/documents/{os.path.basename(doc_path)}"
+    Streams LLM tokens as "token" events and finishes with a "done" event
+    carrying the ComposeResponse once the document has been rendered.
+    """
+    async def event_stream():
+        yield sse_event("start", {"tipo_peca": request.tipo_peca.value})
 
-    return ComposeResponse(
-        document_id=doc_id,
-        document_url=doc_url,
-        format=request.export_format,
-        created_at=datetime.utcnow()
-    )
+        metadata = build_compose_metadata(request)
+        chunks = []
+
+        try:
+            async for delta in llm_gateway.stream(
+                build_compose_messages(request, metadata),
+                temperature=0.2,
+                max_tokens=4096
+            ):
+                chunks.append(delta)
+                yield sse_event("token", {"text": delta})
+
+            blocks = json.loads("".join(chunks))
+            response = await run_in_threadpool(render_composed_document, request, metadata, blocks)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Document generation error: {str(e)}"})
+            return
+
+        yield sse_event("done", response.model_dump(mode="json"))
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.post("/lawyers/register")
@@ -848,6 +925,302 @@ async def stripe_webhook(
 
 
 # Helper functions
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # Disable nginx buffering so events flush immediately
+}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def get_case_context(request: AnalyzeCaseRequest) -> str:
+    """Get RAG context for a case description (off the event loop)"""
+    if rag is None:
+        return ""
+
+    def build_context() -> str:
+        # rag.client may connect (and retry) on first access, so check it in the thread too
+        if not rag.client:
+            return ""
+        return rag.get_context_for_case(
+            descricao=request.descricao,
+            limit_per_type=5 if request.detalhado else 3,
+            token_budget=CONTEXT_TOKEN_BUDGET_DETALHADO if request.detalhado else None
+        )
+
+    try:
+        return await run_in_threadpool(build_context)
+    except Exception as e:
+        print(f"Warning: RAG error: {e}")
+        return ""
+
+
+async def get_cached_case_analysis(request: AnalyzeCaseRequest) -> Optional[dict]:
+    """Look up a cached structured analysis (exact or semantic match)"""
+    if not semantic_cache:
+        return None
+
+    parsed = await run_in_threadpool(semantic_cache.lookup, request.descricao, request.detalhado, request.user_email)
+    if parsed is None:
+        return None
+
+    parsed = dict(parsed)
+    parsed["probabilidade"] = ProbabilityLevel(parsed.get("probabilidade", ProbabilityLevel.MEDIA))
+    return parsed
+
+
+async def store_case_analysis(request: AnalyzeCaseRequest, parsed: dict):
+    """Store a fresh structured analysis in the answer cache"""
+    if semantic_cache:
+        await run_in_threadpool(semantic_cache.store, request.descricao, request.detalhado, parsed, request.user_email)
+
+
+def build_analysis_messages(descricao: str, context: str) -> List[dict]:
+    """Build chat messages for case triage"""
+    prompt = get_triagem_prompt(
+        descricao=descricao,
+        contexto_rag=context,
+        data_atualizacao=CORPUS_UPDATE_DATE
+    )
+
+    return [
+        {"role": "system", "content": get_system_prompt(CORPUS_UPDATE_DATE)},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def build_compose_metadata(request: ComposeRequest) -> dict:
+    """Build template metadata dict for document composition"""
+    return {
+        "autor_nome": request.autor_nome,
+        "autor_qualificacao": request.autor_qualificacao,
+        "reu_nome": request.reu_nome,
+        "reu_qualificacao": request.reu_qualificacao,
+        "foro": request.foro,
+        "vara": request.vara,
+        "valor_causa": f"{request.valor_causa:,.2f}" if request.valor_causa else "0,00",
+        "fatos_resumo": request.fatos_resumo,
+        "citacoes_json": json.dumps([c.model_dump() for c in request.citacoes], ensure_ascii=False),
+        "pedidos_lista": "\n".join(request.pedidos)
+    }
+
+
+def build_compose_messages(request: ComposeRequest, metadata: dict) -> List[dict]:
+    """Build chat messages asking the LLM for the document blocks"""
+    prompt = get_compose_prompt(
+        tipo_peca=request.tipo_peca.value,
+        area=request.area.value,
+        metadata=metadata
+    )
+
+    return [
+        {"role": "system", "content": get_system_prompt(CORPUS_UPDATE_DATE)},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def render_composed_document(request: ComposeRequest, metadata: dict, blocks: dict) -> ComposeResponse:
+    """Render the document from LLM blocks and return its ComposeResponse"""
+    from services.pdf import generate_document
+
+    doc_path = generate_document(
+        tipo_peca=request.tipo_peca.value,
+        area=request.area.value,
+        metadata=metadata,
+        blocks=blocks,
+        citacoes=request.citacoes,
+        format=request.export_format
+    )
+
+    # Generate unique ID
+    import uuid
+    doc_id = str(uuid.uuid4())
+
+    doc_url = f"/documents/{os.path.basename(doc_path)}"
+
+    return ComposeResponse(
+        document_id=doc_id,
+        document_url=doc_url,
+        format=request.export_format,
+        created_at=datetime.utcnow()
+    )
+
+
+def save_case_analysis(db: Session, request: AnalyzeCaseRequest, parsed: dict) -> Case:
+    """Create the Case row and its CitationLog entries for an analysis"""
+    case = Case(
+        description=request.descricao,
+        area=parsed.get("area", ""),
+        sub_area=parsed.get("sub_area", ""),
+        typification=parsed.get("tipificacao", ""),
+        strategies=parsed.get("estrategias", ""),
+        risks=parsed.get("riscos", ""),
+        probability=parsed.get("probabilidade", ProbabilityLevel.MEDIA),
+        cost_estimate=parsed.get("custos", ""),
+        timeline_estimate=parsed.get("prazos", ""),
+        checklist=parsed.get("checklist", []),
+        draft_petition=parsed.get("rascunho_peticao", ""),
+        citations=parsed.get("citacoes", []),
+        score_prob=parsed.get("score_prob", 50.0),
+        status=CaseStatus.ANALYZED,
+        analyzed_at=datetime.utcnow()
+    )
+
+    # Link to user if email provided
+    if request.user_email:
+        user = db.query(User).filter(User.email == request.user_email).first()
+        if not user:
+            user = User(email=request.user_email, is_active=True)
+            db.add(user)
+            db.flush()
+        case.user_id = user.id
+
+    db.add(case)
+    db.commit()
+    db.refresh(case)
+
+    # Log citations
+    for cit in parsed.get("citacoes", []):
+        citation_log = CitationLog(
+            source_type="report",
+            source_id=case.id,
+            citation_id=cit.get("id", ""),
+            citation_type=cit.get("tipo", ""),
+            citation_title=cit.get("titulo", ""),
+            citation_text=cit.get("texto", "")
+        )
+        db.add(citation_log)
+
+    db.commit()
+
+    return case
+
+
+def build_analysis_response(case: Case, parsed: dict) -> AnalysisResponse:
+    """Build AnalysisResponse from a persisted case and parsed LLM output"""
+    # Normalize citation type to valid enum values
+    _CITATION_TYPE_MAP = {
+        "lei": "lei", "legislação": "lei", "legislacao": "lei",
+        "sumula": "sumula", "súmula": "sumula",
+        "juris": "juris", "jurisprudência": "juris", "jurisprudencia": "juris",
+        "regulatorio": "regulatorio", "regulatório": "regulatorio",
+        "doutrina": "doutrina",
+    }
+
+    # Convert citations to schema
+    citations_schema = [
+        Citation(
+            id=cit.get("id", ""),
+            tipo=CitationType(_CITATION_TYPE_MAP.get(cit.get("tipo", "lei").lower(), "lei")),
+            titulo=cit.get("titulo", ""),
+            texto=cit.get("texto", ""),
+            artigo_ou_tema=cit.get("artigo_ou_tema"),
+            orgao=cit.get("orgao"),
+            tribunal=cit.get("tribunal"),
+            data=cit.get("data"),
+            fonte_url=cit.get("fonte_url"),
+            hierarquia=cit.get("hierarquia")
+        )
+        for cit in parsed.get("citacoes", [])
+    ]
+
+    return AnalysisResponse(
+        case_id=case.id,
+        tipificacao=parsed.get("tipificacao", ""),
+        area=parsed.get("area", ""),
+        sub_area=parsed.get("sub_area"),
+        estrategias=parsed.get("estrategias", ""),
+        riscos=parsed.get("riscos", ""),
+        probabilidade=parsed.get("probabilidade", ProbabilityLevel.MEDIA),
+        probabilidade_detalhes=parsed.get("probabilidade_detalhes", ""),
+        custos=parsed.get("custos", ""),
+        prazos=parsed.get("prazos", ""),
+        checklist=parsed.get("checklist", []),
+        rascunho_peticao=parsed.get("rascunho_peticao", ""),
+        citacoes=citations_schema,
+        base_atualizada_em=CORPUS_UPDATE_DATE
+    )
+
+
+# Section headers of the triage answer, in the order the prompt requests them
+ANALYSIS_SECTION_PATTERNS = [
+    (r'(?:1\.\s*\*?\*?)?TIPIFICA[ÇC][ÃA]O\s*(?:DA\s*CAUSA)?\*?\*?', 'tipificacao'),
+    (r'(?:2\.\s*\*?\*?)?ESTRAT[ÉE]GIAS?\s*(?:E\s*RISCOS?)?\*?\*?', 'estrategias'),
+    (r'(?:3\.\s*\*?\*?)?PROBABILIDADE\s*(?:DE\s*[ÊE]XITO)?\*?\*?', 'probabilidade_section'),
+    (r'(?:4\.\s*\*?\*?)?CUSTOS?\s*(?:E\s*PRAZOS?)?\*?\*?', 'custos_prazos'),
+    (r'(?:5\.\s*\*?\*?)?CHECKLIST\s*(?:DE\s*DOCUMENTOS?)?\*?\*?', 'checklist_section'),
+    (r'(?:6\.\s*\*?\*?)?RASCUNHO\s*(?:DE\s*PETI[ÇC][ÃA]O)?\*?\*?', 'rascunho'),
+    (r'(?:7\.\s*\*?\*?)?CITA[ÇC][ÕO]ES?\s*(?:DA\s*BASE)?\*?\*?', 'citacoes_section'),
+    (r'(?:8\.\s*\*?\*?)?BASE\s*ATUALIZADA\*?\*?', 'base'),
+]
+ANALYSIS_SECTION_REGEXES = [
+    (re.compile(pattern, re.IGNORECASE), name) for pattern, name in ANALYSIS_SECTION_PATTERNS
+]
+
+
+def find_analysis_sections(text: str) -> list:
+    """Return (start, end, name) of each section header found, sorted by position"""
+    sections = []
+    for regex, name in ANALYSIS_SECTION_REGEXES:
+        match = regex.search(text)
+        if match:
+            sections.append((match.start(), match.end(), name))
+
+    sections.sort(key=lambda x: x[0])
+    return sections
+
+
+def clean_section_text(text: str) -> str:
+    return text.strip().strip('*').strip(':').strip()
+
+
+class AnalysisStreamParser:
+    """
+    Incremental version of the section split in parse_analysis_response
+
+    Feed LLM deltas as they arrive; a section is emitted as soon as the
+    header of the following section shows up, and the last one on close().
+    Only complete lines are scanned so a header is never cut mid-token.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.scanned_upto = 0
+        self.emitted = set()
+
+    def _complete_sections(self, text: str, final: bool) -> list:
+        sections = find_analysis_sections(text)
+        completed = []
+        for i, (start, end, name) in enumerate(sections):
+            if name in self.emitted:
+                continue
+            if i + 1 < len(sections):
+                next_start = sections[i + 1][0]
+            elif final:
+                next_start = len(text)
+            else:
+                break
+            self.emitted.add(name)
+            completed.append((name, clean_section_text(text[end:next_start])))
+        return completed
+
+    def feed(self, delta: str) -> list:
+        """Add a delta and return newly completed (name, content) sections"""
+        self.buffer += delta
+        last_newline = self.buffer.rfind("\n")
+        if last_newline < self.scanned_upto:
+            return []
+        self.scanned_upto = last_newline + 1
+        return self._complete_sections(self.buffer[:self.scanned_upto], final=False)
+
+    def close(self) -> list:
+        """Return the sections still pending at end of stream"""
+        return self._complete_sections(self.buffer, final=True)
+
+
 def parse_analysis_response(text: str) -> dict:
     """Parse LLM response into structured data by extracting numbered sections"""
     result = {
@@ -866,32 +1239,12 @@ def parse_analysis_response(text: str) -> dict:
         "score_prob": 50.0
     }
 
-    # Define section headers to split on
-    section_patterns = [
-        (r'(?:1\.\s*\*?\*?)?TIPIFICA[ÇC][ÃA]O\s*(?:DA\s*CAUSA)?\*?\*?', 'tipificacao'),
-        (r'(?:2\.\s*\*?\*?)?ESTRAT[ÉE]GIAS?\s*(?:E\s*RISCOS?)?\*?\*?', 'estrategias'),
-        (r'(?:3\.\s*\*?\*?)?PROBABILIDADE\s*(?:DE\s*[ÊE]XITO)?\*?\*?', 'probabilidade_section'),
-        (r'(?:4\.\s*\*?\*?)?CUSTOS?\s*(?:E\s*PRAZOS?)?\*?\*?', 'custos_prazos'),
-        (r'(?:5\.\s*\*?\*?)?CHECKLIST\s*(?:DE\s*DOCUMENTOS?)?\*?\*?', 'checklist_section'),
-        (r'(?:6\.\s*\*?\*?)?RASCUNHO\s*(?:DE\s*PETI[ÇC][ÃA]O)?\*?\*?', 'rascunho'),
-        (r'(?:7\.\s*\*?\*?)?CITA[ÇC][ÕO]ES?\s*(?:DA\s*BASE)?\*?\*?', 'citacoes_section'),
-        (r'(?:8\.\s*\*?\*?)?BASE\s*ATUALIZADA\*?\*?', 'base'),
-    ]
-
-    # Find all section positions
-    sections = []
-    for pattern, name in section_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            sections.append((match.start(), match.end(), name))
-
-    sections.sort(key=lambda x: x[0])
-
-    # Extract text between sections
+    # Find all section positions and extract text between them
+    sections = find_analysis_sections(text)
     section_texts = {}
     for i, (start, end, name) in enumerate(sections):
         next_start = sections[i + 1][0] if i + 1 < len(sections) else len(text)
-        section_texts[name] = text[end:next_start].strip().strip('*').strip(':').strip()
+        section_texts[name] = clean_section_text(text[end:next_start])
 
     # Fill result fields
     result["tipificacao"] = section_texts.get("tipificacao", text)
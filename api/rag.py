@@ -2,11 +2,52 @@
 RAG (Retrieval-Augmented Generation) system for Doutora IA
 """
 import os
-from typing import List, Dict, Optional, Tuple
-from datetime import datetime
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Dict, Optional, Tuple
+from datetime import date
+import numpy as np
+from qdrant_client.models import (
+    PointStruct, Filter, FieldCondition, MatchValue, Range, IsEmptyCondition,
+    PayloadField, HasIdCondition, PayloadSelectorExclude, SearchParams,
+    QuantizationSearchParams
+)
+
+try:
+    from services.cache import embedding_cache
+    from services.embeddings import EmbeddingBatcher
+except ImportError:  # Imported as api.rag by ingest scripts (no query cache/batching needed)
+    embedding_cache = None
+    EmbeddingBatcher = None
+
+try:
+    from services.collection_profile import load_collection_profiles, SHORT_VECTOR, FULL_VECTOR
+    from services.lexical import load_lexical_index, build_lexical_index_from_qdrant, reciprocal_rank_fusion
+    from services.citation_index import CitationIndex, load_citation_index
+    from services.diversify import diversify as diversify_results
+    from services.context_packer import ContextPacker
+    from services.compression import SentenceCompressor
+    from services.area_classifier import load_area_classifier, build_area_classifier_from_qdrant
+    from services.local_index import LocalIndexClient, has_local_index
+    from services.chunk_store import ChunkStore, load_chunk_store
+    from services.vector_client import create_qdrant_client, create_async_qdrant_client
+    from services.ingest_pipeline import IngestPipeline
+    from services.model_registry import model_registry, ingest_backend
+    from services.dates import DATE_PAYLOAD_FIELDS, EPOCH, to_epoch_day, epoch_days, with_epoch_days
+except ImportError:
+    from api.services.collection_profile import load_collection_profiles, SHORT_VECTOR, FULL_VECTOR
+    from api.services.lexical import load_lexical_index, build_lexical_index_from_qdrant, reciprocal_rank_fusion
+    from api.services.citation_index import CitationIndex, load_citation_index
+    from api.services.diversify import diversify as diversify_results
+    from api.services.context_packer import ContextPacker
+    from api.services.compression import SentenceCompressor
+    from api.services.area_classifier import load_area_classifier, build_area_classifier_from_qdrant
+    from api.services.local_index import LocalIndexClient, has_local_index
+    from api.services.chunk_store import ChunkStore, load_chunk_store
+    from api.services.vector_client import create_qdrant_client, create_async_qdrant_client
+    from api.services.ingest_pipeline import IngestPipeline
+    from api.services.model_registry import model_registry, ingest_backend
+    from api.services.dates import DATE_PAYLOAD_FIELDS, EPOCH, to_epoch_day, epoch_days, with_epoch_days
 
 
 class RAGSystem:
@@ -14,36 +55,274 @@ class RAGSystem:
         self.qdrant_host = os.getenv("QDRANT_HOST", "localhost")
         self.qdrant_port = int(os.getenv("QDRANT_PORT", "6333"))
         self.embedding_model_name = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
+        self.embedding_device = os.getenv("EMBEDDING_DEVICE", "cpu")
+
+        # Vector index backend: qdrant, local (embedded index) or auto (Qdrant, local when unreachable)
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "auto").lower()
 
         # Lazy initialization (will be initialized on first use)
         self._client = None
+        self._aclient = None
         self._encoder = None
+        self._ingest_encoder = None
+        self._embedding_cache_model = None
+        self._search_pool = None
+        self._batcher = None
+        self._profiles = None
+        self._lexical = {}
+        self._citation_index = None
+        self._context_packer = None
+        self._compressor = None
+        self._area_classifier = None
+        self._chunk_store = None
+
+        # Chunk texts kept outside Qdrant: searches fetch metadata, then texts of the final hits.
+        # Off by default: ingestion then strips texto from Qdrant, so the store must ship with the API
+        self.chunk_store_enabled = os.getenv("CHUNK_STORE_ENABLED", "false").lower() == "true"
+
+        # Hybrid retrieval: BM25 postings fused with vector hits (RRF)
+        self.hybrid_enabled = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+
+        # Ranking weights (similarity, hierarchy, vigência, recency) and recency decay
+        self.rank_weights = {
+            "similarity": float(os.getenv("RANK_WEIGHT_SIMILARITY", "0.3")),
+            "hierarchy": float(os.getenv("RANK_WEIGHT_HIERARCHY", "0.4")),
+            "vigencia": float(os.getenv("RANK_WEIGHT_VIGENCIA", "0.2")),
+            "recency": float(os.getenv("RANK_WEIGHT_RECENCY", "0.1"))
+        }
+        self.recency_horizon_years = float(os.getenv("RANK_RECENCY_HORIZON_YEARS", "10"))
+
+        # Context diversification: candidates per slot and MMR relevance/diversity trade-off
+        self.diversity_pool = int(os.getenv("CONTEXT_CANDIDATES_PER_SLOT", "4"))
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+        # Extractive compression of long chunks before prompt assembly
+        self.compression_enabled = os.getenv("CONTEXT_COMPRESSION_ENABLED", "true").lower() == "true"
+
+        # Query area classifier: confident predictions filter by area and prune collections
+        self.area_classifier_enabled = os.getenv("AREA_CLASSIFIER_ENABLED", "true").lower() == "true"
+        self.area_min_confidence = float(os.getenv("AREA_FILTER_CONFIDENCE", "0.8"))
 
         # Initialize collections and hierarchy
         self._init_collections()
 
     @property
     def client(self):
-        """Lazy load Qdrant client on first access"""
+        """
+        Lazy load the index client on first access
+
+        A shared Qdrant client (gRPC preferred, retries and latency metrics,
+        see services/vector_client.py), or a LocalIndexClient
+        (services/local_index.py) when VECTOR_BACKEND=local, or when it is
+        auto, Qdrant does not answer and a local index was exported.
+        """
         if self._client is None:
+            if self.vector_backend == "local":
+                self._client = LocalIndexClient()
+                return self._client
             try:
-                self._client = QdrantClient(host=self.qdrant_host, port=self.qdrant_port)
+                self._client = create_qdrant_client()
+                if self.vector_backend == "auto" and has_local_index():
+                    self._client.get_collections()
             except Exception as e:
+                if self.vector_backend == "auto" and has_local_index():
+                    print(f"Warning: Qdrant unreachable ({e}), using local index")
+                    self._client = LocalIndexClient()
+                    self.vector_backend = "local-fallback"
+                    return self._client
                 print(f"Warning: Could not connect to Qdrant: {e}")
+                self._client = None
                 return None
         return self._client
 
+    @property
+    def aclient(self):
+        """
+        Lazy async Qdrant client for the async API (None on the local index
+        backend or without Qdrant)
+
+        Reads the sync client only once it exists (warm-up creates it): creating
+        it here would connect, and in auto mode probe Qdrant with retries, on the
+        event loop. Until then the async API falls back to search in a thread.
+        """
+        if self._aclient is None:
+            if self.vector_backend not in ("qdrant", "auto"):
+                return None
+            client = self._client
+            if client is None or isinstance(client, LocalIndexClient):
+                return None
+            try:
+                self._aclient = create_async_qdrant_client()
+            except Exception as e:
+                print(f"Warning: Could not create async Qdrant client: {e}")
+                return None
+        return self._aclient
+
     @property
     def encoder(self):
         """Lazy load embedding model on first access"""
         if self._encoder is None:
             try:
-                self._encoder = SentenceTransformer(self.embedding_model_name)
+                self._encoder = model_registry.get(self.embedding_model_name, self.embedding_device)
             except Exception as e:
                 print(f"Warning: Could not load embedding model: {e}")
                 return None
         return self._encoder
 
+    @property
+    def embedding_cache_model(self) -> str:
+        """Embedding cache namespace: the resolved model, dtype and backend of the query encoder"""
+        if self._embedding_cache_model is None:
+            self._embedding_cache_model = model_registry.resolve(
+                self.embedding_model_name, self.embedding_device
+            ).cache_id
+        return self._embedding_cache_model
+
+    @property
+    def ingest_encoder(self):
+        """
+        Encoder for the passages written to the collections
+
+        Pinned to ingest_backend() so bulk_insert and scripts/ingest_ebooks_md.py
+        store vectors from the same model; shares the query encoder when the
+        backends agree.
+        """
+        if self._ingest_encoder is None:
+            key = model_registry.resolve(self.embedding_model_name, self.embedding_device, backend=ingest_backend())
+            if key == model_registry.resolve(self.embedding_model_name, self.embedding_device):
+                return self.encoder
+            self._ingest_encoder = model_registry.get(*key)
+        return self._ingest_encoder
+
+    @property
+    def batcher(self):
+        """Lazy micro-batching executor for query embeddings"""
+        if self._batcher is None and EmbeddingBatcher is not None:
+            self._batcher = EmbeddingBatcher(self._encode_queries, name="rag-embedding-batcher")
+        return self._batcher
+
+    @property
+    def search_pool(self) -> ThreadPoolExecutor:
+        """Lazy thread pool used to query several collections concurrently"""
+        if self._search_pool is None:
+            self._search_pool = ThreadPoolExecutor(
+                max_workers=len(self.collections),
+                thread_name_prefix="rag-search"
+            )
+        return self._search_pool
+
+    def reset_connections(self):
+        """
+        Drop everything that owns threads, sockets or SQLite handles, so it is
+        recreated lazily (used in forked workers, see services.prefork)
+
+        The encoder and the memory-mapped indexes are kept: they are read-only
+        and shared with the parent.
+        """
+        self._client = None
+        self._aclient = None
+        self._search_pool = None
+        self._batcher = None
+        self._citation_index = None
+        self._chunk_store = None
+
+    @property
+    def profiles(self):
+        """Collection profiles (payload indexes, HNSW, optimizers) from collections.yml"""
+        if self._profiles is None:
+            self._profiles = load_collection_profiles()
+        return self._profiles
+
+    def lexical_index(self, collection_name: str):
+        """Lazy BM25 index for a collection (None when not built)"""
+        if collection_name not in self._lexical:
+            self._lexical[collection_name] = load_lexical_index(collection_name)
+        return self._lexical[collection_name]
+
+    @property
+    def citation_index(self):
+        """Lazy exact citation index (None when not built)"""
+        if self._citation_index is None:
+            self._citation_index = load_citation_index()
+        return self._citation_index
+
+    @property
+    def context_packer(self):
+        """Lazy token-budgeted context packer (tokenizer loads on first use)"""
+        if self._context_packer is None:
+            self._context_packer = ContextPacker()
+        return self._context_packer
+
+    @property
+    def chunk_store(self):
+        """Lazy external chunk text store (None when disabled or not built)"""
+        if self._chunk_store is None and self.chunk_store_enabled:
+            self._chunk_store = load_chunk_store()
+        return self._chunk_store
+
+    def _payload_selector(self):
+        """Payload requested from the index: everything but texto when the chunk store has it"""
+        if self.chunk_store is not None:
+            return PayloadSelectorExclude(exclude=["texto"])
+        return True
+
+    def _hydrate_texts(self, results: List[Dict]) -> List[Dict]:
+        """
+        Fill in texto for results fetched without it
+
+        Texts come from the chunk store in one query per collection; points
+        missing from the store (or every point, when the store is absent on
+        this host) are read back from the index.
+        """
+        missing: Dict[str, List[Dict]] = {}
+        for result in results:
+            if "texto" not in result and result.get("_collection"):
+                missing.setdefault(result["_collection"], []).append(result)
+        if not missing:
+            return results
+
+        for collection_name, docs in missing.items():
+            ids = [doc["_id"] for doc in docs]
+            texts = self.chunk_store.get_many(collection_name, ids) if self.chunk_store is not None else {}
+
+            absent = [point_id for point_id in ids if point_id not in texts]
+            if absent and self.client:
+                try:
+                    points = self.client.retrieve(collection_name=collection_name, ids=absent, with_payload=["texto"])
+                    texts.update({point.id: (point.payload or {}).get("texto", "") for point in points})
+                except Exception as e:
+                    print(f"Error fetching texts from {collection_name}: {e}")
+
+            for doc in docs:
+                doc["texto"] = texts.get(doc["_id"], "")
+
+        return results
+
+    @property
+    def area_classifier(self):
+        """Lazy nearest-centroid area classifier (None when not trained)"""
+        if self._area_classifier is None and self.area_classifier_enabled:
+            self._area_classifier = load_area_classifier()
+        return self._area_classifier
+
+    def infer_area(self, query_vector: List[float]) -> Optional[str]:
+        """Area predicted for a query with at least area_min_confidence, else None"""
+        classifier = self.area_classifier
+        if classifier is None:
+            return None
+        return classifier.confident_area(query_vector, self.area_min_confidence)
+
+    @property
+    def compressor(self):
+        """Lazy sentence compressor sharing the embedding model and the packer's token counter"""
+        if self._compressor is None:
+            self._compressor = SentenceCompressor(
+                self._encode_passages,
+                count_tokens=self.context_packer.counter.count
+            )
+        return self._compressor
+
     def _init_collections(self):
         """Initialize collections and hierarchy weights"""
         # Collection names
@@ -55,6 +334,15 @@ class RAGSystem:
             "doutrina": "doutrina"
         }
 
+        # Document type (as used by the API) -> collection name
+        self.tipo_to_collection = {
+            "lei": "legis",
+            "sumula": "sumulas",
+            "juris": "juris",
+            "regulatorio": "regulatorio",
+            "doutrina": "doutrina"
+        }
+
         # Hierarchy weights for ranking
         self.hierarchy_weights = {
             "lei": 1.0,
@@ -67,35 +355,101 @@ class RAGSystem:
         }
 
     def create_collections(self):
-        """Create all Qdrant collections if they don't exist"""
-        vector_size = 1024  # intfloat/multilingual-e5-large dimension
-
+        """
+        Create missing Qdrant collections from their profiles and make sure
+        every collection has the profile's payload indexes (idempotent)
+        """
         for collection_name in self.collections.values():
+            profile = self.profiles.get(collection_name)
             try:
                 self.client.get_collection(collection_name)
                 print(f"Collection {collection_name} already exists")
             except:
-                self.client.create_collection(
+                profile.create(self.client)
+                print(f"Created collection {collection_name}")
+
+            for field in profile.ensure_payload_indexes(self.client):
+                print(f"Created payload index {collection_name}.{field}")
+
+    def backfill_date_payloads(self, collection_name: str, batch_size: int = 256) -> int:
+        """
+        Add epoch-day fields to points ingested before they existed
+
+        Points of a scrolled page that share the same dates (most of a
+        document's chunks, every undated chunk) get one set_payload together.
+
+        Returns:
+            Number of points updated
+        """
+        updated = 0
+        offset = None
+
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=list(DATE_PAYLOAD_FIELDS.keys()),
+                with_vectors=False
+            )
+
+            groups: Dict[Tuple, List] = {}
+            for point in points:
+                days = epoch_days(point.payload or {})
+                groups.setdefault(tuple(days.values()), []).append(point.id)
+
+            for values, ids in groups.items():
+                self.client.set_payload(
                     collection_name=collection_name,
-                    vectors_config=VectorParams(
-                        size=vector_size,
-                        distance=Distance.COSINE
-                    )
+                    payload=dict(zip(DATE_PAYLOAD_FIELDS.values(), values)),
+                    points=ids
                 )
-                print(f"Created collection {collection_name}")
+                updated += len(ids)
+
+            if offset is None:
+                break
+
+        return updated
 
     def encode_text(self, text: str) -> List[float]:
-        """Encode text to vector using sentence transformer"""
+        """Encode query text to vector, reusing cached embeddings when possible"""
+        if embedding_cache is None:
+            return self._encode_queries([text])[0]
+        return embedding_cache.get_or_encode(
+            self.embedding_cache_model, "query: ", text, self.batcher.encode
+        )
+
+    async def aencode_text(self, text: str) -> List[float]:
+        """Async variant of encode_text that never blocks the event loop"""
+        # The cache's second tier is a blocking Redis round trip
+        vector = await asyncio.to_thread(embedding_cache.get, self.embedding_cache_model, "query: ", text)
+        if vector is None:
+            vector = await self.batcher.aencode(text)
+            await asyncio.to_thread(embedding_cache.set, self.embedding_cache_model, "query: ", text, vector)
+        return vector
+
+    def _encode_queries(self, texts: List[str]) -> List[List[float]]:
+        """Encode a batch of query texts using sentence transformer"""
         # Add query prefix for better retrieval (e5 model specific)
-        prefixed_text = f"query: {text}"
-        embedding = self.encoder.encode(prefixed_text, convert_to_numpy=True)
-        return embedding.tolist()
+        prefixed_texts = [f"query: {text}" for text in texts]
+        embeddings = self.encoder.encode(prefixed_texts, convert_to_numpy=True, normalize_embeddings=True)
+        return embeddings.tolist()
+
+    def _encode_passages(self, texts: List[str]) -> np.ndarray:
+        """Encode a batch of passages (normalized) in a single forward pass"""
+        prefixed_texts = [f"passage: {text}" for text in texts]
+        return self.encoder.encode(prefixed_texts, convert_to_numpy=True, normalize_embeddings=True)
+
+    def _encode_stored_passages(self, texts: List[str]) -> np.ndarray:
+        """Encode passages to be stored, on the ingest backend"""
+        prefixed_texts = [f"passage: {text}" for text in texts]
+        return self.ingest_encoder.encode(prefixed_texts, convert_to_numpy=True, normalize_embeddings=True)
 
     def encode_document(self, text: str) -> List[float]:
         """Encode document text to vector"""
         # Add passage prefix for better retrieval (e5 model specific)
         prefixed_text = f"passage: {text}"
-        embedding = self.encoder.encode(prefixed_text, convert_to_numpy=True)
+        embedding = self.ingest_encoder.encode(prefixed_text, convert_to_numpy=True)
         return embedding.tolist()
 
     def search(
@@ -107,7 +461,9 @@ class RAGSystem:
         tribunal: Optional[str] = None,
         data_inicio: Optional[str] = None,
         data_fim: Optional[str] = None,
-        limit: int = 10
+        vigente_em: Optional[str] = None,
+        limit: int = 10,
+        oversampling: Optional[float] = None
     ) -> List[Dict]:
         """
         Unified search across all collections with filters and ranking
@@ -118,146 +474,726 @@ class RAGSystem:
         3. Leading case recente
         4. Regulatório
         5. Doutrina
+
+        Date range (data_inicio/data_fim) and vigência (vigente_em) filters
+        are applied by Qdrant on indexed epoch-day payloads, so a filtered
+        search still returns a full page. Documents without a date are kept.
+
+        On quantized collections, oversampling overrides the profile's factor
+        of candidates fetched from the compressed index and rescored with the
+        original vectors.
+
+        Exact references in the query ("Súmula 385 do STJ", "art. 300 do
+        CPC") are resolved through the citation index first and returned
+        ahead of the ranked results, subject to the same filters; when they
+        fill the page, the query is not embedded at all.
+
+        Without an explicit area, a confident prediction of the query's area
+        (see services/area_classifier.py) restricts the search to documents
+        of that area or without one, and skips collections that hold neither.
         """
+        direct = self.lookup_citations(
+            query, tipo=tipo,
+            search_filter=self._build_filter(area, orgao, tribunal, data_inicio, data_fim, vigente_em)
+        )
+        if len(direct) >= limit:
+            return direct[:limit]
+
         query_vector = self.encode_text(query)
+        collections_to_search, search_filter = self._plan_search(
+            query_vector, tipo, area, orgao, tribunal, data_inicio, data_fim, vigente_em
+        )
+
+        # Search each collection concurrently
+        futures = [
+            self.search_pool.submit(
+                self._search_collection,
+                collection_name,
+                query_vector,
+                search_filter,
+                limit * 2,  # Get more results for ranking
+                oversampling,
+                query
+            )
+            for collection_name in collections_to_search
+        ]
+
         all_results = []
+        for future in futures:
+            all_results.extend(future.result())
+
+        return self._hydrate_texts(self._merge_direct(direct, all_results, limit))
+
+    async def asearch(
+        self,
+        query: str,
+        tipo: Optional[str] = None,
+        area: Optional[str] = None,
+        orgao: Optional[str] = None,
+        tribunal: Optional[str] = None,
+        data_inicio: Optional[str] = None,
+        data_fim: Optional[str] = None,
+        vigente_em: Optional[str] = None,
+        limit: int = 10,
+        oversampling: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        Async search(): the same pipeline, with the per-collection searches
+        sent concurrently over the shared async (gRPC) client
+
+        Local work that touches SQLite (citation lookup, chunk texts) runs in
+        a worker thread. Without an async client (local index backend) the
+        whole sync search() runs in a worker thread.
+        """
+        kwargs = dict(
+            tipo=tipo, area=area, orgao=orgao, tribunal=tribunal,
+            data_inicio=data_inicio, data_fim=data_fim, vigente_em=vigente_em
+        )
+        if self.aclient is None:
+            return await asyncio.to_thread(self.search, query, limit=limit, oversampling=oversampling, **kwargs)
+
+        direct = await asyncio.to_thread(
+            self.lookup_citations, query, tipo,
+            self._build_filter(area, orgao, tribunal, data_inicio, data_fim, vigente_em)
+        )
+        if len(direct) >= limit:
+            return direct[:limit]
+
+        query_vector = await self._aencode_query(query)
+        collections_to_search, search_filter = self._plan_search(query_vector, **kwargs)
+
+        batches = await asyncio.gather(*(
+            self._asearch_collection(collection_name, query_vector, search_filter, limit * 2, oversampling, query)
+            for collection_name in collections_to_search
+        ))
+        all_results = [result for batch in batches for result in batch]
+
+        return await asyncio.to_thread(self._hydrate_texts, self._merge_direct(direct, all_results, limit))
+
+    async def _aencode_query(self, query: str) -> List[float]:
+        if embedding_cache is None:
+            return await asyncio.to_thread(self.encode_text, query)
+        return await self.aencode_text(query)
+
+    def _plan_search(
+        self,
+        query_vector: List[float],
+        tipo: Optional[str] = None,
+        area: Optional[str] = None,
+        orgao: Optional[str] = None,
+        tribunal: Optional[str] = None,
+        data_inicio: Optional[str] = None,
+        data_fim: Optional[str] = None,
+        vigente_em: Optional[str] = None
+    ) -> Tuple[List[str], Optional[Filter]]:
+        """Collections to query and the payload filter for search()/asearch()"""
+        inferred_area = self.infer_area(query_vector) if not area else None
 
         # Determine which collections to search
-        collections_to_search = []
         if tipo:
-            if tipo == "lei":
-                collections_to_search = ["legis"]
-            elif tipo == "sumula":
-                collections_to_search = ["sumulas"]
-            elif tipo == "juris":
-                collections_to_search = ["juris"]
-            elif tipo == "regulatorio":
-                collections_to_search = ["regulatorio"]
-            elif tipo == "doutrina":
-                collections_to_search = ["doutrina"]
+            collection = self.tipo_to_collection.get(tipo)
+            collections_to_search = [collection] if collection else []
         else:
             # Search all collections
             collections_to_search = list(self.collections.values())
 
-        # Search each collection
-        for collection_name in collections_to_search:
-            try:
-                # Build filter
-                filter_conditions = []
+        if inferred_area:
+            # Skip collections with nothing labeled in (or unlabeled for) the area
+            collections_to_search = [
+                name for name in collections_to_search
+                if self.area_classifier.may_contain(name, inferred_area)
+            ]
 
-                if area:
-                    filter_conditions.append(
-                        FieldCondition(key="area", match=MatchValue(value=area))
-                    )
+        search_filter = self._build_filter(
+            area=area, orgao=orgao, tribunal=tribunal,
+            data_inicio=data_inicio, data_fim=data_fim, vigente_em=vigente_em,
+            inferred_area=inferred_area
+        )
+        return collections_to_search, search_filter
 
-                if orgao:
-                    filter_conditions.append(
-                        FieldCondition(key="orgao", match=MatchValue(value=orgao))
-                    )
+    def _merge_direct(self, direct: List[Dict], all_results: List[Dict], limit: int) -> List[Dict]:
+        """Rank results and return top N, after the direct citation hits"""
+        ranked = self._rank_results(all_results, top_k=limit)
+        seen = {(r["_collection"], r["_id"]) for r in direct}
+        ranked = [r for r in ranked if (r.get("_collection"), r.get("_id")) not in seen]
+        return (direct + ranked)[:limit]
 
-                if tribunal:
-                    filter_conditions.append(
-                        FieldCondition(key="tribunal", match=MatchValue(value=tribunal))
-                    )
+    def lookup_citations(
+        self,
+        text: str,
+        tipo: Optional[str] = None,
+        search_filter: Optional[Filter] = None
+    ) -> List[Dict]:
+        """
+        Fetch the documents for exact references found in text, without embedding
 
-                # Build filter object
-                search_filter = None
-                if filter_conditions:
-                    search_filter = Filter(must=filter_conditions)
+        With a search_filter, referenced points that do not match it are left out.
 
-                # Search
-                search_results = self.client.search(
-                    collection_name=collection_name,
-                    query_vector=query_vector,
-                    limit=limit * 2,  # Get more results for ranking
-                    query_filter=search_filter
-                )
+        Returns:
+            Payload dicts (with _citation_key) in the order the references appear
+        """
+        index = self.citation_index
+        if index is None or not self.client:
+            return []
+
+        resolved = index.lookup_text(text)
+        if not resolved:
+            return []
 
-                # Convert to dict and add to results
-                for result in search_results:
-                    payload = result.payload
-                    payload["_score"] = result.score
-                    payload["_collection"] = collection_name
-                    all_results.append(payload)
+        wanted_collection = self.tipo_to_collection.get(tipo) if tipo else None
+        ids_by_collection: Dict[str, List] = {}
+        for targets in resolved.values():
+            for collection_name, point_id in targets:
+                if wanted_collection and collection_name != wanted_collection:
+                    continue
+                ids_by_collection.setdefault(collection_name, [])
+                if point_id not in ids_by_collection[collection_name]:
+                    ids_by_collection[collection_name].append(point_id)
 
+        payloads = {}
+        for collection_name, ids in ids_by_collection.items():
+            try:
+                if search_filter is None:
+                    points = self.client.retrieve(
+                        collection_name=collection_name, ids=ids, with_payload=self._payload_selector()
+                    )
+                else:
+                    points, _ = self.client.scroll(
+                        collection_name=collection_name,
+                        scroll_filter=Filter(must=[HasIdCondition(has_id=ids), search_filter]),
+                        limit=len(ids),
+                        with_payload=self._payload_selector(),
+                        with_vectors=False
+                    )
             except Exception as e:
-                print(f"Error searching {collection_name}: {e}")
+                print(f"Error retrieving citations from {collection_name}: {e}")
                 continue
+            for point in points:
+                payloads[(collection_name, point.id)] = point.payload
 
-        # Rank results
-        ranked_results = self._rank_results(all_results, data_inicio, data_fim)
+        results = []
+        for key, targets in resolved.items():
+            for collection_name, point_id in targets:
+                payload = payloads.pop((collection_name, point_id), None)
+                if payload is None:
+                    continue
+                payload["_score"] = 1.0
+                payload["_final_score"] = 1.0
+                payload["_collection"] = collection_name
+                payload["_id"] = point_id
+                payload["_citation_key"] = key
+                results.append(payload)
 
-        # Return top N
-        return ranked_results[:limit]
+        return self._hydrate_texts(results)
 
-    def _rank_results(
+    def search_multi(
         self,
-        results: List[Dict],
+        query: str,
+        limits: Dict[str, int],
+        area: Optional[str] = None,
+        orgao: Optional[str] = None,
+        tribunal: Optional[str] = None,
         data_inicio: Optional[str] = None,
-        data_fim: Optional[str] = None
+        data_fim: Optional[str] = None,
+        vigente_em: Optional[str] = None,
+        oversampling: Optional[float] = None,
+        diversify: bool = False
+    ) -> Dict[str, List[Dict]]:
+        """
+        Search several document types with a single query embedding
+
+        The query is encoded once and every per-type search is sent to Qdrant
+        at the same time, so the caller pays for one forward pass and one
+        network wait instead of one of each per type.
+
+        Args:
+            query: Query text
+            limits: Mapping of tipo (lei, sumula, juris, regulatorio, doutrina)
+                to the number of results wanted for that type
+            diversify: Merge contiguous chunks of the same source and pick
+                results by MMR over the stored vectors, so each slot carries
+                distinct evidence
+
+        Area inference and collection pruning work as in search().
+
+        Returns:
+            Dict mapping each requested tipo to its ranked results
+        """
+        query_vector = self.encode_text(query)
+        jobs, search_filter, results_by_tipo = self._plan_multi(
+            query_vector, limits, area, orgao, tribunal, data_inicio, data_fim, vigente_em
+        )
+
+        futures = {
+            tipo: self.search_pool.submit(
+                self._search_collection,
+                collection_name,
+                query_vector,
+                search_filter,
+                self._candidates_for(limits[tipo], diversify),
+                oversampling,
+                query,
+                diversify  # MMR needs the stored vectors
+            )
+            for tipo, collection_name in jobs.items()
+        }
+
+        for tipo, future in futures.items():
+            results_by_tipo[tipo] = self._finish_tipo(future.result(), limits[tipo], diversify)
+
+        return results_by_tipo
+
+    async def asearch_multi(
+        self,
+        query: str,
+        limits: Dict[str, int],
+        area: Optional[str] = None,
+        orgao: Optional[str] = None,
+        tribunal: Optional[str] = None,
+        data_inicio: Optional[str] = None,
+        data_fim: Optional[str] = None,
+        vigente_em: Optional[str] = None,
+        oversampling: Optional[float] = None,
+        diversify: bool = False
+    ) -> Dict[str, List[Dict]]:
+        """Async search_multi(), over the shared async client (see asearch)"""
+        if self.aclient is None:
+            return await asyncio.to_thread(
+                self.search_multi, query, limits, area, orgao, tribunal,
+                data_inicio, data_fim, vigente_em, oversampling, diversify
+            )
+
+        query_vector = await self._aencode_query(query)
+        jobs, search_filter, results_by_tipo = self._plan_multi(
+            query_vector, limits, area, orgao, tribunal, data_inicio, data_fim, vigente_em
+        )
+
+        batches = await asyncio.gather(*(
+            self._asearch_collection(
+                collection_name, query_vector, search_filter,
+                self._candidates_for(limits[tipo], diversify), oversampling, query, diversify
+            )
+            for tipo, collection_name in jobs.items()
+        ))
+
+        for tipo, batch in zip(jobs, batches):
+            results_by_tipo[tipo] = await asyncio.to_thread(self._finish_tipo, batch, limits[tipo], diversify)
+
+        return results_by_tipo
+
+    def _plan_multi(
+        self,
+        query_vector: List[float],
+        limits: Dict[str, int],
+        area: Optional[str] = None,
+        orgao: Optional[str] = None,
+        tribunal: Optional[str] = None,
+        data_inicio: Optional[str] = None,
+        data_fim: Optional[str] = None,
+        vigente_em: Optional[str] = None
+    ) -> Tuple[Dict[str, str], Optional[Filter], Dict[str, List[Dict]]]:
+        """Collection per tipo to query, the shared filter, and tipos already known to be empty"""
+        inferred_area = self.infer_area(query_vector) if not area else None
+        search_filter = self._build_filter(
+            area=area, orgao=orgao, tribunal=tribunal,
+            data_inicio=data_inicio, data_fim=data_fim, vigente_em=vigente_em,
+            inferred_area=inferred_area
+        )
+
+        jobs = {}
+        empty = {}
+        for tipo in limits:
+            collection_name = self.tipo_to_collection.get(tipo)
+            if not collection_name:
+                continue
+            if inferred_area and not self.area_classifier.may_contain(collection_name, inferred_area):
+                empty[tipo] = []
+                continue
+            jobs[tipo] = collection_name
+        return jobs, search_filter, empty
+
+    def _candidates_for(self, limit: int, diversify: bool) -> int:
+        """Candidates fetched per slot: a wider pool for MMR, twice the limit for ranking"""
+        return limit * self.diversity_pool if diversify else limit * 2
+
+    def _finish_tipo(self, results: List[Dict], limit: int, diversify: bool) -> List[Dict]:
+        if diversify:
+            # Merging contiguous chunks needs their texts
+            ranked = self._hydrate_texts(self._rank_results(results))
+            return diversify_results(ranked, limit, self.mmr_lambda)
+        return self._hydrate_texts(self._rank_results(results, top_k=limit))
+
+    def _build_filter(
+        self,
+        area: Optional[str] = None,
+        orgao: Optional[str] = None,
+        tribunal: Optional[str] = None,
+        data_inicio: Optional[str] = None,
+        data_fim: Optional[str] = None,
+        vigente_em: Optional[str] = None,
+        inferred_area: Optional[str] = None
+    ) -> Optional[Filter]:
+        """Build Qdrant payload filter from optional keyword and date filters"""
+        filter_conditions = []
+
+        if area:
+            filter_conditions.append(
+                FieldCondition(key="area", match=MatchValue(value=area))
+            )
+        elif inferred_area:
+            # A predicted area also keeps documents that have no area label
+            filter_conditions.append(Filter(should=[
+                FieldCondition(key="area", match=MatchValue(value=inferred_area)),
+                IsEmptyCondition(is_empty=PayloadField(key="area"))
+            ]))
+
+        if orgao:
+            filter_conditions.append(
+                FieldCondition(key="orgao", match=MatchValue(value=orgao))
+            )
+
+        if tribunal:
+            filter_conditions.append(
+                FieldCondition(key="tribunal", match=MatchValue(value=tribunal))
+            )
+
+        # Publication date within [data_inicio, data_fim]
+        inicio, fim = to_epoch_day(data_inicio), to_epoch_day(data_fim)
+        if inicio is not None or fim is not None:
+            filter_conditions.append(
+                self._range_or_empty(DATE_PAYLOAD_FIELDS["data"], Range(gte=inicio, lte=fim))
+            )
+
+        # In force on a given day: started on/before it and not ended before it
+        vigente = to_epoch_day(vigente_em)
+        if vigente is not None:
+            filter_conditions.append(
+                self._range_or_empty(DATE_PAYLOAD_FIELDS["vigencia_inicio"], Range(lte=vigente))
+            )
+            filter_conditions.append(
+                self._range_or_empty(DATE_PAYLOAD_FIELDS["vigencia_fim"], Range(gte=vigente))
+            )
+
+        if not filter_conditions:
+            return None
+
+        return Filter(must=filter_conditions)
+
+    @staticmethod
+    def _range_or_empty(key: str, range_: Range) -> Filter:
+        """Match a numeric range, keeping points that have no value for the field"""
+        return Filter(should=[
+            FieldCondition(key=key, range=range_),
+            IsEmptyCondition(is_empty=PayloadField(key=key))
+        ])
+
+    def _search_collection(
+        self,
+        collection_name: str,
+        query_vector: List[float],
+        search_filter: Optional[Filter],
+        limit: int,
+        oversampling: Optional[float] = None,
+        query_text: Optional[str] = None,
+        with_vectors: bool = False
+    ) -> List[Dict]:
+        """
+        Search a single collection and return payload dicts with score metadata
+
+        When the chunk store is available, texto is left out of the payloads
+        (see _hydrate_texts), so the ranker only moves metadata around.
+
+        When the collection has a BM25 index and query_text is given, lexical
+        hits are fused with the vector hits by reciprocal rank, so exact
+        citations ("art. 300", "Súmula 385") surface even if the embedding
+        ranks them low. _score is then the fused score scaled to [0, 1].
+        With with_vectors, each payload carries its stored vector as _vector.
+
+        On Matryoshka collections (see CollectionProfile.matryoshka) the HNSW
+        search runs on the short vector for limit * oversampling ids only,
+        and a second exact search over those ids with the full vector gives
+        the final order and payloads.
+        """
+        try:
+            search_results = self.client.search(
+                **self._search_request(collection_name, query_vector, search_filter, limit, oversampling, with_vectors)
+            )
+            rescore = self._rescore_request(collection_name, query_vector, search_results, limit, with_vectors)
+            if rescore:
+                search_results = self.client.search(**rescore)
+        except Exception as e:
+            print(f"Error searching {collection_name}: {e}")
+            return []
+
+        results = self._points_to_results(collection_name, search_results, with_vectors)
+        # Vector order before lexical-only hits are merged into results
+        vector_ranking = list(results)
+
+        index = self.lexical_index(collection_name) if (self.hybrid_enabled and query_text) else None
+        if index is None:
+            return list(results.values())
+
+        try:
+            lexical_hits = index.search(query_text, limit=limit)
+            request = self._lexical_payload_request(collection_name, lexical_hits, results, search_filter, with_vectors)
+            if request:
+                points, _ = self.client.scroll(**request)
+                results.update(self._points_to_results(collection_name, points, with_vectors, scored=False))
+        except Exception as e:
+            print(f"Error in lexical search {collection_name}: {e}")
+            return list(results.values())
+
+        return self._fuse_lexical(results, vector_ranking, lexical_hits, limit)
+
+    async def _asearch_collection(
+        self,
+        collection_name: str,
+        query_vector: List[float],
+        search_filter: Optional[Filter],
+        limit: int,
+        oversampling: Optional[float] = None,
+        query_text: Optional[str] = None,
+        with_vectors: bool = False
+    ) -> List[Dict]:
+        """Async variant of _search_collection over the async Qdrant client"""
+        try:
+            search_results = await self.aclient.search(
+                **self._search_request(collection_name, query_vector, search_filter, limit, oversampling, with_vectors)
+            )
+            rescore = self._rescore_request(collection_name, query_vector, search_results, limit, with_vectors)
+            if rescore:
+                search_results = await self.aclient.search(**rescore)
+        except Exception as e:
+            print(f"Error searching {collection_name}: {e!r}")
+            return []
+
+        results = self._points_to_results(collection_name, search_results, with_vectors)
+        # Vector order before lexical-only hits are merged into results
+        vector_ranking = list(results)
+
+        index = self.lexical_index(collection_name) if (self.hybrid_enabled and query_text) else None
+        if index is None:
+            return list(results.values())
+
+        try:
+            lexical_hits = index.search(query_text, limit=limit)
+            request = self._lexical_payload_request(collection_name, lexical_hits, results, search_filter, with_vectors)
+            if request:
+                points, _ = await self.aclient.scroll(**request)
+                results.update(self._points_to_results(collection_name, points, with_vectors, scored=False))
+        except Exception as e:
+            print(f"Error in lexical search {collection_name}: {e!r}")
+            return list(results.values())
+
+        return self._fuse_lexical(results, vector_ranking, lexical_hits, limit)
+
+    def _short_vectors(self, collection_name: str) -> bool:
+        """Whether the collection is searched through its Matryoshka short vector"""
+        return self.profiles.get(collection_name).matryoshka and not isinstance(self.client, LocalIndexClient)
+
+    def _vector_selector(self, collection_name: str, with_vectors: bool):
+        """with_vectors argument: on named-vector collections only the short vector is needed (MMR)"""
+        if with_vectors and self._short_vectors(collection_name):
+            return [SHORT_VECTOR]
+        return with_vectors
+
+    def _search_request(
+        self,
+        collection_name: str,
+        query_vector: List[float],
+        search_filter: Optional[Filter],
+        limit: int,
+        oversampling: Optional[float],
+        with_vectors: bool
+    ) -> Dict:
+        """Arguments of a vector search, shared by the sync and async clients"""
+        profile = self.profiles.get(collection_name)
+        if self._short_vectors(collection_name):
+            # Candidate ids only; payloads come with the rescoring search
+            return dict(
+                collection_name=collection_name,
+                query_vector=profile.query_vector(query_vector),
+                limit=profile.candidate_limit(limit),
+                query_filter=search_filter,
+                search_params=profile.search_params(oversampling),
+                with_payload=False,
+                with_vectors=False
+            )
+
+        return dict(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            limit=limit,
+            query_filter=search_filter,
+            search_params=profile.search_params(oversampling),
+            with_payload=self._payload_selector(),
+            with_vectors=with_vectors
+        )
+
+    def _rescore_request(
+        self,
+        collection_name: str,
+        query_vector: List[float],
+        candidates,
+        limit: int,
+        with_vectors: bool
+    ) -> Optional[Dict]:
+        """Exact full-vector search restricted to the short-vector candidates (None if not Matryoshka)"""
+        if not candidates or not self._short_vectors(collection_name):
+            return None
+        return dict(
+            collection_name=collection_name,
+            query_vector=(FULL_VECTOR, query_vector),
+            limit=limit,
+            query_filter=Filter(must=[HasIdCondition(has_id=[point.id for point in candidates])]),
+            search_params=SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True)),
+            with_payload=self._payload_selector(),
+            with_vectors=self._vector_selector(collection_name, with_vectors)
+        )
+
+    @staticmethod
+    def _points_to_results(collection_name: str, points, with_vectors: bool = False, scored: bool = True) -> Dict:
+        """Payload dicts keyed by point id; unscored points (scroll) get a 0 score"""
+        results = {}
+        for point in points:
+            payload = point.payload
+            payload["_score"] = point.score if scored else 0.0
+            payload["_collection"] = collection_name
+            payload["_id"] = point.id
+            if with_vectors:
+                vector = point.vector
+                payload["_vector"] = vector.get(SHORT_VECTOR) if isinstance(vector, dict) else vector
+            results[point.id] = payload
+        return results
+
+    def _lexical_payload_request(
+        self,
+        collection_name: str,
+        lexical_hits: List[Tuple],
+        results: Dict,
+        search_filter: Optional[Filter],
+        with_vectors: bool = False
+    ) -> Optional[Dict]:
+        """Scroll arguments loading lexical-only hits with the same payload filter (None if none)"""
+        missing = [point_id for point_id, _ in lexical_hits if point_id not in results]
+        if not missing:
+            return None
+
+        conditions = [HasIdCondition(has_id=missing)]
+        if search_filter is not None:
+            conditions.append(search_filter)
+
+        return dict(
+            collection_name=collection_name,
+            scroll_filter=Filter(must=conditions),
+            limit=len(missing),
+            with_payload=self._payload_selector(),
+            with_vectors=self._vector_selector(collection_name, with_vectors)
+        )
+
+    def _fuse_lexical(
+        self,
+        results: Dict,
+        vector_ranking: List,
+        lexical_hits: List[Tuple],
+        limit: int
     ) -> List[Dict]:
+        """
+        Reciprocal rank fusion of the vector order with the BM25 order
+
+        vector_ranking holds only the ids the vector search returned, so
+        lexical-only hits get their BM25 term alone.
+        """
+        # Lexical hits dropped by the payload filter are not in results
+        if not results:
+            return []
+
+        lexical_ranking = [point_id for point_id, _ in lexical_hits if point_id in results]
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=self.rrf_k)
+        top = max(fused.values())
+
+        for point_id, payload in results.items():
+            payload["_vector_score"] = payload.get("_score", 0.0)
+            payload["_score"] = fused[point_id] / top
+
+        for point_id, score in lexical_hits:
+            if point_id in results:
+                results[point_id]["_lexical_score"] = score
+
+        ranked = sorted(results.values(), key=lambda r: r["_score"], reverse=True)
+        return ranked[:limit]
+
+    def _rank_results(self, results: List[Dict], top_k: Optional[int] = None) -> List[Dict]:
         """
         Rank results by:
         1. Hierarchy (lei > súmula > precedente > regulatório > doutrina)
         2. Vigência (vigente > não vigente)
         3. Date (more recent > older)
         4. Similarity score
+
+        Scores are computed column-wise over all candidates at once; with
+        top_k only the best k are partially sorted (argpartition).
         """
-        scored_results = []
+        if not results or (top_k is not None and top_k <= 0):
+            return []
 
-        for result in results:
-            score = 0.0
+        today = (date.today() - EPOCH).days
+        weights = self.rank_weights
 
-            # Base similarity score (0-1)
-            similarity_score = result.get("_score", 0.0)
-            score += similarity_score * 0.3
+        similarity = np.fromiter((r.get("_score", 0.0) for r in results), dtype=np.float64, count=len(results))
+        hierarchy = np.fromiter(
+            (self.hierarchy_weights.get(r.get("tipo", ""), 0.5) for r in results),
+            dtype=np.float64, count=len(results)
+        )
+        # Still in force when there is no end of vigência
+        vigente = np.fromiter((r.get("vigencia_fim") is None for r in results), dtype=bool, count=len(results))
+        # Epoch-day payloads from ingestion; older points fall back to parsing "data"
+        days = np.fromiter(
+            (self._epoch_day_of(r) for r in results),
+            dtype=np.float64, count=len(results)
+        )
 
-            # Hierarchy weight (0-1)
-            tipo = result.get("tipo", "")
-            hierarchy_score = self.hierarchy_weights.get(tipo, 0.5)
-            score += hierarchy_score * 0.4
+        years_ago = (today - days) / 365
+        recency = np.nan_to_num(np.maximum(0, 1 - years_ago / self.recency_horizon_years), nan=0.0)
 
-            # Vigência bonus
-            vigencia_fim = result.get("vigencia_fim")
-            if vigencia_fim is None:  # Still active
-                score += 0.2
+        scores = (
+            similarity * weights["similarity"]
+            + hierarchy * weights["hierarchy"]
+            + vigente * weights["vigencia"]
+            + recency * weights["recency"]
+        )
 
-            # Recency bonus (newer is better for jurisprudence)
-            data_str = result.get("data")
-            if data_str:
-                try:
-                    data = datetime.fromisoformat(data_str)
-                    years_ago = (datetime.now() - data).days / 365
-                    recency_score = max(0, 1 - (years_ago / 10))  # Decay over 10 years
-                    score += recency_score * 0.1
-                except:
-                    pass
-
-            # Date range filter
-            if data_inicio or data_fim:
-                data_str = result.get("data")
-                if data_str:
-                    try:
-                        data = datetime.fromisoformat(data_str)
-                        if data_inicio and data < datetime.fromisoformat(data_inicio):
-                            continue
-                        if data_fim and data > datetime.fromisoformat(data_fim):
-                            continue
-                    except:
-                        pass
-
-            result["_final_score"] = score
-            scored_results.append(result)
-
-        # Sort by final score
-        scored_results.sort(key=lambda x: x["_final_score"], reverse=True)
-
-        return scored_results
+        if top_k is not None and top_k < len(results):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(results))
+        # Best first; ties keep retrieval order
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        ranked = []
+        for i in order:
+            result = results[i]
+            result["_final_score"] = float(scores[i])
+            ranked.append(result)
+
+        return ranked
+
+    @staticmethod
+    def _epoch_day_of(result: Dict) -> float:
+        day = result.get(DATE_PAYLOAD_FIELDS["data"])
+        if day is None:
+            day = to_epoch_day(result.get("data"))
+        return np.nan if day is None else day
 
     def search_by_article(self, artigo: str, lei: str, area: Optional[str] = None) -> List[Dict]:
         """Search for specific article of law (e.g., Art. 300 CPC)"""
         query = f"{artigo} {lei}"
 
+        # Exact lookup first; vector search only for articles not in the index
+        direct = self.lookup_citations(query, tipo="lei")
+        if direct:
+            return direct
+
         results = self.search(
             query=query,
             tipo="lei",
@@ -273,49 +1209,57 @@ class RAGSystem:
 
         return exact_matches if exact_matches else results[:1]
 
-    def get_context_for_case(self, descricao: str, area: Optional[str] = None, limit_per_type: int = 3) -> str:
+    def get_context_for_case(
+        self,
+        descricao: str,
+        area: Optional[str] = None,
+        limit_per_type: int = 3,
+        token_budget: Optional[int] = None
+    ) -> str:
         """
         Get comprehensive context for a case by searching multiple types
         Returns formatted context string
+
+        Evidence is packed into token_budget tokens (CONTEXT_TOKEN_BUDGET by
+        default), counted with the target model's tokenizer; higher-ranked
+        sources get a larger share and texts are cut at sentence boundaries.
+        Long chunks are first reduced to the sentences closest to the
+        description (CONTEXT_COMPRESSION_ENABLED); cited references are kept
+        verbatim.
         """
-        context_parts = []
-
-        # 1. Search laws
-        leis = self.search(query=descricao, tipo="lei", area=area, limit=limit_per_type)
-        if leis:
-            context_parts.append("=== LEGISLAÇÃO APLICÁVEL ===")
-            for lei in leis:
-                context_parts.append(f"- {lei.get('titulo', '')}: {lei.get('texto', '')[:300]}...")
-
-        # 2. Search súmulas and repetitivos
-        sumulas = self.search(query=descricao, tipo="sumula", area=area, limit=limit_per_type)
-        if sumulas:
-            context_parts.append("\n=== SÚMULAS E TESES ===")
-            for sumula in sumulas:
-                context_parts.append(f"- {sumula.get('titulo', '')}: {sumula.get('texto', '')[:300]}...")
-
-        # 3. Search jurisprudence
-        juris = self.search(query=descricao, tipo="juris", area=area, limit=limit_per_type)
-        if juris:
-            context_parts.append("\n=== JURISPRUDÊNCIA ===")
-            for j in juris:
-                context_parts.append(f"- {j.get('titulo', '')} ({j.get('tribunal', '')}): {j.get('texto', '')[:300]}...")
-
-        # 4. Search regulatório
-        regulatorio = self.search(query=descricao, tipo="regulatorio", area=area, limit=limit_per_type)
-        if regulatorio:
-            context_parts.append("\n=== NORMAS REGULATÓRIAS ===")
-            for reg in regulatorio:
-                context_parts.append(f"- {reg.get('titulo', '')}: {reg.get('texto', '')[:300]}...")
-
-        # 5. Search doutrina
-        doutrina = self.search(query=descricao, tipo="doutrina", area=area, limit=2)
-        if doutrina:
-            context_parts.append("\n=== DOUTRINA ===")
-            for doc in doutrina:
-                context_parts.append(f"- {doc.get('titulo', '')}: {doc.get('texto', '')[:200]}...")
-
-        return "\n".join(context_parts)
+        # References named explicitly in the description (exact lookup)
+        citadas = self.lookup_citations(descricao)
+
+        # Encode once and query all types at the same time
+        results = self.search_multi(
+            query=descricao,
+            limits={
+                "lei": limit_per_type,
+                "sumula": limit_per_type,
+                "juris": limit_per_type,
+                "regulatorio": limit_per_type,
+                "doutrina": 2
+            },
+            area=area,
+            diversify=True
+        )
+
+        # Don't repeat documents already listed as cited references
+        cited = {(doc["_collection"], doc["_id"]) for doc in citadas}
+        if cited:
+            results = {
+                tipo: [r for r in docs if (r.get("_collection"), r.get("_id")) not in cited]
+                for tipo, docs in results.items()
+            }
+
+        if self.compression_enabled:
+            # Cache hit: search_multi already embedded the description
+            results = self.compressor.compress(self.encode_text(descricao), results)
+
+        packer = self.context_packer
+        if token_budget:
+            packer = ContextPacker(budget=token_budget, counter=packer.counter)
+        return packer.pack({"citada": citadas, **results})
 
     def insert_document(self, collection: str, doc_id: str, document: Dict, text: str):
         """Insert a single document into collection"""
@@ -323,8 +1267,8 @@ class RAGSystem:
 
         point = PointStruct(
             id=doc_id,
-            vector=vector,
-            payload=document
+            vector=self._point_vector(collection, vector),
+            payload=self._store_texts(collection, [(doc_id, with_epoch_days(document))])[0]
         )
 
         self.client.upsert(
@@ -332,31 +1276,85 @@ class RAGSystem:
             points=[point]
         )
 
-    def bulk_insert(self, collection: str, documents: List[Tuple[str, Dict, str]]):
+    def _point_vector(self, collection: str, vector: List[float]):
+        """Vector(s) stored for an embedding: named short + full on Matryoshka collections"""
+        if self._short_vectors(collection):
+            return self.profiles.get(collection).point_vector(vector)
+        return vector
+
+    def _store_texts(self, collection: str, items: List[Tuple[str, Dict]]) -> List[Dict]:
+        """Move texto of (id, payload) pairs to the chunk store; returns the lean payloads"""
+        if not self.chunk_store_enabled:
+            return [payload for _, payload in items]
+
+        store = self.chunk_store or ChunkStore()
+        store.put_many(collection, ((doc_id, payload["texto"]) for doc_id, payload in items if "texto" in payload))
+        self._chunk_store = store
+        return [{k: v for k, v in payload.items() if k != "texto"} for _, payload in items]
+
+    def bulk_insert(
+        self,
+        collection: str,
+        documents: Iterable[Tuple[str, Dict, str]],
+        batch_size: Optional[int] = None
+    ) -> Dict:
         """
-        Bulk insert documents
-        documents: List of (id, payload, text) tuples
+        Bulk insert documents, streaming (see services.ingest_pipeline)
+        documents: Iterable of (id, payload, text) tuples
+
+        Returns:
+            Pipeline stats (chunks, batches, chunks_per_s, ...)
         """
-        points = []
+        pipeline = IngestPipeline(
+            encode_passages=self._encode_stored_passages,
+            to_vector=lambda vector: self._point_vector(collection, vector.tolist()),
+            upsert=lambda points: self.client.upsert(collection_name=collection, points=points, wait=False),
+            # Returns once every batch is applied, so readers right after see the whole run
+            final_upsert=lambda points: self.client.upsert(collection_name=collection, points=points, wait=True),
+            prepare=lambda items: self._store_texts(
+                collection, [(doc_id, with_epoch_days(payload)) for doc_id, payload in items]
+            ),
+            batch_size=batch_size
+        )
+        stats = pipeline.run(documents)
+        print(
+            f"Inserted {stats['chunks']} documents in {stats['batches']} batches "
+            f"({stats['chunks_per_s']} chunks/s)"
+        )
+        return stats
 
-        for doc_id, payload, text in documents:
-            vector = self.encode_document(text)
-            point = PointStruct(
-                id=doc_id,
-                vector=vector,
-                payload=payload
-            )
-            points.append(point)
-
-        # Insert in batches of 100
-        batch_size = 100
-        for i in range(0, len(points), batch_size):
-            batch = points[i:i + batch_size]
-            self.client.upsert(
-                collection_name=collection,
-                points=batch
-            )
-            print(f"Inserted batch {i // batch_size + 1} ({len(batch)} documents)")
+    def build_lexical_index(self, collection: str) -> int:
+        """
+        Rebuild the collection's BM25 index from every point stored in it
+
+        The index is written from scratch, so it is built from the whole
+        collection rather than from the last bulk_insert batch.
+
+        Returns:
+            Number of indexed chunks
+        """
+        docs = build_lexical_index_from_qdrant(self.client, collection, chunk_store=self.chunk_store)
+        self._lexical.pop(collection, None)
+        return docs
+
+    def build_area_classifier(self) -> int:
+        """Train the area centroids from every collection; returns the number of areas"""
+        areas = build_area_classifier_from_qdrant(self.client, self.collections.values())
+        self._area_classifier = None
+        return areas
+
+    def build_citation_index(self, collection: str, documents: List[Tuple[str, Dict, str]]) -> int:
+        """
+        Register the citation keys of ingested documents (see services.citation_index)
+        documents: List of (id, payload, text) tuples
+
+        Returns:
+            Number of keys added
+        """
+        index = self.citation_index or CitationIndex()
+        added = index.add_payloads(collection, ((doc_id, payload) for doc_id, payload, _ in documents))
+        self._citation_index = index
+        return added
 
 
 # Singleton instance
@@ -368,3 +1366,11 @@ def get_rag_system() -> RAGSystem:
     if _rag_system is None:
         _rag_system = RAGSystem()
     return _rag_system
+
+
+def _reset_after_fork():
+    if _rag_system is not None:
+        _rag_system.reset_connections()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -52,7 +52,9 @@ class SearchRequest(BaseModel):
     tribunal: Optional[str] = None
     data_inicio: Optional[str] = None
     data_fim: Optional[str] = None
+    vigente_em: Optional[str] = None
     limit: int = Field(default=10, ge=1, le=50)
+    oversampling: Optional[float] = Field(default=None, ge=1.0, le=10.0)
 
 
 class Citation(BaseModel):
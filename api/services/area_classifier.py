@@ -0,0 +1,172 @@
+"""
+Query area classifier for Doutora IA
+Nearest-centroid model over e5 embeddings, trained from the labeled corpus
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .collection_profile import full_vector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLASSIFIER_PATH = Path(__file__).resolve().parents[2] / "data" / "area_centroids.npz"
+
+# Bucket for points without an area label
+UNLABELED = ""
+
+
+class AreaClassifierBuilder:
+    """Accumulate per-area vector sums and per-collection counts"""
+
+    def __init__(self):
+        self.sums: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def add(self, collection: str, area: Optional[str], vector: Iterable[float]):
+        area = area or UNLABELED
+        per_collection = self.counts.setdefault(area, {})
+        per_collection[collection] = per_collection.get(collection, 0) + 1
+        if area == UNLABELED:
+            return
+
+        vector = np.asarray(vector, dtype=np.float32)
+        if area in self.sums:
+            self.sums[area] += vector
+        else:
+            self.sums[area] = vector.copy()
+
+    def write(self, path: Path) -> int:
+        """Save normalized centroids and counts; returns the number of areas"""
+        areas = sorted(self.sums)
+        if areas:
+            centroids = np.stack([self.sums[area] for area in areas])
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        else:
+            centroids = np.zeros((0, 0), dtype=np.float32)
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            centroids=centroids.astype(np.float32),
+            areas=np.array(json.dumps(areas)),
+            counts=np.array(json.dumps(self.counts))
+        )
+        return len(areas)
+
+
+class AreaClassifier:
+    """
+    Predict the legal area of a query from its embedding
+
+    Each area is represented by the normalized mean of its documents'
+    vectors. Cosine similarities to the centroids go through a softmax
+    (AREA_CLASSIFIER_TEMPERATURE) to give a confidence. Prediction is one
+    small matrix-vector product, well under a millisecond.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        areas: List[str],
+        counts: Dict[str, Dict[str, int]],
+        temperature: Optional[float] = None
+    ):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.areas = list(areas)
+        self.counts = counts
+        self.temperature = temperature or float(os.getenv("AREA_CLASSIFIER_TEMPERATURE", "0.01"))
+
+        # Metrics
+        self.predictions = 0
+        self.confident = 0
+
+    @classmethod
+    def load(cls, path: Path) -> "AreaClassifier":
+        data = np.load(path)
+        return cls(
+            data["centroids"],
+            json.loads(str(data["areas"])),
+            json.loads(str(data["counts"]))
+        )
+
+    def predict(self, query_vector: List[float]) -> Tuple[Optional[str], float]:
+        """Most likely area and its confidence (softmax probability)"""
+        if not self.areas:
+            return None, 0.0
+
+        similarities = self.centroids @ np.asarray(query_vector, dtype=np.float32)
+        logits = (similarities - similarities.max()) / self.temperature
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum()
+
+        best = int(np.argmax(probabilities))
+        self.predictions += 1
+        return self.areas[best], float(probabilities[best])
+
+    def confident_area(self, query_vector: List[float], min_confidence: float) -> Optional[str]:
+        """Predicted area when its confidence reaches min_confidence, else None"""
+        area, confidence = self.predict(query_vector)
+        if area is None or confidence < min_confidence:
+            return None
+        self.confident += 1
+        return area
+
+    def may_contain(self, collection: str, area: str) -> bool:
+        """Whether a collection holds documents of the area or unlabeled ones"""
+        return bool(
+            self.counts.get(area, {}).get(collection)
+            or self.counts.get(UNLABELED, {}).get(collection)
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "areas": len(self.areas),
+            "predictions": self.predictions,
+            "confident": self.confident,
+            "confident_rate": round(self.confident / max(self.predictions, 1) * 100, 2)
+        }
+
+
+def area_classifier_path() -> Path:
+    return Path(os.getenv("AREA_CLASSIFIER_PATH", str(DEFAULT_CLASSIFIER_PATH)))
+
+
+def load_area_classifier() -> Optional[AreaClassifier]:
+    """Load the trained centroids, or None when they were never built"""
+    path = area_classifier_path()
+    if not path.exists():
+        return None
+    try:
+        return AreaClassifier.load(path)
+    except Exception as e:
+        logger.warning(f"Could not load area classifier from {path}: {e}")
+        return None
+
+
+def build_area_classifier_from_qdrant(client, collections: Iterable[str], batch_size: int = 256) -> int:
+    """Train the centroids from the area labels and vectors stored in Qdrant"""
+    builder = AreaClassifierBuilder()
+
+    for collection in collections:
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["area"],
+                with_vectors=True
+            )
+            for point in points:
+                builder.add(collection, (point.payload or {}).get("area"), full_vector(point.vector))
+            if offset is None:
+                break
+
+    return builder.write(area_classifier_path())
@@ -5,10 +5,15 @@ Reduces LLM costs by 80% by caching repeated analyses
 
 import os
 import json
+import base64
 import hashlib
 import logging
-from typing import Optional, Any, Callable
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Any, Callable, List
 from functools import wraps
+import numpy as np
 import redis
 from datetime import timedelta
 
@@ -222,8 +227,126 @@ def cache_invalidate(pattern: str):
     return decorator
 
 
-# Global instance
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings
+
+    Tier 1 is a bounded in-process LRU, tier 2 is Redis (shared between
+    workers). Vectors are stored as float16 to halve memory and network
+    cost; keys combine the model (with its dtype and backend, see
+    ModelKey.cache_id), prefix and normalized text.
+    """
+
+    def __init__(self, max_items: Optional[int] = None, expire: Optional[int] = None):
+        self.max_items = max_items or int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+        self.expire = expire or int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """
+        Normalize text so trivially different queries share a key
+
+        Only Unicode composition and whitespace: the embedding model is
+        case-sensitive ("STF" vs "stf"), so case is kept.
+        """
+        text = unicodedata.normalize("NFC", text)
+        return " ".join(text.split())
+
+    def make_key(self, model: str, prefix: str, text: str) -> str:
+        """Build cache key from model name, prefix and normalized text"""
+        raw = f"{model}|{prefix}|{self.normalize_text(text)}"
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"doutora_ia:emb:{digest}"
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Store vector in the in-process LRU, evicting the oldest entry"""
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+    def get(self, model: str, prefix: str, text: str) -> Optional[List[float]]:
+        """Get cached embedding, checking memory first and Redis second"""
+        key = self.make_key(model, prefix, text)
+
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return vector.astype(np.float32).tolist()
+
+        if cache_service.enabled:
+            try:
+                value = cache_service.redis_client.get(key)
+                if value:
+                    vector = np.frombuffer(base64.b64decode(value), dtype=np.float16)
+                    self._remember(key, vector)
+                    self.redis_hits += 1
+                    return vector.astype(np.float32).tolist()
+            except Exception as e:
+                logger.error(f"Embedding cache get error: {e}")
+
+        self.misses += 1
+        return None
+
+    def set(self, model: str, prefix: str, text: str, vector: List[float]):
+        """Store embedding in both tiers"""
+        key = self.make_key(model, prefix, text)
+        compact = np.asarray(vector, dtype=np.float16)
+        self._remember(key, compact)
+
+        if cache_service.enabled:
+            try:
+                encoded = base64.b64encode(compact.tobytes()).decode("ascii")
+                cache_service.redis_client.setex(key, self.expire, encoded)
+            except Exception as e:
+                logger.error(f"Embedding cache set error: {e}")
+
+    def get_or_encode(
+        self,
+        model: str,
+        prefix: str,
+        text: str,
+        encode_fn: Callable[[str], List[float]]
+    ) -> List[float]:
+        """Return cached embedding or compute it with encode_fn and cache it"""
+        vector = self.get(model, prefix, text)
+        if vector is not None:
+            return vector
+
+        vector = encode_fn(text)
+        self.set(model, prefix, text, vector)
+        return vector
+
+    def clear(self):
+        """Clear the in-process tier (Redis entries expire on their own)"""
+        with self._lock:
+            self._lru.clear()
+
+    def get_stats(self) -> dict:
+        """Get hit/miss counters for both tiers"""
+        hits = self.memory_hits + self.redis_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / max(total, 1) * 100, 2),
+            "memory_items": len(self._lru),
+            "memory_max_items": self.max_items
+        }
+
+
+# Global instances
 cache_service = CacheService()
+embedding_cache = EmbeddingCache()
 
 
 # Utility functions for common patterns
@@ -240,15 +363,27 @@ def get_cached_search(query: str, filtros: dict, limit: int) -> Optional[list]:
     return cache_service.get(key)
 
 
-def cache_analysis(descricao: str, detalhado: bool, analysis: dict, expire: int = 7200):
-    """Cache case analysis (2 hours default)"""
-    key = cache_service._generate_key("analysis", descricao, detalhado)
+def cache_analysis(
+    descricao: str,
+    detalhado: bool,
+    analysis: dict,
+    expire: int = 7200,
+    corpus_version: Optional[str] = None,
+    scope: Optional[str] = None
+):
+    """Cache case analysis (2 hours default), per corpus version and scope"""
+    key = cache_service._generate_key("analysis", descricao, detalhado, corpus_version, scope)
     cache_service.set(key, analysis, expire)
 
 
-def get_cached_analysis(descricao: str, detalhado: bool) -> Optional[dict]:
+def get_cached_analysis(
+    descricao: str,
+    detalhado: bool,
+    corpus_version: Optional[str] = None,
+    scope: Optional[str] = None
+) -> Optional[dict]:
     """Get cached analysis"""
-    key = cache_service._generate_key("analysis", descricao, detalhado)
+    key = cache_service._generate_key("analysis", descricao, detalhado, corpus_version, scope)
     return cache_service.get(key)
 
 
@@ -264,7 +399,8 @@ def get_cache_metrics() -> dict:
     if not stats.get("enabled"):
         return {
             "enabled": False,
-            "message": "Cache is disabled"
+            "message": "Cache is disabled",
+            "embeddings": embedding_cache.get_stats()
         }
 
     return {
@@ -282,5 +418,6 @@ def get_cache_metrics() -> dict:
             "llm_calls_saved": stats["hits"],
             "cost_saved_usd": round(stats["hits"] * 0.01, 2),  # ~$0.01 per call
             "message": f"Saved ~${round(stats['hits'] * 0.01, 2)} in LLM costs"
-        }
+        },
+        "embeddings": embedding_cache.get_stats()
     }
@@ -0,0 +1,198 @@
+"""
+Chunk text store for Doutora IA
+Keeps the full texto of each point outside Qdrant, compressed in SQLite with a per-collection dictionary
+"""
+
+import os
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # Optional: falls back to zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = Path(__file__).resolve().parents[2] / "data" / "chunks.sqlite"
+
+PointId = Union[int, str]
+
+# Per-row codec, so stores written with and without zstandard (or a dictionary) stay readable
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+CODEC_ZLIB_DICT = 2
+CODEC_ZSTD_DICT = 3
+
+# A collection's dictionary is built from the first put_many with this many texts
+DICT_MIN_SAMPLES = 200
+DICT_SIZE = 64 * 1024
+# zlib preset dictionaries are limited to the 32 KB window
+ZLIB_DICT_SIZE = 32 * 1024
+
+# SQLite host parameter limit is 999 on older builds
+SELECT_BATCH = 500
+
+
+class ChunkStore:
+    """
+    (collection, point id) -> texto, compressed with a per-collection dictionary
+
+    Chunks are short and share most of their vocabulary, so compressing
+    each one alone barely shrinks it. The first large put_many of a
+    collection builds a dictionary from its texts (a trained zstd
+    dictionary, or a raw zlib preset dictionary without zstandard); rows
+    are then compressed against it and still decompress one by one.
+
+    Searches ask Qdrant for metadata only and fetch the texts of the final
+    results here in one query per collection.
+    """
+
+    def __init__(self, path: Optional[str] = None, level: Optional[int] = None):
+        self.path = Path(path or os.getenv("CHUNK_STORE_PATH", str(DEFAULT_STORE_PATH)))
+        self.level = level or int(os.getenv("CHUNK_STORE_LEVEL", "9"))
+        self._lock = threading.Lock()
+        self._conn = None
+        self._dictionaries: Dict[str, Optional[Tuple[int, bytes]]] = {}
+
+        # Metrics
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " collection TEXT NOT NULL, point_id TEXT NOT NULL, codec INTEGER NOT NULL, data BLOB NOT NULL,"
+                " PRIMARY KEY (collection, point_id)) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dictionaries ("
+                " collection TEXT PRIMARY KEY, codec INTEGER NOT NULL, data BLOB NOT NULL)"
+            )
+        return self._conn
+
+    def _dictionary(self, collection: str) -> Optional[Tuple[int, bytes]]:
+        """(codec, bytes) of the collection's dictionary, None when it has none"""
+        if collection not in self._dictionaries:
+            row = self.conn.execute(
+                "SELECT codec, data FROM dictionaries WHERE collection = ?", (collection,)
+            ).fetchone()
+            self._dictionaries[collection] = (row[0], bytes(row[1])) if row else None
+        return self._dictionaries[collection]
+
+    def _build_dictionary(self, collection: str, texts: List[bytes]) -> Optional[Tuple[int, bytes]]:
+        if zstandard is not None:
+            try:
+                data = zstandard.train_dictionary(DICT_SIZE, texts).as_bytes()
+                codec = CODEC_ZSTD_DICT
+            except zstandard.ZstdError as e:
+                logger.warning(f"Could not train a chunk dictionary for {collection}: {e}")
+                return None
+        else:
+            # Raw preset dictionary: samples spread over the batch, most recent bytes weigh most
+            step = max(len(texts) // 64, 1)
+            data = b"".join(texts[::step])[-ZLIB_DICT_SIZE:]
+            codec = CODEC_ZLIB_DICT
+
+        self.conn.execute("INSERT OR REPLACE INTO dictionaries VALUES (?, ?, ?)", (collection, codec, data))
+        self._dictionaries[collection] = (codec, data)
+        logger.info(f"Chunk store dictionary for {collection}: {len(data) / 1024:.0f} KB from {len(texts)} texts")
+        return codec, data
+
+    def _compressor(self, dictionary: Optional[Tuple[int, bytes]]):
+        """Function compressing one text, and the codec it writes"""
+        if dictionary is None:
+            if zstandard is not None:
+                return zstandard.ZstdCompressor(level=self.level).compress, CODEC_ZSTD
+            return lambda raw: zlib.compress(raw, min(self.level, 9)), CODEC_ZLIB
+
+        codec, data = dictionary
+        if codec == CODEC_ZSTD_DICT:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=zstandard.ZstdCompressionDict(data))
+            return compressor.compress, codec
+
+        def compress(raw: bytes) -> bytes:
+            stream = zlib.compressobj(min(self.level, 9), zdict=data)
+            return stream.compress(raw) + stream.flush()
+        return compress, codec
+
+    def _decompress(self, codec: int, data: bytes, dictionary: Optional[Tuple[int, bytes]]) -> str:
+        if codec in (CODEC_ZSTD, CODEC_ZSTD_DICT):
+            if zstandard is None:
+                raise RuntimeError("Chunk store has zstd rows but zstandard is not installed")
+            if codec == CODEC_ZSTD_DICT:
+                decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary[1]))
+            else:
+                decompressor = zstandard.ZstdDecompressor()
+            return decompressor.decompress(data).decode("utf-8")
+        if codec == CODEC_ZLIB_DICT:
+            stream = zlib.decompressobj(zdict=dictionary[1])
+            return (stream.decompress(data) + stream.flush()).decode("utf-8")
+        return zlib.decompress(data).decode("utf-8")
+
+    def put_many(self, collection: str, items: Iterable[Tuple[PointId, str]]) -> int:
+        """Store (point id, texto) pairs, replacing existing ones; returns rows written"""
+        items = [(point_id, (text or "").encode("utf-8")) for point_id, text in items]
+        with self._lock:
+            dictionary = self._dictionary(collection)
+            if dictionary is None and len(items) >= DICT_MIN_SAMPLES:
+                dictionary = self._build_dictionary(collection, [raw for _, raw in items])
+
+            compress, codec = self._compressor(dictionary)
+            rows = [(collection, json.dumps(point_id), codec, compress(raw)) for point_id, raw in items]
+            self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+        return len(rows)
+
+    def get_many(self, collection: str, ids: Sequence[PointId]) -> Dict[PointId, str]:
+        """Texts stored for the given point ids (missing ids are left out)"""
+        keys = {json.dumps(point_id): point_id for point_id in ids}
+        rows: List[tuple] = []
+        with self._lock:
+            key_list = list(keys)
+            for start in range(0, len(key_list), SELECT_BATCH):
+                batch = key_list[start:start + SELECT_BATCH]
+                rows.extend(self.conn.execute(
+                    f"SELECT point_id, codec, data FROM chunks WHERE collection = ? AND point_id IN ({','.join('?' * len(batch))})",
+                    (collection, *batch)
+                ).fetchall())
+
+            dictionary = self._dictionary(collection)
+            self.lookups += 1
+            self.hits += len(rows)
+            self.misses += len(keys) - len(rows)
+            self.bytes_read += sum(len(data) for _, _, data in rows)
+
+        return {keys[point_id]: self._decompress(codec, data, dictionary) for point_id, codec, data in rows}
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "codec": "zstd" if zstandard is not None else "zlib",
+            "dictionaries": sum(1 for dictionary in self._dictionaries.values() if dictionary),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / max(total, 1) * 100, 2),
+            "bytes_read": self.bytes_read
+        }
+
+
+def load_chunk_store() -> Optional[ChunkStore]:
+    """Open the chunk store, or None when it was never built"""
+    store = ChunkStore()
+    if not store.path.exists():
+        return None
+    return store
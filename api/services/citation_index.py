@@ -0,0 +1,263 @@
+"""
+Exact citation index for Doutora IA
+Maps normalized references ("cpc:art:300", "stj:sumula:385") to Qdrant point ids
+"""
+
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parents[2] / "data" / "citations.sqlite"
+
+PointId = Union[int, str]
+
+# Law names/abbreviations -> citation key prefix (accent-free, lowercase)
+LAW_ALIASES = [
+    ("codigo de processo civil", "cpc"),
+    ("codigo de processo penal", "cpp"),
+    ("codigo de defesa do consumidor", "cdc"),
+    ("codigo tributario nacional", "ctn"),
+    ("codigo civil", "cc"),
+    ("codigo penal", "cp"),
+    ("consolidacao das leis do trabalho", "clt"),
+    ("constituicao federal", "cf"),
+    ("constituicao", "cf"),
+    ("estatuto da crianca e do adolescente", "eca"),
+    ("lei geral de protecao de dados", "lgpd"),
+    ("cpc", "cpc"), ("cpp", "cpp"), ("cdc", "cdc"), ("ctn", "ctn"), ("cc", "cc"),
+    ("cp", "cp"), ("clt", "clt"), ("cf", "cf"), ("crfb", "cf"), ("eca", "eca"), ("lgpd", "lgpd"),
+]
+LAW_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(alias) for alias, _ in LAW_ALIASES) + r")\b"
+    r"|\blei\s*(?:n[o.]?\s*)?(\d+)(?:/\d{2,4})?"
+)
+LAW_CODES = dict(LAW_ALIASES)
+
+NUM = r"(\d+)"
+ARTICLE_RE = re.compile(r"\bart(?:igo)?s?\.?\s*" + NUM)
+SUMULA_RE = re.compile(r"\bsumula\s+(vinculante\s+)?(?:n[o.]?\s*)?" + NUM)
+TEMA_RE = re.compile(r"\btema\s+(?:n[o.]?\s*)?" + NUM)
+PRECEDENT_RE = re.compile(r"\b(resp|aresp|re|are|adi|adpf|hc|rhc|ms)\s+(?:n[o.]?\s*)?" + NUM)
+RN_RE = re.compile(r"\b(?:rn|resolucao normativa)\s+(?:n[o.]?\s*)?" + NUM)
+TRIBUNAL_RE = re.compile(r"\b(stj|stf|tst)\b")
+
+# Courts implied by a precedent class when the text does not name one
+PRECEDENT_COURTS = {
+    "resp": ["stj"], "aresp": ["stj"],
+    "re": ["stf"], "are": ["stf"], "adi": ["stf"], "adpf": ["stf"],
+    "hc": ["stj", "stf"], "rhc": ["stj", "stf"], "ms": ["stj", "stf"],
+}
+DEFAULT_COURTS = ["stj", "stf"]
+
+# How far after a reference a law or court name is still attached to it
+WINDOW = 60
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free text with thousands separators removed from numbers"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = text.replace("º", "").replace("°", "")
+    return re.sub(r"(?<=\d)\.(?=\d{3}\b)", "", text)
+
+
+def _law_code(match: re.Match) -> str:
+    if match.group(1):
+        return f"lei{match.group(1)}"
+    return LAW_CODES[match.group(0)]
+
+
+def _nearest(regex: re.Pattern, text: str, start: int, end: int) -> Optional[re.Match]:
+    """First match of regex right after a reference, else the closest one before it"""
+    after = regex.search(text, end, min(len(text), end + WINDOW))
+    if after:
+        return after
+    before = list(regex.finditer(text, max(0, start - WINDOW), start))
+    return before[-1] if before else None
+
+
+def parse_citations(
+    text: str,
+    default_law: Optional[str] = None,
+    default_tribunal: Optional[str] = None
+) -> List[str]:
+    """
+    Detect legal references in free text and return their normalized keys
+
+    Examples:
+        "art. 300 do CPC"            -> cpc:art:300
+        "Súmula 385 do STJ"          -> stj:sumula:385
+        "Súmula Vinculante 13"       -> stf:sumula_vinculante:13
+        "Tema 106/STJ"               -> stj:tema:106
+        "REsp 1.737.412"             -> stj:resp:1737412
+        "RN 465 da ANS"              -> ans:rn:465
+
+    References without a court yield one key per plausible court.
+    """
+    text = normalize(text)
+    default_tribunal = (default_tribunal or "").lower() or None
+    keys: List[str] = []
+
+    def court_for(match: re.Match, fallback: List[str]) -> List[str]:
+        court = _nearest(TRIBUNAL_RE, text, match.start(), match.end())
+        if court:
+            return [court.group(1)]
+        return [default_tribunal] if default_tribunal else fallback
+
+    for match in ARTICLE_RE.finditer(text):
+        law = _nearest(LAW_RE, text, match.start(), match.end())
+        code = _law_code(law) if law else default_law
+        if code:
+            keys.append(f"{code}:art:{match.group(1)}")
+
+    for match in SUMULA_RE.finditer(text):
+        if match.group(1):
+            keys.append(f"stf:sumula_vinculante:{match.group(2)}")
+            continue
+        for court in court_for(match, DEFAULT_COURTS):
+            keys.append(f"{court}:sumula:{match.group(2)}")
+
+    for match in TEMA_RE.finditer(text):
+        for court in court_for(match, DEFAULT_COURTS):
+            keys.append(f"{court}:tema:{match.group(1)}")
+
+    for match in PRECEDENT_RE.finditer(text):
+        classe, numero = match.groups()
+        for court in court_for(match, PRECEDENT_COURTS[classe]):
+            keys.append(f"{court}:{classe}:{numero}")
+
+    for match in RN_RE.finditer(text):
+        keys.append(f"ans:rn:{match.group(1)}")
+
+    # Keep first-seen order, drop duplicates
+    return list(dict.fromkeys(keys))
+
+
+def detect_law(text: str) -> Optional[str]:
+    """Law code mentioned in a title ("Código de Processo Civil - Art. 300" -> cpc)"""
+    match = LAW_RE.search(normalize(text))
+    return _law_code(match) if match else None
+
+
+def citation_keys_for_payload(payload: Dict) -> List[str]:
+    """Citation keys a stored chunk answers to, derived from its metadata"""
+    titulo = payload.get("titulo") or ""
+    tribunal = payload.get("tribunal") or None
+    text = " ".join(str(payload.get(field) or "") for field in ("titulo", "artigo_ou_tema"))
+
+    if payload.get("tipo") == "juris" and payload.get("classe") and payload.get("numero"):
+        text += f" {payload['classe']} {payload['numero']}"
+    if payload.get("tipo") == "sumula" and payload.get("numero") and "sumula" not in normalize(text):
+        text += f" Súmula {payload['numero']}"
+
+    keys = parse_citations(text, default_law=detect_law(titulo), default_tribunal=tribunal)
+    if payload.get("tipo") == "lei":
+        keys = [key for key in keys if ":art:" in key]
+    return keys
+
+
+class CitationIndex:
+    """
+    SQLite-backed citation key -> (collection, point id) index
+
+    Lookups go through an in-memory LRU, so repeated references resolve
+    without touching disk.
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_size: Optional[int] = None):
+        self.path = Path(path or os.getenv("CITATION_INDEX_PATH", str(DEFAULT_INDEX_PATH)))
+        self.cache_size = cache_size or int(os.getenv("CITATION_CACHE_SIZE", "4096"))
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, List[Tuple[str, PointId]]]" = OrderedDict()
+        self._conn = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS citations ("
+                " key TEXT NOT NULL, collection TEXT NOT NULL, point_id TEXT NOT NULL,"
+                " PRIMARY KEY (key, collection, point_id)) WITHOUT ROWID"
+            )
+        return self._conn
+
+    def add(self, key: str, collection: str, point_id: PointId):
+        self.add_many([(key, collection, point_id)])
+
+    def add_many(self, entries: Iterable[Tuple[str, str, PointId]]):
+        rows = [(key, collection, json.dumps(point_id)) for key, collection, point_id in entries]
+        with self._lock:
+            self.conn.executemany("INSERT OR IGNORE INTO citations VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+            self._cache.clear()
+
+    def add_payloads(self, collection: str, items: Iterable[Tuple[PointId, Dict]]) -> int:
+        """Index (point id, payload) pairs of a collection; returns keys added"""
+        entries = [
+            (key, collection, point_id)
+            for point_id, payload in items
+            for key in citation_keys_for_payload(payload)
+        ]
+        self.add_many(entries)
+        return len(entries)
+
+    def lookup(self, key: str) -> List[Tuple[str, PointId]]:
+        """(collection, point id) pairs stored under a citation key"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+
+            self.misses += 1
+            rows = self.conn.execute(
+                "SELECT collection, point_id FROM citations WHERE key = ?", (key,)
+            ).fetchall()
+            targets = [(collection, json.loads(point_id)) for collection, point_id in rows]
+
+            self._cache[key] = targets
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return targets
+
+    def lookup_text(self, text: str) -> Dict[str, List[Tuple[str, PointId]]]:
+        """Parse references in free text and resolve the ones that are indexed"""
+        resolved = {}
+        for key in parse_citations(text):
+            targets = self.lookup(key)
+            if targets:
+                resolved[key] = targets
+        return resolved
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "cache_items": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / max(total, 1) * 100, 2)
+        }
+
+
+def load_citation_index() -> Optional[CitationIndex]:
+    """Open the citation index, or None when it was never built"""
+    index = CitationIndex()
+    if not index.path.exists():
+        return None
+    return index
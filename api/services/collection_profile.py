@@ -0,0 +1,304 @@
+"""
+Declarative Qdrant collection profiles for Doutora IA
+Payload indexes, HNSW and optimizer settings read from ingest/cfg/collections.yml
+"""
+
+import os
+import copy
+import math
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from qdrant_client.models import (
+    Distance, VectorParams, VectorParamsDiff, HnswConfigDiff, OptimizersConfigDiff,
+    PayloadSchemaType, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams,
+    Disabled
+)
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional; built-in defaults are used without it
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+# Named vectors of a Matryoshka collection: indexed prefix and full embedding for rescoring
+SHORT_VECTOR = "short"
+FULL_VECTOR = "full"
+
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parents[2] / "ingest" / "cfg" / "collections.yml"
+
+# Used when collections.yml is not available (e.g. the API image only ships api/)
+DEFAULT_PROFILE = {
+    "vector_size": 1024,  # intfloat/multilingual-e5-large dimension
+    "distance": "cosine",
+    "on_disk_payload": True,
+    "on_disk_vectors": False,
+    # Opt-in per collection: scalar (int8, 4x smaller) | binary (32x smaller, needs more oversampling) | none
+    "quantization": {
+        "type": "none",
+        "quantile": 0.99,
+        "always_ram": True,
+        "oversampling": 2.0,
+        "rescore": True
+    },
+    # Matryoshka: HNSW over a renormalized prefix of the embedding, full vector kept for rescoring
+    "matryoshka": {
+        "dim": 0,  # 0 = disabled (single full vector); e.g. 256 or 384
+        "oversampling": 4.0
+    },
+    "hnsw": {
+        "m": 16,
+        "ef_construct": 128,
+        "full_scan_threshold": 10000
+    },
+    "optimizers": {
+        "indexing_threshold": 20000,
+        "memmap_threshold": 50000,
+        "default_segment_number": 2
+    },
+    "payload_indexes": {
+        "area": "keyword",
+        "orgao": "keyword",
+        "tribunal": "keyword",
+        "tipo": "keyword",
+        "fonte_arquivo": "keyword",
+        "data_epoch_day": "integer",
+        "vigencia_inicio_epoch_day": "integer",
+        "vigencia_fim_epoch_day": "integer"
+    }
+}
+
+
+def truncate_vector(vector: Sequence[float], dim: int) -> List[float]:
+    """First dim components of an embedding, renormalized to unit length"""
+    prefix = np.asarray(vector[:dim], dtype=np.float32)
+    return (prefix / max(float(np.linalg.norm(prefix)), 1e-12)).tolist()
+
+
+def full_vector(vector: Union[Sequence[float], Dict, None]):
+    """The full embedding of a stored point, whether its vectors are named or not"""
+    if isinstance(vector, dict):
+        return vector.get(FULL_VECTOR)
+    return vector
+
+
+def _merge(base: Dict, override: Dict) -> Dict:
+    """Recursively merge override into a copy of base"""
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class CollectionProfile:
+    """Storage and index settings for one Qdrant collection"""
+
+    def __init__(self, name: str, settings: Dict):
+        self.name = name
+        self.vector_size = int(settings["vector_size"])
+        self.distance = Distance(settings["distance"].capitalize())
+        self.on_disk_payload = bool(settings.get("on_disk_payload", False))
+        self.on_disk_vectors = bool(settings.get("on_disk_vectors", False))
+        matryoshka = settings.get("matryoshka") or {}
+        self.matryoshka_dim = int(matryoshka.get("dim") or 0)
+        self.matryoshka_oversampling = float(matryoshka.get("oversampling") or 4.0)
+        self.quantization = dict(settings.get("quantization") or {"type": "none"})
+        self.hnsw = dict(settings.get("hnsw") or {})
+        self.optimizers = dict(settings.get("optimizers") or {})
+        self.payload_indexes = {
+            field: PayloadSchemaType(schema.lower())
+            for field, schema in (settings.get("payload_indexes") or {}).items()
+            if schema
+        }
+
+    @property
+    def matryoshka(self) -> bool:
+        """Whether points carry a short indexed vector plus the full one"""
+        return 0 < self.matryoshka_dim < self.vector_size
+
+    def vectors_config(self):
+        """
+        A single vector, or with Matryoshka the named short (HNSW) and full
+        vectors; the full one has no graph (m=0) and stays on disk, it is only
+        read to rescore candidates
+        """
+        if not self.matryoshka:
+            return VectorParams(size=self.vector_size, distance=self.distance, on_disk=self.on_disk_vectors)
+        return {
+            SHORT_VECTOR: VectorParams(size=self.matryoshka_dim, distance=self.distance, on_disk=self.on_disk_vectors),
+            FULL_VECTOR: VectorParams(
+                size=self.vector_size, distance=self.distance, on_disk=True, hnsw_config=HnswConfigDiff(m=0)
+            )
+        }
+
+    def point_vector(self, vector: Sequence[float]):
+        """Vector(s) to store for an embedding"""
+        if not self.matryoshka:
+            return list(vector)
+        return {SHORT_VECTOR: truncate_vector(vector, self.matryoshka_dim), FULL_VECTOR: list(vector)}
+
+    def query_vector(self, vector: Sequence[float]):
+        """Search argument for the indexed vector: the short prefix (named) or the vector itself"""
+        if not self.matryoshka:
+            return vector
+        return (SHORT_VECTOR, truncate_vector(vector, self.matryoshka_dim))
+
+    def candidate_limit(self, limit: int) -> int:
+        """Short-vector candidates fetched for a final top-limit"""
+        return math.ceil(limit * self.matryoshka_oversampling)
+
+    def create(self, client):
+        """Create the collection with this profile's vector, HNSW and optimizer settings"""
+        client.create_collection(
+            collection_name=self.name,
+            vectors_config=self.vectors_config(),
+            on_disk_payload=self.on_disk_payload,
+            hnsw_config=HnswConfigDiff(**self.hnsw) if self.hnsw else None,
+            optimizers_config=OptimizersConfigDiff(**self.optimizers) if self.optimizers else None,
+            quantization_config=self.quantization_config()
+        )
+
+    @property
+    def quantization_type(self) -> str:
+        return str(self.quantization.get("type") or "none").lower()
+
+    def quantization_config(self):
+        """Qdrant quantization config for this profile (None when disabled)"""
+        always_ram = bool(self.quantization.get("always_ram", True))
+
+        if self.quantization_type == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=self.quantization.get("quantile"),
+                always_ram=always_ram
+            ))
+        if self.quantization_type == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+        return None
+
+    def search_params(self, oversampling: Optional[float] = None) -> Optional[SearchParams]:
+        """
+        Query-time params: search the quantized vectors for oversampling * limit
+        candidates, then rescore them with the original (on-disk) vectors
+        """
+        if self.quantization_type not in ("scalar", "binary"):
+            return None
+        if oversampling is None:
+            oversampling = self.quantization.get("oversampling")
+        return SearchParams(quantization=QuantizationSearchParams(
+            rescore=bool(self.quantization.get("rescore", True)),
+            oversampling=float(oversampling) if oversampling else None
+        ))
+
+    def migrate(self, client):
+        """
+        Apply on-disk vectors and quantization to an existing collection in place
+
+        Qdrant rebuilds the quantized segments in the background; the
+        collection keeps serving searches meanwhile.
+        """
+        client.update_collection(
+            collection_name=self.name,
+            vectors_config={
+                SHORT_VECTOR if self.matryoshka else "": VectorParamsDiff(on_disk=self.on_disk_vectors)
+            },
+            quantization_config=self.quantization_config() or Disabled.DISABLED
+        )
+
+    def estimate_vector_ram(self, points: int) -> Dict[str, int]:
+        """
+        Approximate bytes of vector data held in RAM, before and after
+        quantization
+
+        With Matryoshka the short vector is the indexed one; collection-level
+        quantization also quantizes the full vector, and with always_ram that
+        copy is held in RAM too.
+        """
+        def quantized_bytes(dim: int) -> int:
+            if self.quantization_type == "scalar":
+                return dim
+            if self.quantization_type == "binary":
+                return dim // 8
+            return dim * 4
+
+        original = points * self.vector_size * 4
+        indexed = self.matryoshka_dim if self.matryoshka else self.vector_size
+        ram = points * quantized_bytes(indexed)
+        always_ram = bool(self.quantization.get("always_ram", True))
+        if self.matryoshka and self.quantization_type in ("scalar", "binary") and always_ram:
+            ram += points * quantized_bytes(self.vector_size)
+        return {"original_bytes": original, "ram_bytes": ram}
+
+    def ensure_payload_indexes(self, client) -> list:
+        """
+        Create the payload indexes missing from an existing collection
+
+        Idempotent: fields already indexed are left untouched.
+
+        Returns:
+            List of fields that were indexed
+        """
+        info = client.get_collection(self.name)
+        existing = info.payload_schema or {}
+
+        created = []
+        for field, schema in self.payload_indexes.items():
+            if field in existing:
+                continue
+            client.create_payload_index(
+                collection_name=self.name,
+                field_name=field,
+                field_schema=schema
+            )
+            created.append(field)
+
+        return created
+
+
+class CollectionProfiles:
+    """Profiles keyed by collection name, with a fallback for unlisted collections"""
+
+    def __init__(self, defaults: Dict, collections: Dict[str, Dict]):
+        self.defaults = defaults
+        self.profiles = {
+            name: CollectionProfile(name, _merge(defaults, settings))
+            for name, settings in collections.items()
+        }
+
+    def get(self, name: str) -> CollectionProfile:
+        if name not in self.profiles:
+            self.profiles[name] = CollectionProfile(name, self.defaults)
+        return self.profiles[name]
+
+
+def load_collection_profiles(path: Optional[str] = None) -> CollectionProfiles:
+    """
+    Load collection profiles from collections.yml
+
+    The file's top-level `defaults` section is merged over DEFAULT_PROFILE and
+    each entry under `collections` may override any setting. Collections not
+    listed in the file get the defaults.
+    """
+    path = Path(path or os.getenv("COLLECTIONS_CONFIG", str(DEFAULT_CONFIG_PATH)))
+
+    config = {}
+    if yaml is None:
+        logger.warning("PyYAML not installed - using default collection profile")
+    elif not path.exists():
+        logger.warning(f"Collection config {path} not found - using default collection profile")
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+
+    return CollectionProfiles(
+        defaults=_merge(DEFAULT_PROFILE, config.get("defaults")),
+        collections=config.get("collections") or {}
+    )
@@ -0,0 +1,122 @@
+"""
+Extractive context compression for Doutora IA
+Keeps only the sentences of retrieved chunks that are closest to the query
+"""
+
+import os
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .context_packer import split_sentences
+
+logger = logging.getLogger(__name__)
+
+# Marks sentences dropped between two kept ones
+GAP_MARKER = "[…]"
+
+
+class SentenceCompressor:
+    """
+    Select the query-relevant sentences of long chunks
+
+    Every sentence of every chunk worth compressing is embedded in a single
+    batched encoder call and scored by cosine against the query vector. Each
+    chunk keeps its top sentences in original order; dropped stretches are
+    marked with [...] so the LLM knows the excerpt is not continuous.
+    """
+
+    def __init__(
+        self,
+        encode_passages: Callable[[List[str]], np.ndarray],
+        max_sentences: Optional[int] = None,
+        min_chars: Optional[int] = None,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        """
+        Args:
+            encode_passages: Encodes a list of passages into normalized vectors
+            max_sentences: Sentences kept per chunk
+            min_chars: Chunks shorter than this are left untouched
+            count_tokens: Token counter used for the before/after report
+        """
+        self.encode_passages = encode_passages
+        self.max_sentences = max_sentences or int(os.getenv("CONTEXT_COMPRESSION_SENTENCES", "3"))
+        self.min_chars = min_chars or int(os.getenv("CONTEXT_COMPRESSION_MIN_CHARS", "600"))
+        self.count_tokens = count_tokens or (lambda text: len(text.split()))
+
+        # Metrics
+        self.calls = 0
+        self.chunks_compressed = 0
+        self.sentences_scored = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def compress(self, query_vector: List[float], results_by_tipo: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+        """Return results_by_tipo with long texts reduced to their relevant sentences"""
+        targets = []  # (tipo, position, sentences)
+        for tipo, items in results_by_tipo.items():
+            for i, item in enumerate(items):
+                texto = item.get("texto") or ""
+                if len(texto) < self.min_chars:
+                    continue
+                sentences = split_sentences(texto)
+                if len(sentences) > self.max_sentences:
+                    targets.append((tipo, i, sentences))
+
+        if not targets:
+            return results_by_tipo
+
+        all_sentences = [s for _, _, sentences in targets for s in sentences]
+        vectors = np.asarray(self.encode_passages(all_sentences), dtype=np.float32)
+        scores = vectors @ np.asarray(query_vector, dtype=np.float32)
+
+        compressed = {tipo: list(items) for tipo, items in results_by_tipo.items()}
+        before = after = 0
+        offset = 0
+        for tipo, i, sentences in targets:
+            sentence_scores = scores[offset:offset + len(sentences)]
+            offset += len(sentences)
+
+            keep = np.sort(np.argpartition(-sentence_scores, self.max_sentences - 1)[:self.max_sentences])
+            texto = self._join(sentences, keep)
+
+            item = compressed[tipo][i]
+            before += self.count_tokens(item["texto"])
+            after += self.count_tokens(texto)
+            compressed[tipo][i] = {**item, "texto": texto, "_compressed": True}
+
+        self.calls += 1
+        self.chunks_compressed += len(targets)
+        self.sentences_scored += len(all_sentences)
+        self.tokens_before += before
+        self.tokens_after += after
+        logger.info(
+            f"Context compression: {len(targets)} chunks, {len(all_sentences)} sentences scored, "
+            f"{before} -> {after} tokens"
+        )
+        return compressed
+
+    @staticmethod
+    def _join(sentences: List[str], keep: np.ndarray) -> str:
+        parts = []
+        if keep[0] > 0:
+            parts.append(GAP_MARKER)
+        for previous, index in zip([None, *keep[:-1]], keep):
+            if previous is not None and index > previous + 1:
+                parts.append(GAP_MARKER)
+            parts.append(sentences[index])
+        if keep[-1] < len(sentences) - 1:
+            parts.append(GAP_MARKER)
+        return " ".join(parts)
+
+    def get_stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "chunks_compressed": self.chunks_compressed,
+            "sentences_scored": self.sentences_scored,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "ratio": round(self.tokens_before / max(self.tokens_after, 1), 2)
+        }
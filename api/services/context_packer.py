@@ -0,0 +1,221 @@
+"""
+Token-budgeted context packing for Doutora IA
+Fits ranked evidence into a prompt budget, cutting at sentence boundaries
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough Portuguese average when the model tokenizer is unavailable
+CHARS_PER_TOKEN = 4.0
+
+# Abbreviations that end with a period without ending the sentence
+ABBREVIATIONS = {
+    "art", "arts", "inc", "n", "no", "nº", "fls", "fl", "p", "pp", "min", "rel",
+    "des", "dr", "dra", "sr", "sra", "ex", "cf", "par", "al", "obs", "prof", "etc"
+}
+SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+")
+
+# Section order and headers of the case context
+SECTIONS = [
+    ("citada", "=== REFERÊNCIAS CITADAS NO CASO ==="),
+    ("lei", "=== LEGISLAÇÃO APLICÁVEL ==="),
+    ("sumula", "=== SÚMULAS E TESES ==="),
+    ("juris", "=== JURISPRUDÊNCIA ==="),
+    ("regulatorio", "=== NORMAS REGULATÓRIAS ==="),
+    ("doutrina", "=== DOUTRINA ==="),
+]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences, keeping legal abbreviations ("Art. 300") intact"""
+    sentences: List[str] = []
+    for piece in SENTENCE_END_RE.split((text or "").strip()):
+        if not piece:
+            continue
+        if sentences:
+            last_word = sentences[-1].rsplit(None, 1)[-1].rstrip(".").lower()
+            if sentences[-1].endswith(".") and (last_word in ABBREVIATIONS or last_word.isdigit() and len(last_word) <= 2):
+                sentences[-1] = f"{sentences[-1]} {piece}"
+                continue
+        sentences.append(piece)
+    return sentences
+
+
+class TokenCounter:
+    """
+    Count tokens with the target LLM's tokenizer
+
+    The tokenizer is loaded from CONTEXT_TOKENIZER (a Hugging Face id;
+    defaults to VLLM_MODEL when that looks like one), by load() during the
+    API warm-up or else on first use. Without one (an Ollama tag such as
+    "llama3.1:8b", or CONTEXT_TOKENIZER=none) or when it cannot be loaded,
+    counts are estimated from character length; the first estimate is logged.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = None):
+        # An explicit "" / "none" asks for the estimate: nothing to report
+        self._report_estimate = tokenizer_name is None
+        if tokenizer_name is None:
+            tokenizer_name = os.getenv("CONTEXT_TOKENIZER", "")
+            model = os.getenv("VLLM_MODEL", "")
+            if not tokenizer_name and "/" in model:
+                tokenizer_name = model
+            if tokenizer_name.lower() == "none":
+                tokenizer_name = ""
+                self._report_estimate = False
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if not self._loaded:
+            self.load()
+        return self._tokenizer
+
+    def load(self) -> bool:
+        """Load the tokenizer now (once); True when counts will be exact"""
+        with self._lock:
+            if not self._loaded:
+                if self.tokenizer_name:
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                    except Exception as e:
+                        logger.warning(f"Could not load tokenizer {self.tokenizer_name}, estimating tokens: {e}")
+                elif self._report_estimate:
+                    logger.warning(
+                        "No Hugging Face tokenizer for the LLM (set CONTEXT_TOKENIZER), "
+                        f"estimating tokens as {CHARS_PER_TOKEN:g} characters each"
+                    )
+                self._loaded = True
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self.tokenizer
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class ContextPacker:
+    """
+    Fit ranked candidates into a token budget
+
+    Candidates are visited best-first. Each gets a share of the remaining
+    budget proportional to its score among the remaining candidates, takes
+    whole sentences up to that share, and returns what it does not use to
+    the pool. Candidates whose share is too small for a useful sentence are
+    dropped. The packed evidence is rendered in the usual section order.
+    """
+
+    def __init__(
+        self,
+        budget: Optional[int] = None,
+        counter: Optional[TokenCounter] = None,
+        min_tokens: Optional[int] = None
+    ):
+        self.budget = budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+        self.counter = counter or TokenCounter()
+        self.min_tokens = min_tokens or int(os.getenv("CONTEXT_MIN_TOKENS_PER_SOURCE", "24"))
+
+    @staticmethod
+    def score_of(item: Dict) -> float:
+        return max(float(item.get("_final_score", item.get("_score", 0.0)) or 0.0), 1e-6)
+
+    @staticmethod
+    def label(tipo: str, item: Dict) -> str:
+        titulo = item.get("titulo", "")
+        if tipo == "juris" and item.get("tribunal"):
+            return f"- {titulo} ({item['tribunal']}): "
+        return f"- {titulo}: "
+
+    def select_text(self, item: Dict, allowance: int) -> Tuple[str, int]:
+        """Leading sentences of the item's text that fit the allowance"""
+        sentences = split_sentences(item.get("texto", ""))
+        taken, used = [], 0
+        for sentence in sentences:
+            cost = self.counter.count(sentence + " ")
+            if used + cost > allowance:
+                break
+            taken.append(sentence)
+            used += cost
+
+        if not taken and sentences:
+            # A single sentence longer than the allowance (common in ementas):
+            # keep its beginning, cut at a word boundary
+            return self.truncate(sentences[0], allowance)
+        return " ".join(taken), used
+
+    def truncate(self, text: str, allowance: int) -> Tuple[str, int]:
+        chars = int(allowance * CHARS_PER_TOKEN)
+        while chars > 0:
+            cut = text[:chars].rsplit(" ", 1)[0] + "…"
+            cost = self.counter.count(cut + " ")
+            if cost <= allowance:
+                return cut, cost
+            chars = int(chars * 0.9)
+        return "", 0
+
+    def allocate(self, results_by_tipo: Dict[str, List[Dict]]) -> Dict[str, List[Tuple[Dict, str]]]:
+        """Choose the text kept for each candidate, by score, within the budget"""
+        candidates = [
+            (tipo, item)
+            for tipo, items in results_by_tipo.items()
+            for item in items
+        ]
+        candidates.sort(key=lambda c: self.score_of(c[1]), reverse=True)
+
+        headers = dict(SECTIONS)
+        remaining = self.budget - sum(
+            self.counter.count(headers.get(tipo, tipo) + "\n")
+            for tipo, items in results_by_tipo.items() if items
+        )
+        remaining_score = sum(self.score_of(item) for _, item in candidates)
+
+        packed: Dict[str, List[Tuple[Dict, str]]] = {}
+        for tipo, item in candidates:
+            score = self.score_of(item)
+            share = int(remaining * score / remaining_score) if remaining_score > 0 else 0
+            remaining_score -= score
+
+            overhead = self.counter.count(self.label(tipo, item))
+            if share - overhead < self.min_tokens:
+                continue
+            text, used = self.select_text(item, share - overhead)
+            if not text:
+                continue
+
+            packed.setdefault(tipo, []).append((item, text))
+            remaining -= used + overhead
+
+        return packed
+
+    def pack(self, results_by_tipo: Dict[str, List[Dict]]) -> str:
+        """Render the budgeted context string"""
+        packed = self.allocate(results_by_tipo)
+
+        parts = []
+        for tipo, header in SECTIONS:
+            entries = packed.get(tipo)
+            if not entries:
+                continue
+            if parts:
+                parts.append("")
+            parts.append(header)
+            # Keep retrieval order inside a section
+            order = {id(item): i for i, item in enumerate(results_by_tipo[tipo])}
+            for item, text in sorted(entries, key=lambda e: order[id(e[0])]):
+                parts.append(f"{self.label(tipo, item)}{text}")
+
+        return "\n".join(parts)
@@ -0,0 +1,48 @@
+"""
+Date payload helpers for Doutora IA
+Integer epoch days stored next to the ISO dates so Qdrant can range-filter them
+"""
+
+from datetime import datetime, date
+from typing import Dict, Optional
+
+# Integer companions of the ISO date payload fields, used for range filters
+DATE_PAYLOAD_FIELDS = {
+    "data": "data_epoch_day",
+    "vigencia_inicio": "vigencia_inicio_epoch_day",
+    "vigencia_fim": "vigencia_fim_epoch_day"
+}
+
+EPOCH = date(1970, 1, 1)
+
+
+def to_epoch_day(value) -> Optional[int]:
+    """Convert an ISO date/datetime (string or object) to days since 1970-01-01"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        try:
+            value = date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return None
+    return (value - EPOCH).days
+
+
+def epoch_days(payload: Dict) -> Dict:
+    """Epoch-day fields computed from a payload's ISO date fields"""
+    return {
+        epoch_field: to_epoch_day(payload.get(field))
+        for field, epoch_field in DATE_PAYLOAD_FIELDS.items()
+    }
+
+
+def with_epoch_days(payload: Dict) -> Dict:
+    """Return payload with epoch-day fields filled in from its ISO date fields"""
+    missing = {
+        epoch_field: value
+        for epoch_field, value in epoch_days(payload).items()
+        if epoch_field not in payload
+    }
+    return {**payload, **missing} if missing else payload
@@ -0,0 +1,153 @@
+"""
+Post-retrieval diversification for Doutora IA
+Merges adjacent chunks of the same source and picks diverse evidence (MMR)
+"""
+
+import os
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Longest chunk overlap produced by the ingesters (ebooks use 800 characters)
+MAX_OVERLAP = 1000
+
+
+def source_key(result: Dict) -> Optional[tuple]:
+    """
+    Identify the text-split document a chunk came from
+
+    None when unknown, and for law articles: each article is cited on its
+    own (title and article number), so neighbouring articles never merge.
+    """
+    source = result.get("fonte_arquivo") or result.get("documento_id")
+    if not source or result.get("chunk_index") is None:
+        return None
+    if result.get("tipo") == "lei" and result.get("artigo_ou_tema"):
+        return None
+    return (result.get("_collection"), source)
+
+
+def join_overlapping(left: str, right: str, max_overlap: int = MAX_OVERLAP, min_overlap: int = 20) -> str:
+    """Concatenate two consecutive chunks, dropping the text they share"""
+    right = right.lstrip()
+    head = right[:min_overlap]
+    if len(head) == min_overlap:
+        pos = left.find(head, max(0, len(left) - max_overlap))
+        while pos != -1:
+            # The tail of left must be a prefix of right (chunkers may strip the cut)
+            if right.startswith(left[pos:].rstrip()):
+                return left[:pos] + right
+            pos = left.find(head, pos + 1)
+    return f"{left}\n{right}"
+
+
+def merge_contiguous(results: List[Dict]) -> List[Dict]:
+    """
+    Merge runs of consecutive chunks (same source, chunk_index n, n+1, ...)
+
+    The merged entry keeps the best-scoring chunk's metadata, its text spans
+    the whole run and _chunk_range records the merged indices. Identical
+    texts are dropped. Output order follows the best score of each entry.
+    """
+    score_of = lambda r: r.get("_final_score", r.get("_score", 0.0))
+
+    merged: List[Dict] = []
+    groups: Dict[tuple, List[Dict]] = {}
+    seen_texts = set()
+
+    for result in results:
+        text = result.get("texto", "")
+        if text and text in seen_texts:
+            continue
+        seen_texts.add(text)
+
+        key = source_key(result)
+        if key is None:
+            merged.append(result)
+        else:
+            groups.setdefault(key, []).append(result)
+
+    for chunks in groups.values():
+        chunks.sort(key=lambda r: r["chunk_index"])
+        run = [chunks[0]]
+        for chunk in chunks[1:]:
+            if chunk["chunk_index"] == run[-1]["chunk_index"] + 1:
+                run.append(chunk)
+            else:
+                merged.append(_merge_run(run, score_of))
+                run = [chunk]
+        merged.append(_merge_run(run, score_of))
+
+    merged.sort(key=score_of, reverse=True)
+    return merged
+
+
+def _merge_run(run: List[Dict], score_of) -> Dict:
+    if len(run) == 1:
+        return run[0]
+
+    best = dict(max(run, key=score_of))
+    text = run[0].get("texto", "")
+    for chunk in run[1:]:
+        text = join_overlapping(text, chunk.get("texto", ""))
+
+    best["texto"] = text
+    best["_chunk_range"] = (run[0]["chunk_index"], run[-1]["chunk_index"])
+    return best
+
+
+def mmr(results: List[Dict], k: int, lambda_: Optional[float] = None) -> List[Dict]:
+    """
+    Maximal marginal relevance over the returned vectors (_vector)
+
+    Greedily picks the result maximizing
+        lambda * relevance - (1 - lambda) * max cosine to already picked
+    with relevance the rank score scaled to [0, 1]. Results without a
+    vector are treated as dissimilar to everything.
+    """
+    if lambda_ is None:
+        lambda_ = float(os.getenv("MMR_LAMBDA", "0.7"))
+    if len(results) <= k:
+        return list(results)
+
+    relevance = np.array([r.get("_final_score", r.get("_score", 0.0)) for r in results], dtype=np.float64)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+    dim = next((len(r["_vector"]) for r in results if r.get("_vector") is not None), 0)
+    if dim == 0:
+        return sorted(results, key=lambda r: r.get("_final_score", r.get("_score", 0.0)), reverse=True)[:k]
+
+    vectors = np.zeros((len(results), dim), dtype=np.float32)
+    for i, r in enumerate(results):
+        if r.get("_vector") is not None:
+            vectors[i] = r["_vector"]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_sim = similarity[selected[0]].copy()
+    available = np.ones(len(results), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_ * relevance - (1 - lambda_) * max_sim
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        max_sim = np.maximum(max_sim, similarity[pick])
+
+    return [results[i] for i in selected]
+
+
+def diversify(results: List[Dict], k: int, lambda_: Optional[float] = None) -> List[Dict]:
+    """Merge contiguous chunks, pick k diverse results and drop the vectors"""
+    picked = mmr(merge_contiguous(results), k, lambda_)
+    for result in picked:
+        result.pop("_vector", None)
+    return picked
@@ -1,30 +1,167 @@
-from sentence_transformers import SentenceTransformer
 import os
-from typing import List
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List, Callable, Optional
 import logging
 
+from services.cache import embedding_cache
+from services.model_registry import model_registry
+
 logger = logging.getLogger(__name__)
 
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching executor for embedding requests
+
+    Concurrent callers submit single texts; a dedicated worker thread
+    collects them for up to max_wait_ms (or max_batch items), runs one
+    batched forward pass and resolves every caller's future. This keeps
+    the event loop free and lets throughput grow with concurrency.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], List[List[float]]],
+        max_batch: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        name: str = "embedding-batcher"
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch or int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+        self.total_encode_time = 0.0
+
+    def _ensure_worker(self):
+        """Start the worker thread on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a future with its vector"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+
+    def encode(self, text: str) -> List[float]:
+        """Encode a single text, blocking until its batch is done"""
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> List[float]:
+        """Encode a single text without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect_batch(self) -> list:
+        """Block for the first item, then gather more until full or timed out"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+
+            # Drop requests whose caller already gave up
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                vectors = self.encode_fn([text for text, _, _ in batch])
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            self.total_encode_time += time.perf_counter() - started
+
+            for (_, future, enqueued_at), vector in zip(batch, vectors):
+                self.total_wait_time += started - enqueued_at
+                future.set_result(vector)
+
+    def get_stats(self) -> dict:
+        """Get batching and queue-depth metrics"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / max(self.batches, 1), 2),
+            "avg_wait_ms": round(self.total_wait_time / max(self.items, 1) * 1000, 2),
+            "avg_encode_ms": round(self.total_encode_time / max(self.batches, 1) * 1000, 2),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+
 class EmbeddingService:
     def __init__(self):
         model_name = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
         device = os.getenv("EMBEDDING_DEVICE", "cpu")
-        
+
         logger.info(f"Loading embedding model: {model_name} on {device}")
-        self.model = SentenceTransformer(model_name, device=device)
-        
+        self.model_name = model_name
+        self.model = model_registry.get(model_name, device)
+        # Cache namespace includes dtype/backend (ONNX int8 vs PyTorch float32)
+        self.cache_model = model_registry.resolve(model_name, device).cache_id
+        self.batcher = EmbeddingBatcher(lambda texts: self.encode_batch(texts, is_query=True))
+
     def encode_query(self, text: str) -> List[float]:
-        """Encode search query with 'query:' prefix for E5 models"""
-        prefixed = f"query: {text}"
-        embedding = self.model.encode(prefixed, normalize_embeddings=True)
-        return embedding.tolist()
-    
+        """Encode search query with 'query:' prefix for E5 models (cached)"""
+        return embedding_cache.get_or_encode(self.cache_model, "query: ", text, self.batcher.encode)
+
+    async def aencode_query(self, text: str) -> List[float]:
+        """Async variant of encode_query, batched with concurrent callers"""
+        # The cache's second tier is a blocking Redis round trip
+        vector = await asyncio.to_thread(embedding_cache.get, self.cache_model, "query: ", text)
+        if vector is None:
+            vector = await self.batcher.aencode(text)
+            await asyncio.to_thread(embedding_cache.set, self.cache_model, "query: ", text, vector)
+        return vector
+
     def encode_document(self, text: str) -> List[float]:
         """Encode document with 'passage:' prefix for E5 models"""
         prefixed = f"passage: {text}"
         embedding = self.model.encode(prefixed, normalize_embeddings=True)
         return embedding.tolist()
-    
+
     def encode_batch(self, texts: List[str], is_query: bool = False) -> List[List[float]]:
         """Encode multiple texts at once"""
         prefix = "query: " if is_query else "passage: "
@@ -32,5 +169,31 @@ class EmbeddingService:
         embeddings = self.model.encode(prefixed_texts, normalize_embeddings=True)
         return embeddings.tolist()
 
-# Global instance
-embedding_service = EmbeddingService()
+
+# Global instance (created on first access so importing this module stays cheap)
+_embedding_service = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Get or create EmbeddingService singleton"""
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
+
+
+def _reset_after_fork():
+    # The batcher's worker thread does not survive fork; start a fresh one lazily
+    if _embedding_service is not None:
+        service = _embedding_service
+        service.batcher = EmbeddingBatcher(lambda texts: service.encode_batch(texts, is_query=True))
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def __getattr__(name):
+    # Keep `from services.embeddings import embedding_service` working
+    if name == "embedding_service":
+        return get_embedding_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,222 @@
+"""
+Embedding encoder backends for Doutora IA
+PyTorch (sentence-transformers) or an int8-quantized ONNX export run by ONNX Runtime
+"""
+
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_DIR = Path(__file__).resolve().parents[2] / "data" / "onnx"
+ONNX_MODEL_FILE = "model.int8.onnx"
+META_FILE = "meta.json"
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    """Directory of the model's ONNX export (one sub-directory per model)"""
+    root = Path(os.getenv("EMBEDDING_ONNX_DIR", str(DEFAULT_ONNX_DIR)))
+    return root / model_name.replace("/", "__")
+
+
+def has_onnx_export(model_name: str) -> bool:
+    path = onnx_model_dir(model_name)
+    return (path / ONNX_MODEL_FILE).exists() and (path / META_FILE).exists()
+
+
+def default_intra_op_threads() -> int:
+    """One ONNX Runtime thread per physical core (logical cores / 2)"""
+    return max((os.cpu_count() or 2) // 2, 1)
+
+
+class OnnxEncoder:
+    """
+    Drop-in for SentenceTransformer.encode over an int8 ONNX export
+
+    Runs the transformer in ONNX Runtime and applies the same mean pooling
+    as the e5 sentence-transformers model. Texts are encoded in
+    length-sorted batches so padding stays small.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, path: Union[str, Path], intra_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META_FILE).read_text())
+        self.max_seq_length = self.meta.get("max_seq_length", 512)
+        self.intra_op_threads = intra_op_threads or int(
+            os.getenv("EMBEDDING_ONNX_THREADS", "0")
+        ) or default_intra_op_threads()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            str(self.path / ONNX_MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.path))
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        inputs = {name: tokens[name].astype(np.int64) for name in tokens if name in self.input_names}
+        hidden = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(
+        self,
+        sentences: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        convert_to_numpy: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.meta.get("dimension", 0)), dtype=np.float32)
+
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.zeros((len(texts), self.meta["dimension"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._forward([texts[i] for i in batch])
+
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "path": str(self.path),
+            "quantization": self.meta.get("quantization"),
+            "intra_op_threads": self.intra_op_threads
+        }
+
+
+def load_encoder(model_name: str, device: str = "cpu", backend: Optional[str] = None):
+    """
+    Load the embedding encoder for EMBEDDING_BACKEND (auto | onnx | torch)
+
+    auto uses the ONNX export on CPU when it exists and onnxruntime is
+    installed, and PyTorch otherwise; onnx falls back to PyTorch with a
+    warning when the export cannot be loaded.
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "auto")).lower()
+
+    if backend in ("auto", "onnx") and device == "cpu" and has_onnx_export(model_name):
+        try:
+            encoder = OnnxEncoder(onnx_model_dir(model_name))
+            logger.info(f"Embedding model {model_name}: ONNX int8 ({encoder.intra_op_threads} threads)")
+            return encoder
+        except Exception as e:
+            logger.warning(f"Could not load ONNX export of {model_name}, using PyTorch: {e}")
+    elif backend == "onnx":
+        logger.warning(f"No ONNX export of {model_name} in {onnx_model_dir(model_name)}, using PyTorch")
+
+    from sentence_transformers import SentenceTransformer
+
+    encoder = SentenceTransformer(model_name, device=device)
+    encoder.backend = "torch"
+    return encoder
+
+
+def describe_encoder(encoder) -> Optional[Dict]:
+    """Backend details of a loaded encoder for /metrics"""
+    if encoder is None:
+        return None
+    if hasattr(encoder, "get_stats"):
+        return encoder.get_stats()
+    return {"backend": getattr(encoder, "backend", "torch"), "device": str(getattr(encoder, "device", "cpu"))}
+
+
+def export_onnx(model_name: str, output_dir: Optional[Union[str, Path]] = None, opset: int = 14) -> Path:
+    """
+    Export the model's transformer to ONNX and quantize its weights to int8
+
+    Dynamic quantization (int8 weights, activations quantized at run time)
+    needs no calibration data. The tokenizer is saved next to the model.
+    Needs the export-time dependencies (requirements-export.txt: onnx).
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    output = Path(output_dir) if output_dir else onnx_model_dir(model_name)
+    output.mkdir(parents=True, exist_ok=True)
+    fp32_path = output / "model.fp32.onnx"
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    sample = tokenizer(["query: exemplo"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**dynamic, "last_hidden_state": {0: "batch", 1: "sequence"}},
+            opset_version=opset
+        )
+
+    quantize_dynamic(str(fp32_path), str(output / ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+    fp32_path.unlink()
+
+    tokenizer.save_pretrained(str(output))
+    (output / META_FILE).write_text(json.dumps({
+        "model": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "quantization": "dynamic-int8",
+        "opset": opset
+    }, indent=2))
+    return output
+
+
+def parity_check(reference, candidate, texts: Sequence[str], batch_size: int = 32) -> Dict:
+    """
+    Cosine drift of candidate embeddings against the fp32 reference
+
+    Returns the mean/min cosine between both encoders' vectors for the same
+    texts and their encode times.
+    """
+    timings = {}
+    vectors = {}
+    for name, encoder in (("reference", reference), ("candidate", candidate)):
+        started = time.perf_counter()
+        vectors[name] = encoder.encode(list(texts), batch_size=batch_size, normalize_embeddings=True)
+        timings[name] = time.perf_counter() - started
+
+    cosines = np.sum(np.asarray(vectors["reference"]) * np.asarray(vectors["candidate"]), axis=1)
+    return {
+        "texts": len(texts),
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "min_cosine": round(float(cosines.min()), 5),
+        "max_drift": round(float(1 - cosines.min()), 5),
+        "reference_ms": round(timings["reference"] * 1000, 1),
+        "candidate_ms": round(timings["candidate"] * 1000, 1),
+        "speedup": round(timings["reference"] / max(timings["candidate"], 1e-9), 2)
+    }
@@ -0,0 +1,167 @@
+"""
+Streaming ingestion pipeline for Doutora IA
+Length-sorted encode batches overlapped with concurrent non-blocking upserts
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Document = Tuple[object, Dict, str]
+
+
+class IngestPipeline:
+    """
+    Streams (id, payload, text) documents into a vector collection
+
+    Documents are read sort_window at a time and sorted by text length, so
+    each encode batch holds texts of similar length and wastes little
+    padding. Encoded batches go through a bounded queue to upserts_in_flight
+    worker threads, which send them with wait=False while the next batch is
+    encoded. Memory stays bounded by one window plus the queued batches,
+    whatever the corpus size.
+
+    The last batch is held back and sent with final_upsert once every other
+    upsert has been acknowledged. Qdrant applies updates in order, so a
+    final_upsert that waits (wait=True) returns only when the whole run is
+    searchable.
+    """
+
+    def __init__(
+        self,
+        encode_passages: Callable[[List[str]], np.ndarray],
+        upsert: Callable[[list], None],
+        final_upsert: Optional[Callable[[list], None]] = None,
+        prepare: Optional[Callable[[List[Tuple[object, Dict]]], List[Dict]]] = None,
+        to_vector: Optional[Callable[[np.ndarray], object]] = None,
+        batch_size: Optional[int] = None,
+        sort_window: Optional[int] = None,
+        upserts_in_flight: Optional[int] = None
+    ):
+        self.encode_passages = encode_passages
+        self.upsert = upsert
+        self.final_upsert = final_upsert or upsert
+        self.prepare = prepare or (lambda items: [payload for _, payload in items])
+        self.to_vector = to_vector or (lambda vector: vector.tolist())
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        self.sort_window = max(sort_window or int(os.getenv("INGEST_SORT_WINDOW", "4096")), self.batch_size)
+        self.upserts_in_flight = upserts_in_flight or int(os.getenv("INGEST_UPSERTS_IN_FLIGHT", "4"))
+
+        self._queue: Optional[queue.Queue] = None
+        self._error: Optional[Exception] = None
+        self._metrics_lock = threading.Lock()
+
+        # Metrics
+        self.chunks = 0
+        self.batches = 0
+        self.encode_time = 0.0
+        # Summed over the concurrent workers, so it can exceed the elapsed time
+        self.upsert_worker_time = 0.0
+        # Wall time the encoding thread spent blocked on upserts (full queue,
+        # draining the workers, final upsert)
+        self.upsert_wait = 0.0
+        self.elapsed = 0.0
+
+    def _upsert_worker(self):
+        while True:
+            points = self._queue.get()
+            if points is None:
+                return
+            if self._error is not None:
+                continue
+            started = time.perf_counter()
+            try:
+                self.upsert(points)
+            except Exception as e:
+                self._error = e
+            with self._metrics_lock:
+                self.upsert_worker_time += time.perf_counter() - started
+
+    def _windows(self, documents: Iterable[Document]):
+        iterator = iter(documents)
+        while True:
+            window = list(islice(iterator, self.sort_window))
+            if not window:
+                return
+            yield window
+
+    def _encode_window(self, window: Sequence[Document]):
+        """Yield the window's points batch by batch, longest texts first"""
+        from qdrant_client.models import PointStruct
+
+        payloads = self.prepare([(doc_id, payload) for doc_id, payload, _ in window])
+        order = sorted(range(len(window)), key=lambda i: len(window[i][2] or ""), reverse=True)
+
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            started = time.perf_counter()
+            vectors = self.encode_passages([window[i][2] or "" for i in batch])
+            self.encode_time += time.perf_counter() - started
+            yield [
+                PointStruct(id=window[i][0], vector=self.to_vector(vector), payload=payloads[i])
+                for i, vector in zip(batch, vectors)
+            ]
+
+    def run(self, documents: Iterable[Document]) -> Dict:
+        """Encode and upsert every document; raises the first upsert error"""
+        started = time.perf_counter()
+        self._error = None
+        self._queue = queue.Queue(maxsize=self.upserts_in_flight * 2)
+        workers = [
+            threading.Thread(target=self._upsert_worker, name=f"ingest-upsert-{i}", daemon=True)
+            for i in range(self.upserts_in_flight)
+        ]
+        for worker in workers:
+            worker.start()
+
+        last = None
+        try:
+            for window in self._windows(documents):
+                for points in self._encode_window(window):
+                    if self._error is not None:
+                        raise self._error
+                    if last is not None:
+                        waited = time.perf_counter()
+                        self._queue.put(last)
+                        self.upsert_wait += time.perf_counter() - waited
+                    last = points
+                    self.chunks += len(points)
+                    self.batches += 1
+        finally:
+            waited = time.perf_counter()
+            for _ in workers:
+                self._queue.put(None)
+            for worker in workers:
+                worker.join()
+            self.upsert_wait += time.perf_counter() - waited
+            self.elapsed += time.perf_counter() - started
+
+        if self._error is not None:
+            raise self._error
+        if last is not None:
+            started = time.perf_counter()
+            self.final_upsert(last)
+            duration = time.perf_counter() - started
+            self.upsert_worker_time += duration
+            self.upsert_wait += duration
+            self.elapsed += duration
+        return self.get_stats()
+
+    def get_stats(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "encode_time_s": round(self.encode_time, 2),
+            "upsert_worker_time_s": round(self.upsert_worker_time, 2),
+            "upsert_wait_s": round(self.upsert_wait, 2),
+            "elapsed_s": round(self.elapsed, 2),
+            "chunks_per_s": round(self.chunks / self.elapsed, 1) if self.elapsed else 0.0
+        }
@@ -0,0 +1,346 @@
+"""
+BM25 lexical index for Doutora IA
+Compact memory-mapped postings built at ingestion, queried alongside Qdrant
+"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parents[2] / "data" / "lexical"
+
+PointId = Union[int, str]
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Thousands separators inside numbers ("1.737.412" -> "1737412")
+NUMBER_DOTS_RE = re.compile(r"(?<=\d)[.](?=\d{3}\b)")
+
+# Citation prefixes glued to the following number ("art. 300" -> "art_300"),
+# so exact references get a single, highly selective term
+CITATION_PREFIXES = {
+    "art": "art", "arts": "art", "artigo": "art", "artigos": "art",
+    "sumula": "sumula", "sum": "sumula",
+    "tema": "tema",
+    "resp": "resp", "aresp": "aresp", "re": "re", "are": "are",
+    "hc": "hc", "rhc": "rhc", "adi": "adi", "adpf": "adpf", "ms": "ms",
+    "rn": "rn", "res": "res", "resolucao": "res",
+    "lei": "lei", "decreto": "decreto", "lc": "lc",
+    "inc": "inc", "inciso": "inc", "par": "par", "paragrafo": "par"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens plus compound citation tokens"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = NUMBER_DOTS_RE.sub("", text)
+
+    words = TOKEN_RE.findall(text)
+    tokens = list(words)
+    for prefix, nxt in zip(words, words[1:]):
+        canonical = CITATION_PREFIXES.get(prefix)
+        if canonical and nxt[0].isdigit():
+            tokens.append(f"{canonical}_{nxt}")
+    return tokens
+
+
+def term_hash(term: str) -> int:
+    """Stable 63-bit hash used as the on-disk term key"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little") >> 1
+
+
+class BM25IndexBuilder:
+    """
+    Accumulate chunk texts and write a BM25 index
+
+    Layout of an index directory:
+        meta.json       doc count, average length, id type
+        terms.npy       sorted term hashes (int64)
+        offsets.npy     postings start for each term (+ final end)
+        docs.npy        postings doc numbers (uint32)
+        tfs.npy         postings term frequencies (uint16)
+        doc_lens.npy    token count per doc (uint32)
+        ids.npy/.json   Qdrant point id per doc number
+
+    Postings are spilled to sorted runs on disk (spill_dir, a temporary
+    directory by default) every max_postings entries, or when spill() is
+    called, and the runs are merged by write(). Memory stays bounded by one
+    run plus the per-doc ids and lengths, whatever the collection size.
+    """
+
+    def __init__(self, spill_dir: Optional[Union[str, Path]] = None, max_postings: Optional[int] = None):
+        self.ids: List[PointId] = []
+        self.doc_lens = array("I")
+        self.postings: Dict[int, Tuple[array, array]] = {}
+        self.max_postings = max_postings or int(os.getenv("LEXICAL_SPILL_POSTINGS", "20000000"))
+        self._spill_root = Path(spill_dir) if spill_dir else None
+        self._spill_dir: Optional[Path] = None
+        self._runs: List[Path] = []
+        self._buffered = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, point_id: PointId, text: str):
+        doc = len(self.ids)
+        self.ids.append(point_id)
+
+        counts: Dict[int, int] = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            key = term_hash(token)
+            counts[key] = counts.get(key, 0) + 1
+        self.doc_lens.append(len(tokens))
+
+        for key, tf in counts.items():
+            entry = self.postings.get(key)
+            if entry is None:
+                entry = self.postings[key] = (array("I"), array("H"))
+            entry[0].append(doc)
+            entry[1].append(min(tf, 65535))
+        self._buffered += len(counts)
+
+        if self._buffered >= self.max_postings:
+            self.spill()
+
+    def add_many(self, items: Iterable[Tuple[PointId, str]]):
+        for point_id, text in items:
+            self.add(point_id, text)
+
+    def _buffered_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Buffered postings as (terms, offsets, docs, tfs), terms sorted"""
+        keys = sorted(self.postings)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        docs = array("I")
+        tfs = array("H")
+        for i, key in enumerate(keys):
+            term_docs, term_tfs = self.postings[key]
+            docs.extend(term_docs)
+            tfs.extend(term_tfs)
+            offsets[i + 1] = len(docs)
+        return (
+            np.array(keys, dtype=np.int64),
+            offsets,
+            np.frombuffer(docs, dtype=np.uint32) if docs else np.zeros(0, np.uint32),
+            np.frombuffer(tfs, dtype=np.uint16) if tfs else np.zeros(0, np.uint16)
+        )
+
+    def spill(self):
+        """Write the buffered postings to a sorted run on disk and free them"""
+        if not self.postings:
+            return
+        if self._spill_dir is None:
+            if self._spill_root is not None:
+                self._spill_root.mkdir(parents=True, exist_ok=True)
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="bm25-", dir=self._spill_root))
+
+        run = self._spill_dir / f"run{len(self._runs):05d}"
+        run.mkdir()
+        for name, values in zip(("terms", "offsets", "docs", "tfs"), self._buffered_arrays()):
+            np.save(run / f"{name}.npy", values)
+        self._runs.append(run)
+        self.postings = {}
+        self._buffered = 0
+
+    def _merge_runs(self, path: Path) -> int:
+        """
+        Merge the spilled runs into the index files; returns the term count
+
+        Doc numbers grow from run to run, so a term's merged postings are its
+        runs' postings concatenated in run order.
+        """
+        runs = [
+            (np.load(run / "terms.npy"), np.load(run / "offsets.npy"))
+            for run in self._runs
+        ]
+        terms = np.unique(np.concatenate([run_terms for run_terms, _ in runs]))
+        counts = np.zeros(len(terms), dtype=np.int64)
+        for run_terms, run_offsets in runs:
+            counts[np.searchsorted(terms, run_terms)] += np.diff(run_offsets)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        total = int(offsets[-1])
+        docs = np.lib.format.open_memmap(path / "docs.npy", mode="w+", dtype=np.uint32, shape=(total,))
+        tfs = np.lib.format.open_memmap(path / "tfs.npy", mode="w+", dtype=np.uint16, shape=(total,))
+        cursor = offsets[:-1].copy()
+        for run, (run_terms, run_offsets) in zip(self._runs, runs):
+            positions = np.searchsorted(terms, run_terms)
+            lengths = np.diff(run_offsets)
+            # Destination of each posting: its term's cursor plus its rank in the run's term slice
+            dest = np.repeat(cursor[positions] - run_offsets[:-1], lengths) + np.arange(run_offsets[-1])
+            docs[dest] = np.load(run / "docs.npy")
+            tfs[dest] = np.load(run / "tfs.npy")
+            cursor[positions] += lengths
+        docs.flush()
+        tfs.flush()
+        del docs, tfs
+
+        np.save(path / "terms.npy", terms)
+        np.save(path / "offsets.npy", offsets)
+        return len(terms)
+
+    def write(self, path: Union[str, Path]):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        if self._runs:
+            self.spill()
+            try:
+                num_terms = self._merge_runs(path)
+            finally:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+                self._runs = []
+        else:
+            terms, offsets, docs, tfs = self._buffered_arrays()
+            np.save(path / "terms.npy", terms)
+            np.save(path / "offsets.npy", offsets)
+            np.save(path / "docs.npy", docs)
+            np.save(path / "tfs.npy", tfs)
+            num_terms = len(terms)
+        np.save(path / "doc_lens.npy", np.frombuffer(self.doc_lens, dtype=np.uint32) if self.doc_lens else np.zeros(0, np.uint32))
+
+        int_ids = all(isinstance(i, int) for i in self.ids)
+        if int_ids:
+            np.save(path / "ids.npy", np.array(self.ids, dtype=np.uint64))
+        else:
+            (path / "ids.json").write_text(json.dumps(self.ids))
+
+        total = sum(self.doc_lens)
+        (path / "meta.json").write_text(json.dumps({
+            "docs": len(self.ids),
+            "terms": num_terms,
+            "avg_doc_len": total / max(len(self.ids), 1),
+            "id_type": "int" if int_ids else "str"
+        }))
+        logger.info(f"Wrote BM25 index to {path} ({len(self.ids)} docs, {num_terms} terms)")
+
+
+class BM25Index:
+    """Read-only BM25 index over memory-mapped postings"""
+
+    def __init__(self, path: Union[str, Path], k1: float = 1.2, b: float = 0.75):
+        path = Path(path)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        meta = json.loads((path / "meta.json").read_text())
+        self.num_docs = meta["docs"]
+        self.avg_doc_len = meta["avg_doc_len"] or 1.0
+
+        self.terms = np.load(path / "terms.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.docs = np.load(path / "docs.npy", mmap_mode="r")
+        self.tfs = np.load(path / "tfs.npy", mmap_mode="r")
+        self.doc_lens = np.load(path / "doc_lens.npy", mmap_mode="r")
+        if meta["id_type"] == "int":
+            self.ids = np.load(path / "ids.npy", mmap_mode="r")
+        else:
+            self.ids = json.loads((path / "ids.json").read_text())
+
+    def _postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        key = term_hash(term)
+        i = int(np.searchsorted(self.terms, key))
+        if i >= len(self.terms) or self.terms[i] != key:
+            return None
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.docs[start:end], self.tfs[start:end]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[PointId, float]]:
+        """Return (point id, BM25 score) pairs, best first"""
+        doc_parts, score_parts = [], []
+
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if postings is None:
+                continue
+            docs, tfs = postings
+            df = len(docs)
+            idf = np.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            tf = tfs.astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[docs] / self.avg_doc_len)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+        if not doc_parts:
+            return []
+
+        unique_docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            point_id = self.ids[int(unique_docs[i])]
+            results.append((int(point_id) if isinstance(point_id, np.integer) else point_id, float(scores[i])))
+        return results
+
+
+def reciprocal_rank_fusion(rankings: List[List[PointId]], k: int = 60) -> Dict[PointId, float]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank)"""
+    fused: Dict[PointId, float] = {}
+    for ranking in rankings:
+        for rank, point_id in enumerate(ranking, start=1):
+            fused[point_id] = fused.get(point_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def lexical_index_dir() -> Path:
+    return Path(os.getenv("LEXICAL_INDEX_DIR", str(DEFAULT_INDEX_DIR)))
+
+
+def load_lexical_index(collection: str) -> Optional[BM25Index]:
+    """Load a collection's BM25 index, or None when it was never built"""
+    path = lexical_index_dir() / collection
+    if not (path / "meta.json").exists():
+        return None
+    try:
+        return BM25Index(path)
+    except Exception as e:
+        logger.warning(f"Could not load BM25 index {path}: {e}")
+        return None
+
+
+def build_lexical_index_from_qdrant(client, collection: str, batch_size: int = 1000, chunk_store=None) -> int:
+    """
+    Rebuild a collection's BM25 index from the texto payloads stored in Qdrant
+
+    Points stored with lean payloads take their texto from chunk_store.
+    """
+    builder = BM25IndexBuilder()
+    offset = None
+
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["texto"],
+            with_vectors=False
+        )
+        lean = [point.id for point in points if "texto" not in (point.payload or {})]
+        stored = chunk_store.get_many(collection, lean) if (chunk_store and lean) else {}
+        for point in points:
+            builder.add(point.id, (point.payload or {}).get("texto", stored.get(point.id, "")))
+        if offset is None:
+            break
+
+    builder.write(lexical_index_dir() / collection)
+    return len(builder)
@@ -0,0 +1,205 @@
+"""
+Async LLM gateway for Doutora IA
+Non-blocking chat completions with per-backend concurrency limits
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import TYPE_CHECKING, List, Dict, Optional, AsyncIterator
+
+# openai/httpx are imported with the first client: they weigh on the API cold start
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class LLMQueueFullError(Exception):
+    """Raised when too many requests are already waiting for a backend"""
+    pass
+
+
+class LLMGateway:
+    """
+    Async gateway to an OpenAI-compatible backend (Ollama / vLLM)
+
+    Generations run on an async client with explicit timeouts, so a slow
+    completion never blocks the event loop. A semaphore caps concurrent
+    generations per backend; callers beyond the cap wait in a bounded
+    queue whose wait times are recorded.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        self.base_url = base_url or os.getenv("VLLM_BASE_URL", "http://localhost:11434/v1")
+        self.api_key = api_key or os.getenv("VLLM_API_KEY", "ollama")
+        self.model = model or os.getenv("VLLM_MODEL", "llama3.1:8b")
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("LLM_MAX_QUEUE", "20"))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "180"))
+
+        self._client = None
+        self._semaphore = None
+
+        # Metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.total_generation_time = 0.0
+        self.streams = 0
+        self.total_first_token_time = 0.0
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """Lazy async client (created inside the running process/loop)"""
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                max_retries=0
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _acquire(self):
+        """Wait for a generation slot, recording queue wait time"""
+        if self.waiting >= self.max_queue and self.semaphore.locked():
+            self.rejected += 1
+            raise LLMQueueFullError(f"LLM queue full ({self.waiting} waiting)")
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - started
+        self.total_wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        self.in_flight += 1
+        self.requests += 1
+
+    def _release(self, started: float):
+        self.in_flight -= 1
+        self.total_generation_time += time.perf_counter() - started
+        self.semaphore.release()
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 4096
+    ) -> str:
+        """Run a chat completion and return the message content"""
+        await self._acquire()
+        started = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            return response.choices[0].message.content
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._release(started)
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 4096
+    ) -> AsyncIterator[str]:
+        """Run a streaming chat completion, yielding content deltas as they arrive"""
+        await self._acquire()
+        started = time.perf_counter()
+        first_token = True
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token:
+                    first_token = False
+                    self.streams += 1
+                    self.total_first_token_time += time.perf_counter() - started
+                yield delta
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._release(started)
+
+    async def ping(self, timeout: float = 5.0) -> bool:
+        """Check that the backend answers, without waiting for a generation slot"""
+        try:
+            await asyncio.wait_for(self.client.models.list(), timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"LLM backend {self.base_url} unreachable: {e}")
+            return False
+
+    def get_stats(self) -> dict:
+        """Get concurrency and queue wait metrics"""
+        return {
+            "backend": self.base_url,
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_wait_ms": round(self.total_wait_time / max(self.requests, 1) * 1000, 2),
+            "max_wait_ms": round(self.max_wait_time * 1000, 2),
+            "avg_generation_ms": round(self.total_generation_time / max(self.requests, 1) * 1000, 2),
+            "avg_first_token_ms": round(self.total_first_token_time / max(self.streams, 1) * 1000, 2)
+        }
+
+
+# One gateway (and therefore one concurrency limit) per backend URL
+_gateways: Dict[str, LLMGateway] = {}
+
+
+def get_llm_gateway(base_url: Optional[str] = None) -> LLMGateway:
+    """Get or create the gateway for a backend"""
+    base_url = base_url or os.getenv("VLLM_BASE_URL", "http://localhost:11434/v1")
+    if base_url not in _gateways:
+        _gateways[base_url] = LLMGateway(base_url=base_url)
+    return _gateways[base_url]
@@ -0,0 +1,509 @@
+"""
+Embedded vector index backend for Doutora IA
+Memory-mapped float16 vectors plus a SQLite payload store, no Qdrant required
+
+LocalIndexClient implements the part of the QdrantClient API that RAGSystem
+and its services use (collections, payload indexes, upsert, search,
+retrieve, scroll, set_payload, delete_payload), taking and returning the same
+qdrant_client.models types. That API is the index backend interface:
+RAGSystem.client is either a QdrantClient or a LocalIndexClient
+(VECTOR_BACKEND), and callers do not need to know which.
+
+Search is exact: cosine scores for every point via blocked NumPy dot
+products over the memory-mapped matrix, then a partial sort for the top-k.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+from qdrant_client.models import (
+    Filter, FieldCondition, IsEmptyCondition, IsNullCondition, HasIdCondition,
+    MatchValue, MatchAny, ScoredPoint, Record, PayloadSchemaType,
+    PayloadSelectorInclude, PayloadSelectorExclude
+)
+
+from .collection_profile import FULL_VECTOR, full_vector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parents[2] / "data" / "vectors"
+
+PointId = Union[int, str]
+
+# Rows scored per NumPy block (bounds the float32 working copy)
+BLOCK_ROWS = 65536
+
+# Filtered search: first best-first window is limit * FILTER_WINDOW_FACTOR
+# candidates, grown by the same factor while too few of them pass the filter
+FILTER_WINDOW_FACTOR = 4
+
+
+def local_index_dir() -> Path:
+    return Path(os.getenv("LOCAL_INDEX_DIR", str(DEFAULT_INDEX_DIR)))
+
+
+def has_local_index(path: Optional[Path] = None) -> bool:
+    """Whether at least one collection was written to the local index"""
+    path = Path(path or local_index_dir())
+    return path.is_dir() and any((child / "meta.json").exists() for child in path.iterdir())
+
+
+def _values(payload: Dict, key: str) -> list:
+    """Values stored under a (dotted) payload key, flattened like Qdrant does"""
+    value = payload
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return []
+        value = value.get(part)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _select(payload: Dict, with_payload) -> Optional[Dict]:
+    """Apply a Qdrant with_payload selector (bool, key list, include/exclude)"""
+    if with_payload is True:
+        return payload
+    if not with_payload:
+        return None
+    if isinstance(with_payload, PayloadSelectorExclude):
+        return {key: value for key, value in payload.items() if key not in with_payload.exclude}
+    if isinstance(with_payload, PayloadSelectorInclude):
+        with_payload = with_payload.include
+    return {key: payload[key] for key in with_payload if key in payload}
+
+
+class LocalCollection:
+    """
+    One collection on disk:
+
+        meta.json      vector size, distance and indexed payload fields
+        vectors.f16    row-major float16 matrix, normalized, one row per point
+        points.sqlite  position -> point id, payload and indexed fields
+
+    Indexed fields are kept in memory so filters on them never touch disk;
+    filters on other keys read the payload of the candidate points.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        self.dim = int(self.meta["size"])
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path / "points.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            " pos INTEGER PRIMARY KEY, point_id TEXT NOT NULL UNIQUE,"
+            " payload TEXT NOT NULL, fields TEXT NOT NULL)"
+        )
+        self._vectors = None
+
+        self.ids: List[PointId] = []
+        self.fields: List[Dict] = []
+        for point_id, fields in self._conn.execute("SELECT point_id, fields FROM points ORDER BY pos"):
+            self.ids.append(json.loads(point_id))
+            self.fields.append(json.loads(fields))
+        self.positions = {point_id: pos for pos, point_id in enumerate(self.ids)}
+
+    @classmethod
+    def create(cls, path: Path, size: int, distance: str = "Cosine") -> "LocalCollection":
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / "vectors.f16").touch()
+        (path / "meta.json").write_text(json.dumps({"size": size, "distance": distance, "indexed_fields": []}))
+        return cls(path)
+
+    @property
+    def indexed_fields(self) -> List[str]:
+        return self.meta["indexed_fields"]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Memory-mapped (points, size) float16 matrix"""
+        with self._lock:
+            if self._vectors is None or len(self._vectors) != len(self.ids):
+                if not self.ids:
+                    return np.zeros((0, self.dim), dtype=np.float16)
+                self._vectors = np.memmap(
+                    self.path / "vectors.f16", dtype=np.float16, mode="r", shape=(len(self.ids), self.dim)
+                )
+            return self._vectors
+
+    def payload(self, pos: int) -> Dict:
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM points WHERE pos = ?", (pos,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _indexed(self, payload: Dict) -> Dict:
+        return {key: payload[key] for key in self.indexed_fields if key in payload}
+
+    # Writes
+
+    def upsert(self, points: Sequence) -> int:
+        """Insert or overwrite points (PointStruct-like: id, vector, payload)"""
+        with self._lock:
+            vectors = np.asarray([full_vector(point.vector) for point in points], dtype=np.float32).reshape(-1, self.dim)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = (vectors / np.maximum(norms, 1e-12)).astype(np.float16)
+
+            rows = []
+            with open(self.path / "vectors.f16", "r+b") as f:
+                for point, vector in zip(points, vectors):
+                    payload = dict(point.payload or {})
+                    pos = self.positions.get(point.id)
+                    if pos is None:
+                        pos = len(self.ids)
+                        self.ids.append(point.id)
+                        self.fields.append({})
+                        self.positions[point.id] = pos
+                    f.seek(pos * self.dim * 2)
+                    f.write(vector.tobytes())
+                    self.fields[pos] = self._indexed(payload)
+                    rows.append((pos, json.dumps(point.id), json.dumps(payload), json.dumps(self.fields[pos])))
+
+            self._conn.executemany("INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._vectors = None
+            return len(rows)
+
+    def set_payload(self, payload: Dict, ids: Iterable[PointId]):
+        with self._lock:
+            rows = []
+            for point_id in ids:
+                pos = self.positions.get(point_id)
+                if pos is None:
+                    continue
+                merged = {**self.payload(pos), **payload}
+                self.fields[pos] = self._indexed(merged)
+                rows.append((json.dumps(merged), json.dumps(self.fields[pos]), pos))
+            self._conn.executemany("UPDATE points SET payload = ?, fields = ? WHERE pos = ?", rows)
+            self._conn.commit()
+
+    def delete_payload(self, keys: Sequence[str], ids: Iterable[PointId]):
+        with self._lock:
+            rows = []
+            for point_id in ids:
+                pos = self.positions.get(point_id)
+                if pos is None:
+                    continue
+                remaining = {k: v for k, v in self.payload(pos).items() if k not in keys}
+                self.fields[pos] = self._indexed(remaining)
+                rows.append((json.dumps(remaining), json.dumps(self.fields[pos]), pos))
+            self._conn.executemany("UPDATE points SET payload = ?, fields = ? WHERE pos = ?", rows)
+            self._conn.commit()
+
+    def create_payload_index(self, field: str):
+        """Keep a payload field in memory for filtering"""
+        with self._lock:
+            if field in self.indexed_fields:
+                return
+            self.indexed_fields.append(field)
+            (self.path / "meta.json").write_text(json.dumps(self.meta))
+
+            rows = []
+            for pos in range(len(self.ids)):
+                self.fields[pos] = self._indexed(self.payload(pos))
+                rows.append((json.dumps(self.fields[pos]), pos))
+            self._conn.executemany("UPDATE points SET fields = ? WHERE pos = ?", rows)
+            self._conn.commit()
+
+    # Filtering
+
+    def matches(self, condition, pos: int, cache: Optional[Dict] = None) -> bool:
+        """
+        Evaluate a Qdrant filter condition against a point
+
+        cache is shared by the evaluations of one query: it holds the
+        payloads read for non-indexed fields and the has_id sets.
+        """
+        if isinstance(condition, Filter):
+            if condition.must and not all(self.matches(c, pos, cache) for c in condition.must):
+                return False
+            if condition.must_not and any(self.matches(c, pos, cache) for c in condition.must_not):
+                return False
+            if condition.should and not any(self.matches(c, pos, cache) for c in condition.should):
+                return False
+            return True
+
+        if isinstance(condition, HasIdCondition):
+            if cache is None:
+                return self.ids[pos] in set(condition.has_id)
+            key = ("has_id", id(condition))
+            if key not in cache:
+                cache[key] = set(condition.has_id)
+            return self.ids[pos] in cache[key]
+
+        if isinstance(condition, IsEmptyCondition):
+            return not self._field_values(condition.is_empty.key, pos, cache)
+        if isinstance(condition, IsNullCondition):
+            return self._field_values(condition.is_null.key, pos, cache) == []
+
+        if isinstance(condition, FieldCondition):
+            values = self._field_values(condition.key, pos, cache)
+            if condition.match is not None:
+                if isinstance(condition.match, MatchValue):
+                    return condition.match.value in values
+                if isinstance(condition.match, MatchAny):
+                    return any(value in condition.match.any for value in values)
+            if condition.range is not None:
+                r = condition.range
+                return any(
+                    isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and (r.gt is None or value > r.gt) and (r.gte is None or value >= r.gte)
+                    and (r.lt is None or value < r.lt) and (r.lte is None or value <= r.lte)
+                    for value in values
+                )
+
+        raise NotImplementedError(f"Local index does not support filter condition {type(condition).__name__}")
+
+    def _field_values(self, key: str, pos: int, cache: Optional[Dict]) -> list:
+        root = key.split(".", 1)[0]
+        if root in self.indexed_fields:
+            return _values(self.fields[pos], key)
+        # Not indexed: read the payload once per point and query
+        if cache is None:
+            return _values(self.payload(pos), key)
+        if pos not in cache:
+            cache[pos] = self.payload(pos)
+        return _values(cache[pos], key)
+
+    # Reads
+
+    def scores(self, query_vector: Sequence[float]) -> np.ndarray:
+        """Cosine similarity of the query to every point"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        vectors = self.vectors
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ query
+        return scores
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        query_filter: Optional[Filter] = None,
+        limit: int = 10,
+        offset: int = 0,
+        score_threshold: Optional[float] = None
+    ) -> List[tuple]:
+        """Exact top-k (position, score) pairs, best first"""
+        scores = self.scores(query_vector)
+        wanted = limit + (offset or 0)
+        if score_threshold is not None:
+            candidates = np.flatnonzero(scores >= score_threshold)
+        else:
+            candidates = np.arange(len(scores))
+
+        if query_filter is None:
+            if len(candidates) > wanted:
+                top = np.argpartition(-scores[candidates], wanted - 1)[:wanted]
+                candidates = candidates[top]
+            ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(int(pos), float(scores[pos])) for pos in ordered[offset:wanted]]
+
+        # Walk candidates best-first until enough of them pass the filter,
+        # sorting only a growing top window instead of every candidate
+        candidate_scores = scores[candidates]
+        cache = {}
+        hits = []
+        upper = np.inf
+        window = wanted * FILTER_WINDOW_FACTOR
+        while True:
+            if window < len(candidates):
+                lower = np.partition(candidate_scores, len(candidates) - window)[len(candidates) - window]
+            else:
+                lower = -np.inf
+            # Scores in [lower, upper): the window minus what earlier windows checked
+            band = candidates[(candidate_scores >= lower) & (candidate_scores < upper)]
+            for pos in band[np.argsort(-scores[band], kind="stable")]:
+                if self.matches(query_filter, int(pos), cache):
+                    hits.append((int(pos), float(scores[pos])))
+                    if len(hits) >= wanted:
+                        return hits[offset:]
+            if lower == -np.inf:
+                return hits[offset:]
+            upper = lower
+            window *= FILTER_WINDOW_FACTOR
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class LocalIndexClient:
+    """QdrantClient-compatible facade over a directory of LocalCollections"""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        self.path = Path(path or local_index_dir())
+        self._lock = threading.Lock()
+        self._collections: Dict[str, LocalCollection] = {}
+
+    def _collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            if name not in self._collections:
+                if not (self.path / name / "meta.json").exists():
+                    raise ValueError(f"Collection {name} not found in local index {self.path}")
+                self._collections[name] = LocalCollection(self.path / name)
+            return self._collections[name]
+
+    def get_collections(self):
+        names = sorted(p.name for p in self.path.iterdir() if (p / "meta.json").exists()) if self.path.is_dir() else []
+        return SimpleNamespace(collections=[SimpleNamespace(name=name) for name in names])
+
+    def get_collection(self, collection_name: str):
+        collection = self._collection(collection_name)
+        return SimpleNamespace(
+            status="green",
+            points_count=len(collection),
+            vectors_count=len(collection),
+            payload_schema={field: PayloadSchemaType.KEYWORD for field in collection.indexed_fields},
+            config=SimpleNamespace(params=SimpleNamespace(
+                vectors=SimpleNamespace(size=collection.dim, distance=collection.meta["distance"])
+            ))
+        )
+
+    def create_collection(self, collection_name: str, vectors_config, **kwargs):
+        # Matryoshka layouts keep only the full vector (search here is exact anyway)
+        if isinstance(vectors_config, dict):
+            vectors_config = vectors_config[FULL_VECTOR]
+        with self._lock:
+            self._collections[collection_name] = LocalCollection.create(
+                self.path / collection_name,
+                size=vectors_config.size,
+                distance=str(getattr(vectors_config.distance, "value", vectors_config.distance))
+            )
+        return True
+
+    def update_collection(self, collection_name: str, **kwargs):
+        """Storage settings (quantization, on-disk) do not apply locally"""
+        self._collection(collection_name)
+        return True
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        self._collection(collection_name).create_payload_index(field_name)
+
+    def upsert(self, collection_name: str, points: Sequence, wait: bool = True, **kwargs):
+        self._collection(collection_name).upsert(points)
+
+    def set_payload(self, collection_name: str, payload: Dict, points: Iterable[PointId], **kwargs):
+        self._collection(collection_name).set_payload(payload, points)
+
+    def delete_payload(self, collection_name: str, keys: Sequence[str], points: Iterable[PointId], **kwargs):
+        self._collection(collection_name).delete_payload(keys, points)
+
+    def search(
+        self,
+        collection_name: str,
+        query_vector: Sequence[float],
+        query_filter: Optional[Filter] = None,
+        search_params=None,
+        limit: int = 10,
+        offset: int = 0,
+        with_payload=True,
+        with_vectors: bool = False,
+        score_threshold: Optional[float] = None,
+        **kwargs
+    ) -> List[ScoredPoint]:
+        collection = self._collection(collection_name)
+        hits = collection.search(query_vector, query_filter, limit, offset, score_threshold)
+        return [
+            ScoredPoint(
+                id=collection.ids[pos],
+                version=0,
+                score=score,
+                payload=_select(collection.payload(pos), with_payload) if with_payload else None,
+                vector=collection.vectors[pos].astype(np.float32).tolist() if with_vectors else None
+            )
+            for pos, score in hits
+        ]
+
+    def retrieve(
+        self,
+        collection_name: str,
+        ids: Sequence[PointId],
+        with_payload=True,
+        with_vectors: bool = False,
+        **kwargs
+    ) -> List[Record]:
+        collection = self._collection(collection_name)
+        positions = [collection.positions[point_id] for point_id in ids if point_id in collection.positions]
+        return [self._record(collection, pos, with_payload, with_vectors) for pos in positions]
+
+    def scroll(
+        self,
+        collection_name: str,
+        scroll_filter: Optional[Filter] = None,
+        limit: int = 10,
+        offset: Optional[PointId] = None,
+        with_payload=True,
+        with_vectors: bool = False,
+        **kwargs
+    ):
+        collection = self._collection(collection_name)
+        start = collection.positions.get(offset, 0) if offset is not None else 0
+
+        records, cache = [], {}
+        pos = start
+        while pos < len(collection) and len(records) < limit:
+            if scroll_filter is None or collection.matches(scroll_filter, pos, cache):
+                records.append(self._record(collection, pos, with_payload, with_vectors))
+            pos += 1
+
+        next_offset = collection.ids[pos] if pos < len(collection) else None
+        return records, next_offset
+
+    @staticmethod
+    def _record(collection: LocalCollection, pos: int, with_payload, with_vectors) -> Record:
+        return Record(
+            id=collection.ids[pos],
+            payload=_select(collection.payload(pos), with_payload) if with_payload else None,
+            vector=collection.vectors[pos].astype(np.float32).tolist() if with_vectors else None
+        )
+
+
+def export_from_qdrant(
+    source,
+    target: LocalIndexClient,
+    collections: Iterable[str],
+    batch_size: int = 256
+) -> Dict[str, int]:
+    """
+    Copy collections (vectors, payloads, payload indexes) from a running
+    Qdrant into the local index; returns points copied per collection
+    """
+    copied = {}
+    for name in collections:
+        info = source.get_collection(name)
+        vectors = info.config.params.vectors
+        try:
+            target.get_collection(name)
+        except ValueError:
+            target.create_collection(name, vectors_config=vectors)
+        for field in (info.payload_schema or {}):
+            target.create_payload_index(name, field)
+
+        copied[name] = 0
+        offset = None
+        while True:
+            points, offset = source.scroll(
+                collection_name=name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if points:
+                target.upsert(name, points)
+                copied[name] += len(points)
+            if offset is None:
+                break
+        logger.info(f"Exported {copied[name]} points of {name} to {target.path}")
+    return copied
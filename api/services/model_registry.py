@@ -0,0 +1,209 @@
+"""
+Embedding model registry for Doutora IA
+One shared encoder per (model, device, dtype, backend) per process
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, NamedTuple, Optional
+
+from .encoder_backend import has_onnx_export, load_encoder, onnx_model_dir, ONNX_MODEL_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class ModelKey(NamedTuple):
+    model: str
+    device: str
+    dtype: str
+    backend: str
+
+    def __str__(self):
+        return f"{self.model}@{self.device}/{self.dtype}/{self.backend}"
+
+    @property
+    def cache_id(self) -> str:
+        """Model identity for cached vectors: int8 ONNX and float32 PyTorch vectors differ"""
+        return f"{self.model}/{self.dtype}/{self.backend}"
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of the process (0 when unknown)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _onnx_available() -> bool:
+    try:
+        import onnxruntime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _weights_bytes(encoder, key: ModelKey) -> int:
+    """Bytes of model weights held by the encoder"""
+    if key.backend == "onnx":
+        return (onnx_model_dir(key.model) / ONNX_MODEL_FILE).stat().st_size
+    try:
+        tensors = list(encoder.parameters()) + list(encoder.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except AttributeError:
+        return 0
+
+
+class SharedEncoder:
+    """
+    Thread-safe handle on a registry encoder
+
+    encode() calls are serialized: HuggingFace fast tokenizers are not safe
+    for concurrent use, and parallel forward passes on the same CPU cores
+    do not add throughput. Every other attribute passes through.
+    """
+
+    def __init__(self, encoder, key: ModelKey):
+        self._encoder = encoder
+        self._lock = threading.Lock()
+        self.key = key
+        self.backend = key.backend
+
+    def encode(self, *args, **kwargs):
+        with self._lock:
+            return self._encoder.encode(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._encoder, name)
+
+
+class _Entry:
+    def __init__(self):
+        self.future: Future = Future()
+        self.started = time.perf_counter()
+        self.load_time: Optional[float] = None
+        self.rss_delta = 0
+        self.weights = 0
+
+
+def ingest_backend() -> str:
+    """
+    Backend that encodes the passages stored in the collections
+
+    Every stored vector must come from the same backend, whichever script
+    ingested it, so this is pinned (EMBEDDING_INGEST_BACKEND, PyTorch by
+    default) instead of following the query-side EMBEDDING_BACKEND.
+    """
+    return os.getenv("EMBEDDING_INGEST_BACKEND", "torch").lower()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded encoders
+
+    The first get() (or warm_up()) of a key loads the model; concurrent
+    callers of the same key wait for that load instead of starting their
+    own. Requests are normalized first, so "auto" and the backend it
+    resolves to share one model.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[ModelKey, _Entry] = {}
+
+    def resolve(
+        self,
+        model: str,
+        device: Optional[str] = None,
+        dtype: Optional[str] = None,
+        backend: Optional[str] = None
+    ) -> ModelKey:
+        """Fill defaults from the environment and resolve the auto backend"""
+        device = device or os.getenv("EMBEDDING_DEVICE", "cpu")
+        backend = (backend or os.getenv("EMBEDDING_BACKEND", "auto")).lower()
+        if backend in ("auto", "onnx"):
+            use_onnx = device == "cpu" and has_onnx_export(model) and _onnx_available()
+            if backend == "onnx" and not use_onnx:
+                logger.warning(f"ONNX backend unavailable for {model} on {device}, using PyTorch")
+            backend = "onnx" if use_onnx else "torch"
+        if backend == "onnx":
+            dtype = "int8"
+        return ModelKey(model, device, (dtype or os.getenv("EMBEDDING_DTYPE", "float32")).lower(), backend)
+
+    def _load(self, key: ModelKey, entry: _Entry, warm: bool = False):
+        rss_before = _rss_bytes()
+        try:
+            encoder = load_encoder(key.model, key.device, backend=key.backend)
+            if key.backend == "torch" and key.dtype == "float16":
+                encoder.half()
+            if warm:
+                # First forward pass allocates buffers and picks kernels
+                encoder.encode(["query: aquecimento"])
+        except Exception as e:
+            logger.error(f"Could not load embedding model {key}: {e}")
+            entry.future.set_exception(e)
+            return
+
+        entry.load_time = time.perf_counter() - entry.started
+        entry.rss_delta = max(_rss_bytes() - rss_before, 0)
+        entry.weights = _weights_bytes(encoder, key)
+        logger.info(f"Loaded embedding model {key} in {entry.load_time:.1f}s")
+        entry.future.set_result(SharedEncoder(encoder, key))
+
+    def _entry(self, key: ModelKey, background: bool) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            # A failed load is retried by the next caller
+            if entry is not None and not (entry.future.done() and entry.future.exception()):
+                return entry
+            entry = self._entries[key] = _Entry()
+
+        if background:
+            threading.Thread(
+                target=self._load, args=(key, entry, True), name=f"warm-up-{key.model}", daemon=True
+            ).start()
+        else:
+            self._load(key, entry)
+        return entry
+
+    def get(self, model: str, device: Optional[str] = None, dtype: Optional[str] = None,
+            backend: Optional[str] = None) -> SharedEncoder:
+        """Shared encoder for the key, loading it (or waiting for its load) if needed"""
+        return self._entry(self.resolve(model, device, dtype, backend), background=False).future.result()
+
+    def warm_up(self, model: str, device: Optional[str] = None, dtype: Optional[str] = None,
+                backend: Optional[str] = None) -> Future:
+        """Start loading the model in a background thread; returns a future of the encoder"""
+        return self._entry(self.resolve(model, device, dtype, backend), background=True).future
+
+    def is_ready(self, model: str, device: Optional[str] = None, dtype: Optional[str] = None,
+                 backend: Optional[str] = None) -> bool:
+        entry = self._entries.get(self.resolve(model, device, dtype, backend))
+        return entry is not None and entry.future.done() and entry.future.exception() is None
+
+    def get_stats(self) -> dict:
+        stats = {}
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, entry in entries:
+            if not entry.future.done():
+                state = "loading"
+            elif entry.future.exception() is not None:
+                state = "failed"
+            else:
+                state = "ready"
+            stats[str(key)] = {
+                "state": state,
+                "load_time_s": round(entry.load_time, 2) if entry.load_time is not None else None,
+                "weights_mb": round(entry.weights / 1e6, 1),
+                "rss_delta_mb": round(entry.rss_delta / 1e6, 1)
+            }
+        return {"models": stats, "process_rss_mb": round(_rss_bytes() / 1e6, 1)}
+
+
+# Shared by every service of the process
+model_registry = ModelRegistry()
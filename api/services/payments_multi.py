@@ -10,7 +10,6 @@ import hmac
 import json
 from typing import Dict, Any, Optional
 from datetime import datetime
-import mercadopago
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +27,7 @@ class MultiPaymentService:
         # Initialize Mercado Pago
         if os.getenv("MERCADO_PAGO_ACCESS_TOKEN"):
             try:
+                import mercadopago
                 self.mp_sdk = mercadopago.SDK(os.getenv("MERCADO_PAGO_ACCESS_TOKEN"))
                 self.mp_webhook_secret = os.getenv("MERCADO_PAGO_WEBHOOK_SECRET", "")
                 self.providers.append("mercado_pago")
@@ -0,0 +1,80 @@
+"""
+Preload mode for Doutora IA (gunicorn --preload)
+Model weights are loaded once in the master and shared copy-on-write by the forked workers
+
+Only read-only state is loaded before fork. Everything that owns threads,
+sockets or file handles (inference thread pools, embedding batchers,
+Qdrant/Redis/DB connections, SQLite handles) is created lazily and dropped
+in each child by the os.register_at_fork hooks of its owner module.
+"""
+
+import gc
+import os
+import sys
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def preload_enabled() -> bool:
+    return os.getenv("PRELOAD_MODELS", "false").lower() == "true"
+
+
+def worker_threads() -> int:
+    """Inference threads per worker: EMBEDDING_TORCH_THREADS, or the cores split among the workers"""
+    configured = int(os.getenv("EMBEDDING_TORCH_THREADS", "0"))
+    if configured:
+        return configured
+    workers = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+    return max((os.cpu_count() or 1) // workers, 1)
+
+
+def preload_models(model_name: str, device: Optional[str] = None):
+    """
+    Load the embedding model in the master process, before the workers fork
+
+    PyTorch runs single-threaded here, so no OpenMP pool exists at fork
+    time; each worker sets its own thread count after fork. ONNX Runtime
+    sessions own their thread pool from creation and are not fork-safe, so
+    with the ONNX backend the session is created in each worker instead.
+    Returns the shared encoder (None when loading is left to the workers).
+    """
+    from .model_registry import model_registry, _rss_bytes
+
+    key = model_registry.resolve(model_name, device)
+    if key.backend != "torch":
+        logger.info(f"Preload: {key} is created per worker after fork ({key.backend} is not fork-safe)")
+        return None
+
+    import torch
+    torch.set_num_threads(1)
+
+    rss_before = _rss_bytes()
+    encoder = model_registry.get(model_name, device)
+
+    # Keep the collector from touching (and so copying) objects created before fork
+    gc.collect()
+    gc.freeze()
+
+    logger.info(
+        f"Preload: {key} loaded in the master "
+        f"(+{(_rss_bytes() - rss_before) / 1e6:.0f} MB, shared by every worker)"
+    )
+    return encoder
+
+
+def check_single_threaded():
+    """Warn when the master runs other threads at fork time (their locks could be copied held)"""
+    others = [t.name for t in threading.enumerate() if t is not threading.main_thread()]
+    if others:
+        logger.warning(f"Forking with live threads in the master: {others}")
+
+
+def _after_fork_in_child():
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(worker_threads())
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,184 @@
+"""
+Semantic answer cache for case analyses
+Reuses a stored analysis when a new description is a close paraphrase
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from typing import Optional
+
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, Range
+)
+
+from services.cache import cache_analysis, get_cached_analysis, EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnalysisCache:
+    """
+    Two-step cache in front of the triage LLM call
+
+    1. Exact match on the description (Redis, via cache_analysis helpers)
+    2. Nearest stored description in a small Qdrant collection; a hit above
+       the cosine threshold, for the same corpus version and detail level,
+       returns the stored structured analysis.
+
+    Both tiers are keyed by corpus version and scope. With the default
+    SEMANTIC_CACHE_SCOPE=user, analyses are only reused for the same user
+    (a hash of user_email) and anonymous requests bypass the cache;
+    "global" shares analyses between all users. The cache is opt-in
+    (SEMANTIC_CACHE_ENABLED) and never stores the description itself in
+    Qdrant, only its vector.
+
+    Query embeddings come from RAGSystem.encode_text, so the vector is
+    shared with the retrieval step that follows a miss.
+    """
+
+    def __init__(
+        self,
+        rag,
+        collection: Optional[str] = None,
+        threshold: Optional[float] = None,
+        corpus_version: Optional[str] = None,
+        expire: Optional[int] = None
+    ):
+        self.rag = rag
+        self.collection = collection or os.getenv("SEMANTIC_CACHE_COLLECTION", "analysis_cache")
+        self.threshold = threshold or float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.corpus_version = corpus_version or os.getenv("CORPUS_VERSION", "1")
+        self.expire = expire or int(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+        self.enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+        self.scope_mode = os.getenv("SEMANTIC_CACHE_SCOPE", "user").lower()
+        self._collection_ready = False
+
+        # Metrics
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _scope(self, user: Optional[str]) -> Optional[str]:
+        """Cache partition for a request; None when it must not use the cache"""
+        if self.scope_mode == "global":
+            return "global"
+        if not user:
+            return None
+        return hashlib.sha256(user.strip().lower().encode("utf-8")).hexdigest()[:32]
+
+    def _point_id(self, descricao: str, detalhado: bool, scope: str) -> str:
+        """Deterministic point id so re-analyzing the same text overwrites"""
+        raw = f"{self.corpus_version}|{scope}|{detalhado}|{EmbeddingCache.normalize_text(descricao)}"
+        return str(uuid.UUID(hashlib.md5(raw.encode("utf-8")).hexdigest()))
+
+    def _ensure_collection(self, vector_size: int):
+        if self._collection_ready:
+            return
+        try:
+            self.rag.client.get_collection(self.collection)
+        except Exception:
+            self.rag.client.create_collection(
+                collection_name=self.collection,
+                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
+            )
+            logger.info(f"Created semantic cache collection {self.collection}")
+        self._collection_ready = True
+
+    def lookup(self, descricao: str, detalhado: bool, user: Optional[str] = None) -> Optional[dict]:
+        """Return a cached analysis for this (or a near-identical) description of the user's"""
+        if not self.enabled:
+            return None
+        scope = self._scope(user)
+        if scope is None:
+            self.bypassed += 1
+            return None
+
+        cached = get_cached_analysis(descricao, detalhado, self.corpus_version, scope)
+        if cached is not None:
+            self.exact_hits += 1
+            return cached
+
+        if not (self.rag and self.rag.client):
+            self.misses += 1
+            return None
+
+        try:
+            vector = self.rag.encode_text(descricao)
+            self._ensure_collection(len(vector))
+            hits = self.rag.client.search(
+                collection_name=self.collection,
+                query_vector=vector,
+                limit=1,
+                score_threshold=self.threshold,
+                query_filter=Filter(must=[
+                    FieldCondition(key="corpus_version", match=MatchValue(value=self.corpus_version)),
+                    FieldCondition(key="scope", match=MatchValue(value=scope)),
+                    FieldCondition(key="detalhado", match=MatchValue(value=detalhado)),
+                    FieldCondition(key="created_at", range=Range(gte=time.time() - self.expire))
+                ])
+            )
+        except Exception as e:
+            logger.error(f"Semantic cache lookup error: {e}")
+            self.misses += 1
+            return None
+
+        if not hits:
+            self.misses += 1
+            return None
+
+        self.semantic_hits += 1
+        logger.info(f"Semantic cache HIT (score={hits[0].score:.3f})")
+        return hits[0].payload["analysis"]
+
+    def store(self, descricao: str, detalhado: bool, analysis: dict, user: Optional[str] = None):
+        """Store an analysis under its description (exact and semantic tiers)"""
+        scope = self._scope(user)
+        if not self.enabled or scope is None:
+            return
+
+        analysis = json.loads(json.dumps(analysis))
+        cache_analysis(descricao, detalhado, analysis, expire=self.expire,
+                       corpus_version=self.corpus_version, scope=scope)
+
+        if not (self.rag and self.rag.client):
+            return
+
+        try:
+            vector = self.rag.encode_text(descricao)
+            self._ensure_collection(len(vector))
+            self.rag.client.upsert(
+                collection_name=self.collection,
+                points=[PointStruct(
+                    id=self._point_id(descricao, detalhado, scope),
+                    vector=vector,
+                    payload={
+                        "detalhado": detalhado,
+                        "corpus_version": self.corpus_version,
+                        "scope": scope,
+                        "created_at": time.time(),
+                        "analysis": analysis
+                    }
+                )]
+            )
+        except Exception as e:
+            logger.error(f"Semantic cache store error: {e}")
+
+    def get_stats(self) -> dict:
+        """Get hit/miss counters"""
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "enabled": self.enabled,
+            "scope": self.scope_mode,
+            "threshold": self.threshold,
+            "corpus_version": self.corpus_version,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(hits / max(hits + self.misses, 1) * 100, 2)
+        }
@@ -0,0 +1,108 @@
+"""
+Startup tracking for Doutora IA
+Per-phase cold start timings and the readiness flag
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Timeline of the API cold start
+
+    Phases are recorded as offsets from the start of the main.py import, so
+    phases that overlap (the model loading in its own thread while the
+    connections are opened) show up as such. The API serves liveness as
+    soon as it listens; readiness flips with mark_ready() once warm-up is
+    over.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict] = {}
+        self.ready_after: Optional[float] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def begin(self, name: str):
+        with self._lock:
+            self.phases[name] = {
+                "state": "running",
+                "started_s": round(self._elapsed(), 3),
+                "duration_s": None,
+                "error": None
+            }
+
+    def end(self, name: str, error: Optional[BaseException] = None):
+        """Close a running phase (no-op when it is not running)"""
+        with self._lock:
+            record = self.phases.get(name)
+            if record is None or record["state"] != "running":
+                return
+            record["state"] = "failed" if error is not None else "done"
+            record["duration_s"] = round(self._elapsed() - record["started_s"], 3)
+            record["error"] = str(error) if error is not None else None
+        logger.info(f"Startup phase {name}: {record['state']} in {record['duration_s']:.2f}s")
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as a phase; errors are recorded and re-raised"""
+        self.begin(name)
+        try:
+            yield
+        except Exception as e:
+            self.end(name, e)
+            raise
+        self.end(name)
+
+    def track(self, name: str, future: Future) -> Future:
+        """Time a phase that runs in another thread, ending when the future does"""
+        self.begin(name)
+        future.add_done_callback(lambda f: self.end(name, f.exception()))
+        return future
+
+    def mark_ready(self):
+        self.ready_after = self._elapsed()
+        self._ready.set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def failed_phases(self):
+        return [name for name, record in self.phases.items() if record["state"] == "failed"]
+
+    def summary(self) -> str:
+        phases = ", ".join(
+            f"{name} {record['duration_s']:.2f}s" if record["duration_s"] is not None else f"{name} {record['state']}"
+            for name, record in self.phases.items()
+        )
+        ready = f"ready after {self.ready_after:.2f}s" if self.ready_after is not None else "warming up"
+        return f"Startup: {phases} ({ready})"
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            phases = {name: dict(record) for name, record in self.phases.items()}
+        return {
+            "ready": self.is_ready,
+            "ready_after_s": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "uptime_s": round(self._elapsed(), 1),
+            "phases": phases
+        }
+
+
+# Created when main.py starts importing
+startup_report = StartupReport()
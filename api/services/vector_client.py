@@ -0,0 +1,229 @@
+"""
+Qdrant connections for Doutora IA
+Shared sync/async clients (gRPC preferred) with timeouts, retries with jitter and latency metrics
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from functools import partial
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Idempotent calls that are safe to repeat after a transient failure
+RETRYABLE_METHODS = {
+    "search", "search_batch", "retrieve", "scroll", "count",
+    "get_collection", "get_collections",
+    "upsert", "set_payload", "delete_payload", "create_payload_index"
+}
+
+# Latency samples kept per method for the percentiles
+LATENCY_WINDOW = 1024
+
+
+def qdrant_settings() -> Dict:
+    """Connection settings shared by every Qdrant client of the process"""
+    return {
+        "host": os.getenv("QDRANT_HOST", "localhost"),
+        "port": int(os.getenv("QDRANT_PORT", "6333")),
+        "grpc_port": int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+        "prefer_grpc": os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true",
+        "timeout": int(os.getenv("QDRANT_TIMEOUT", "10"))
+    }
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a Qdrant call failed for a reason a retry can fix"""
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+
+    try:
+        from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+        if isinstance(error, ResponseHandlingException):
+            return True
+        if isinstance(error, UnexpectedResponse):
+            return error.status_code == 429 or error.status_code >= 500
+    except ImportError:
+        pass
+
+    try:
+        import grpc
+        if isinstance(error, grpc.RpcError) and hasattr(error, "code"):
+            return error.code() in (
+                grpc.StatusCode.UNAVAILABLE,
+                grpc.StatusCode.DEADLINE_EXCEEDED,
+                grpc.StatusCode.RESOURCE_EXHAUSTED
+            )
+    except ImportError:
+        pass
+
+    try:
+        import httpx
+        return isinstance(error, httpx.TransportError)
+    except ImportError:
+        return False
+
+
+class ClientMetrics:
+    """Per-method call counts, errors, retries and latency percentiles"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods: Dict[str, Dict] = {}
+
+    def _method(self, name: str) -> Dict:
+        if name not in self._methods:
+            self._methods[name] = {
+                "calls": 0, "errors": 0, "retries": 0,
+                "latencies": deque(maxlen=LATENCY_WINDOW)
+            }
+        return self._methods[name]
+
+    def record(self, name: str, transport: str, seconds: float, error: bool = False):
+        with self._lock:
+            method = self._method(f"{transport}.{name}")
+            method["calls"] += 1
+            method["errors"] += int(error)
+            method["latencies"].append(seconds * 1000)
+
+    def retry(self, name: str, transport: str):
+        with self._lock:
+            self._method(f"{transport}.{name}")["retries"] += 1
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {}
+            for name, method in sorted(self._methods.items()):
+                latencies = sorted(method["latencies"])
+                pick = lambda q: round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 2) if latencies else None
+                stats[name] = {
+                    "calls": method["calls"],
+                    "errors": method["errors"],
+                    "retries": method["retries"],
+                    "p50_ms": pick(0.5),
+                    "p95_ms": pick(0.95)
+                }
+            return stats
+
+
+# Shared by every client of the process, reported by /metrics
+client_metrics = ClientMetrics()
+
+
+class _RetryPolicy:
+    def __init__(self, retries: Optional[int] = None, backoff_ms: Optional[float] = None):
+        self.retries = retries if retries is not None else int(os.getenv("QDRANT_RETRIES", "3"))
+        self.backoff_ms = backoff_ms if backoff_ms is not None else float(os.getenv("QDRANT_RETRY_BACKOFF_MS", "100"))
+
+    def delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter, in seconds"""
+        return random.uniform(0, self.backoff_ms * (2 ** (attempt - 1))) / 1000
+
+
+class ResilientClient(_RetryPolicy):
+    """
+    Sync Qdrant client proxy: retries idempotent calls on transient errors
+    and records their latency; every other attribute passes through
+    """
+
+    def __init__(self, client, transport: str, retries: Optional[int] = None,
+                 backoff_ms: Optional[float] = None, metrics: Optional[ClientMetrics] = None):
+        super().__init__(retries, backoff_ms)
+        self._client = client
+        self.transport = transport
+        self.metrics = metrics or client_metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in RETRYABLE_METHODS or not callable(attr):
+            return attr
+        return partial(self._call, name, attr)
+
+    def _call(self, name, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                self.metrics.record(name, self.transport, time.perf_counter() - started, error=True)
+                if attempt >= self.retries or not is_transient(e):
+                    raise
+                attempt += 1
+                self.metrics.retry(name, self.transport)
+                logger.warning(f"Qdrant {name} failed ({e}), retry {attempt}/{self.retries}")
+                time.sleep(self.delay(attempt))
+                continue
+            self.metrics.record(name, self.transport, time.perf_counter() - started)
+            return result
+
+
+class AsyncResilientClient(_RetryPolicy):
+    """Async counterpart of ResilientClient, with a per-call timeout"""
+
+    def __init__(self, client, transport: str, timeout: Optional[float] = None, retries: Optional[int] = None,
+                 backoff_ms: Optional[float] = None, metrics: Optional[ClientMetrics] = None):
+        super().__init__(retries, backoff_ms)
+        self._client = client
+        self.transport = transport
+        self.timeout = timeout if timeout is not None else float(os.getenv("QDRANT_TIMEOUT", "10"))
+        self.metrics = metrics or client_metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in RETRYABLE_METHODS or not callable(attr):
+            return attr
+        return partial(self._call, name, attr)
+
+    async def _call(self, name, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(method(*args, **kwargs), timeout=self.timeout)
+            except Exception as e:
+                self.metrics.record(name, self.transport, time.perf_counter() - started, error=True)
+                if attempt >= self.retries or not is_transient(e):
+                    raise
+                attempt += 1
+                self.metrics.retry(name, self.transport)
+                logger.warning(f"Qdrant {name} failed ({e!r}), retry {attempt}/{self.retries}")
+                await asyncio.sleep(self.delay(attempt))
+                continue
+            self.metrics.record(name, self.transport, time.perf_counter() - started)
+            return result
+
+
+def create_qdrant_client(url: Optional[str] = None, prefer_grpc: Optional[bool] = None) -> ResilientClient:
+    """Sync client for scripts and the threaded API paths"""
+    from qdrant_client import QdrantClient
+
+    settings = qdrant_settings()
+    if prefer_grpc is not None:
+        settings["prefer_grpc"] = prefer_grpc
+    if url:
+        settings.pop("host")
+        settings.pop("port")
+        settings["url"] = url
+    transport = "grpc" if settings["prefer_grpc"] else "rest"
+    return ResilientClient(QdrantClient(**settings), transport)
+
+
+def create_async_qdrant_client(prefer_grpc: Optional[bool] = None) -> AsyncResilientClient:
+    """Async client for the event-loop API paths (bind to one running loop)"""
+    from qdrant_client import AsyncQdrantClient
+
+    settings = qdrant_settings()
+    if prefer_grpc is not None:
+        settings["prefer_grpc"] = prefer_grpc
+    transport = "grpc" if settings["prefer_grpc"] else "rest"
+    return AsyncResilientClient(AsyncQdrantClient(**settings), transport, timeout=settings["timeout"])
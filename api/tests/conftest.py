@@ -5,7 +5,7 @@ Pytest configuration and fixtures for Doutora IA tests
 import pytest
 import os
 import sys
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -16,6 +16,11 @@ os.environ["ENV"] = "test"
 os.environ["PAYMENTS_PROVIDER"] = "stub"
 os.environ["QDRANT_URL"] = "http://localhost:6333"
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ["REDIS_ENABLED"] = "false"
+os.environ["EMBEDDING_WARMUP"] = "false"
+os.environ["CONTEXT_TOKENIZER"] = "none"
+# Qdrant only, never a local index exported on the developer's machine
+os.environ["VECTOR_BACKEND"] = "qdrant"
 
 # Mock WeasyPrint before importing main (not available on Windows without GTK)
 mock_pdf_module = MagicMock()
@@ -23,7 +28,18 @@ mock_pdf_module.generate_pdf_report = MagicMock(return_value="/tmp/mock_report.p
 sys.modules['services.pdf'] = mock_pdf_module
 sys.modules['weasyprint'] = MagicMock()
 
+
+def _no_qdrant(*args, **kwargs):
+    raise ConnectionError("Qdrant is not available in tests")
+
+
+# Keep the suite hermetic: no gRPC connections (and retries) to a local Qdrant.
+# Tests that need an index client set rag._client / rag._aclient themselves.
+patch("services.vector_client.create_qdrant_client", _no_qdrant).start()
+patch("services.vector_client.create_async_qdrant_client", _no_qdrant).start()
+
 from main import app
+from main import init_retrieval
 from db import Base, get_db
 import models
 
@@ -38,6 +54,12 @@ engine = create_engine(
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Create the RAG services up front, so the background warm-up started by each
+# TestClient does not replace main.rag while a test has it patched
+patch("rag.create_qdrant_client", _no_qdrant).start()
+patch("rag.create_async_qdrant_client", _no_qdrant).start()
+init_retrieval()
+
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -3,7 +3,7 @@ Tests for main API endpoints
 """
 
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi import status
 
 
@@ -20,6 +20,38 @@ class TestHealthEndpoint:
         assert "timestamp" in data
         assert data["version"] == "1.0.0"
 
+    def test_liveness_checks_no_dependency(self):
+        """Liveness answers before the warm-up and without touching the database"""
+        from fastapi.testclient import TestClient
+        from main import app
+
+        response = TestClient(app).get("/health/live")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"status": "alive"}
+
+    def test_readiness_flips_after_warm_up(self):
+        """Readiness is 503 while warming up and 200 with the startup timings after"""
+        from fastapi.testclient import TestClient
+        from main import app
+        from services.startup import StartupReport
+
+        report = StartupReport()
+        report.begin("imports")
+        client = TestClient(app)  # no lifespan: the warm-up is driven by the test
+
+        with patch("main.startup_report", report):
+            assert client.get("/health/ready").status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+            report.end("imports")
+            report.mark_ready()
+            response = client.get("/health/ready")
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["phases"]["imports"]["state"] == "done"
+
 
 class TestSearchEndpoint:
     """Test RAG search endpoint"""
@@ -83,43 +115,40 @@ class TestSearchEndpoint:
 class TestAnalyzeCaseEndpoint:
     """Test case analysis endpoint"""
 
-    @patch("rag.rag_system.search")
-    @patch("main.llm_client.chat.completions.create")
-    def test_analyze_case_success(
-        self,
-        mock_llm,
-        mock_search,
-        client,
-        mock_rag_results,
-        mock_llm_response
-    ):
+    def test_analyze_case_success(self, client, mock_llm_response):
         """Test successful case analysis"""
-        mock_search.return_value = mock_rag_results
-
-        # Mock LLM response
-        mock_completion = MagicMock()
-        mock_completion.choices = [MagicMock()]
-        mock_completion.choices[0].message.content = mock_llm_response
-        mock_llm.return_value = mock_completion
-
-        response = client.post(
-            "/analyze_case",
-            json={
-                "descricao": "Sofri fraude PIX no valor de R$ 5.000. O banco se recusa a devolver.",
-                "detalhado": False
-            }
-        )
+        mock_rag = MagicMock()
+        mock_rag.get_context_for_case.return_value = "LEGISLAÇÃO APLICÁVEL: CDC Art. 14"
+        mock_chat = AsyncMock(return_value=mock_llm_response)
+
+        with patch("main.rag", mock_rag), \
+                patch("main.semantic_cache", None), \
+                patch("main.llm_gateway.chat", mock_chat), \
+                patch("main.save_case_analysis", return_value=MagicMock(id=42)):
+            response = client.post(
+                "/analyze_case",
+                json={
+                    "descricao": "Sofri fraude PIX no valor de R$ 5.000. O banco se recusa a devolver.",
+                    "detalhado": False
+                }
+            )
 
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
 
+        mock_chat.assert_awaited_once()
+        prompt = str(mock_chat.await_args.kwargs["messages"])
+        assert "CDC Art. 14" in prompt
+
+        assert data["case_id"] == 42
         assert "tipificacao" in data
-        assert "estrategias_riscos" in data
+        assert "estrategias" in data
+        assert "riscos" in data
         assert "probabilidade" in data
-        assert "custos_prazos" in data
+        assert "custos" in data
         assert "checklist" in data
-        assert "rascunho" in data
-        assert "vigencia_base" in data
+        assert "rascunho_peticao" in data
+        assert "base_atualizada_em" in data
 
     @patch("rag.rag_system.search")
     def test_analyze_case_no_rag_results(self, mock_search, client):
@@ -137,38 +166,31 @@ class TestAnalyzeCaseEndpoint:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert "No relevant content found" in response.json()["detail"]
 
-    @patch("rag.rag_system.search")
-    @patch("main.llm_client.chat.completions.create")
-    def test_analyze_case_detalhado(
-        self,
-        mock_llm,
-        mock_search,
-        client,
-        mock_rag_results,
-        mock_llm_response
-    ):
+    def test_analyze_case_detalhado(self, client, mock_llm_response):
         """Test detailed case analysis"""
-        mock_search.return_value = mock_rag_results
-
-        mock_completion = MagicMock()
-        mock_completion.choices = [MagicMock()]
-        mock_completion.choices[0].message.content = mock_llm_response
-        mock_llm.return_value = mock_completion
-
-        response = client.post(
-            "/analyze_case",
-            json={
-                "descricao": "Análise detalhada de fraude PIX",
-                "detalhado": True
-            }
-        )
+        mock_rag = MagicMock()
+        mock_rag.get_context_for_case.return_value = "LEGISLAÇÃO APLICÁVEL: CDC Art. 14"
+        mock_chat = AsyncMock(return_value=mock_llm_response)
+
+        with patch("main.rag", mock_rag), \
+                patch("main.semantic_cache", None), \
+                patch("main.llm_gateway.chat", mock_chat), \
+                patch("main.save_case_analysis", return_value=MagicMock(id=42)):
+            response = client.post(
+                "/analyze_case",
+                json={
+                    "descricao": "Análise detalhada de fraude PIX: transferi R$ 5.000 e o banco não devolve.",
+                    "detalhado": True
+                }
+            )
 
         assert response.status_code == status.HTTP_200_OK
+        mock_chat.assert_awaited_once()
 
-        # Verify RAG was called with higher limit for detailed analysis
-        mock_search.assert_called_once()
-        call_kwargs = mock_search.call_args[1]
-        assert call_kwargs["limit"] == 10  # Detailed mode uses limit=10
+        # Detailed mode retrieves more passages per type
+        mock_rag.get_context_for_case.assert_called_once()
+        call_kwargs = mock_rag.get_context_for_case.call_args.kwargs
+        assert call_kwargs["limit_per_type"] == 5
 
 
 class TestGenerateReportEndpoint:
@@ -396,3 +418,81 @@ class TestSeedEndpoint:
         from models import Plan
         plans = db_session.query(Plan).all()
         assert len(plans) >= 3
+
+
+class TestAnalysisStreamParser:
+    """Test incremental section parsing for streamed analyses"""
+
+    def test_sections_match_full_parse(self, mock_llm_response):
+        """Streaming in small deltas yields the same sections as the full parse"""
+        from main import AnalysisStreamParser, find_analysis_sections, clean_section_text
+
+        parser = AnalysisStreamParser()
+        streamed = []
+        for i in range(0, len(mock_llm_response), 7):
+            streamed.extend(parser.feed(mock_llm_response[i:i + 7]))
+        streamed.extend(parser.close())
+
+        sections = find_analysis_sections(mock_llm_response)
+        expected = []
+        for i, (start, end, name) in enumerate(sections):
+            next_start = sections[i + 1][0] if i + 1 < len(sections) else len(mock_llm_response)
+            expected.append((name, clean_section_text(mock_llm_response[end:next_start])))
+
+        assert streamed == expected
+        assert [name for name, _ in streamed][:2] == ["tipificacao", "estrategias"]
+
+    def test_section_emitted_when_next_header_arrives(self):
+        """A section is released as soon as the following header is complete"""
+        from main import AnalysisStreamParser
+
+        parser = AnalysisStreamParser()
+        assert parser.feed("## 1. TIPIFICAÇÃO\nFraude PIX.\n") == []
+        assert parser.feed("## 2. ESTRAT") == []
+
+        completed = parser.feed("ÉGIAS E RISCOS\n")
+        assert completed == [("tipificacao", "Fraude PIX.\n##")]
+        assert parser.close() == [("estrategias", "")]
+
+
+class TestAnalyzeCaseStream:
+    """Test SSE variant of case analysis"""
+
+    def test_stream_emits_tokens_sections_and_done(self, client, mock_llm_response):
+        """Tokens arrive as events and the case is persisted at the end"""
+        import json as jsonlib
+
+        async def fake_stream(messages, **kwargs):
+            for i in range(0, len(mock_llm_response), 40):
+                yield mock_llm_response[i:i + 40]
+
+        fake_case = MagicMock(id=42)
+
+        with patch("main.rag", None), \
+                patch("main.semantic_cache", None), \
+                patch("main.llm_gateway.stream", fake_stream), \
+                patch("main.save_case_analysis", return_value=fake_case):
+            response = client.post(
+                "/analyze_case/stream",
+                json={
+                    "descricao": "Sofri fraude PIX no valor de R$ 5.000. O banco se recusa a devolver.",
+                    "detalhado": False
+                }
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            lines = block.split("\n")
+            events.append((lines[0][len("event: "):], jsonlib.loads(lines[1][len("data: "):])))
+
+        names = [name for name, _ in events]
+        assert names[0] == "start"
+        assert "token" in names
+        assert names[-1] == "done"
+
+        sections = [data["name"] for name, data in events if name == "section"]
+        assert sections[0] == "tipificacao"
+        assert events[-1][1]["case_id"] == 42
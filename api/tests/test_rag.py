@@ -0,0 +1,929 @@
+"""
+Tests for the RAG retrieval layer
+"""
+
+import pytest
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+
+def make_hit(score, **payload):
+    """Build a fake Qdrant ScoredPoint"""
+    hit = MagicMock()
+    hit.score = score
+    hit.payload = dict(payload)
+    hit.vector = None
+    return hit
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    """RAGSystem with mocked encoder and Qdrant client"""
+    from rag import RAGSystem
+    from services.cache import embedding_cache
+
+    monkeypatch.setenv("CHUNK_STORE_PATH", str(tmp_path / "chunks.sqlite"))
+    embedding_cache.clear()
+
+    system = RAGSystem()
+    system._encoder = MagicMock()
+    system._encoder.encode.side_effect = lambda texts, **kwargs: (
+        np.zeros(8, dtype=np.float32) if isinstance(texts, str)
+        else np.zeros((len(texts), 8), dtype=np.float32)
+    )
+    system._client = MagicMock()
+    return system
+
+
+class TestSearchMulti:
+    """Test multi-type retrieval"""
+
+    def test_encodes_query_once(self, rag):
+        """All per-type searches share a single query embedding"""
+        rag._client.search.return_value = [make_hit(0.9, tipo="lei", titulo="CDC Art. 14")]
+
+        results = rag.search_multi(
+            query="fraude PIX banco",
+            limits={"lei": 2, "sumula": 2, "juris": 2, "regulatorio": 2, "doutrina": 1}
+        )
+
+        assert rag._encoder.encode.call_count == 1
+        assert rag._client.search.call_count == 5
+        assert set(results.keys()) == {"lei", "sumula", "juris", "regulatorio", "doutrina"}
+
+        searched = {call.kwargs["collection_name"] for call in rag._client.search.call_args_list}
+        assert searched == {"legis", "sumulas", "juris", "regulatorio", "doutrina"}
+
+    def test_respects_per_type_limits(self, rag):
+        """Each type is cut to its own limit"""
+        rag._client.search.return_value = [
+            make_hit(0.9 - i * 0.1, tipo="doutrina", titulo=f"Doc {i}") for i in range(4)
+        ]
+
+        results = rag.search_multi(query="pensão alimentícia", limits={"lei": 3, "doutrina": 1})
+
+        assert len(results["lei"]) == 3
+        assert len(results["doutrina"]) == 1
+
+    def test_failed_collection_returns_empty_list(self, rag):
+        """A failing collection does not break the other types"""
+        def fake_search(collection_name, **kwargs):
+            if collection_name == "juris":
+                raise RuntimeError("timeout")
+            return [make_hit(0.8, tipo="lei", titulo="Lei")]
+
+        rag._client.search.side_effect = fake_search
+
+        results = rag.search_multi(query="plano de saúde", limits={"lei": 2, "juris": 2})
+
+        assert results["juris"] == []
+        assert len(results["lei"]) == 1
+
+    def test_context_for_case_uses_single_encode(self, rag):
+        """get_context_for_case embeds the description only once"""
+        rag._client.search.return_value = [make_hit(0.9, tipo="lei", titulo="CDC Art. 14", texto="texto")]
+
+        context = rag.get_context_for_case("Sofri fraude PIX e o banco não devolve o valor")
+
+        assert rag._encoder.encode.call_count == 1
+        assert "LEGISLAÇÃO APLICÁVEL" in context
+        assert "CDC Art. 14" in context
+
+    def test_repeated_query_hits_embedding_cache(self, rag):
+        """A repeated (or trivially different) query skips the encoder"""
+        rag._client.search.return_value = []
+
+        rag.search(query="Pensão alimentícia atrasada")
+        rag.search(query="  Pensão   alimentícia atrasada ")
+
+        assert rag._encoder.encode.call_count == 1
+
+    def test_embedding_cache_keyed_by_backend(self, rag):
+        """ONNX int8 and PyTorch float32 workers never share cached vectors"""
+        from services.cache import embedding_cache
+        from services.model_registry import ModelKey
+
+        onnx = ModelKey("intfloat/multilingual-e5-large", "cpu", "int8", "onnx")
+        torch = ModelKey("intfloat/multilingual-e5-large", "cpu", "float32", "torch")
+        assert onnx.cache_id != torch.cache_id
+
+        rag._client.search.return_value = []
+        with patch("rag.model_registry.resolve", return_value=onnx):
+            rag.search(query="Pensão alimentícia atrasada")
+
+        assert embedding_cache.get(onnx.cache_id, "query: ", "Pensão alimentícia atrasada") is not None
+        assert embedding_cache.get(torch.cache_id, "query: ", "Pensão alimentícia atrasada") is None
+
+
+class TestDateFilters:
+    """Test date-range and vigência filtering pushed into Qdrant"""
+
+    def test_to_epoch_day(self):
+        from rag import to_epoch_day
+
+        assert to_epoch_day("1970-01-02") == 1
+        assert to_epoch_day("2016-03-18T00:00:00") == to_epoch_day("2016-03-18")
+        assert to_epoch_day("") is None
+        assert to_epoch_day(None) is None
+        assert to_epoch_day("não é data") is None
+
+    def test_date_range_sent_to_qdrant(self, rag):
+        """data_inicio/data_fim become a Range on the indexed epoch-day field"""
+        from rag import to_epoch_day
+
+        rag._client.search.return_value = []
+        rag.search(query="tutela de urgência", tipo="juris", data_inicio="2020-01-01", data_fim="2020-12-31")
+
+        query_filter = rag._client.search.call_args.kwargs["query_filter"]
+        date_filter = query_filter.must[0]
+        range_condition, empty_condition = date_filter.should
+
+        assert range_condition.key == "data_epoch_day"
+        assert range_condition.range.gte == to_epoch_day("2020-01-01")
+        assert range_condition.range.lte == to_epoch_day("2020-12-31")
+        assert empty_condition.is_empty.key == "data_epoch_day"
+
+    def test_vigente_em_filters_both_bounds(self, rag):
+        from rag import to_epoch_day
+
+        rag._client.search.return_value = []
+        rag.search(query="código de processo civil", tipo="lei", area="civil", vigente_em="2017-01-01")
+
+        conditions = rag._client.search.call_args.kwargs["query_filter"].must
+        inicio, fim = conditions[1].should[0], conditions[2].should[0]
+
+        assert inicio.key == "vigencia_inicio_epoch_day"
+        assert inicio.range.lte == to_epoch_day("2017-01-01")
+        assert fim.key == "vigencia_fim_epoch_day"
+        assert fim.range.gte == to_epoch_day("2017-01-01")
+
+    def test_date_filtered_search_returns_full_page(self, rag):
+        """No Python-side post-filter drops hits returned by Qdrant"""
+        rag._client.search.return_value = [
+            make_hit(0.9 - i * 0.01, tipo="juris", titulo=f"REsp {i}", data="2010-01-01") for i in range(10)
+        ]
+
+        results = rag.search(query="dano moral", tipo="juris", data_inicio="2020-01-01", limit=5)
+
+        assert len(results) == 5
+
+    def test_backfill_groups_points_with_same_dates(self, rag):
+        from rag import to_epoch_day
+
+        points = [MagicMock(id=i, payload={"data": "2015-03-16"}) for i in range(3)]
+        points.append(MagicMock(id=3, payload={}))
+        rag._client.scroll.return_value = (points, None)
+
+        assert rag.backfill_date_payloads("legis") == 4
+
+        calls = {tuple(c.kwargs["points"]): c.kwargs["payload"] for c in rag._client.set_payload.call_args_list}
+        assert calls[(0, 1, 2)]["data_epoch_day"] == to_epoch_day("2015-03-16")
+        assert calls[(3,)] == {"data_epoch_day": None, "vigencia_inicio_epoch_day": None, "vigencia_fim_epoch_day": None}
+
+    def test_insert_adds_epoch_days(self, rag):
+        from rag import to_epoch_day
+
+        rag.insert_document("legis", 1, {"titulo": "CPC", "data": "2015-03-16", "vigencia_fim": None}, "texto")
+
+        payload = rag._client.upsert.call_args.kwargs["points"][0].payload
+        assert payload["data_epoch_day"] == to_epoch_day("2015-03-16")
+        assert payload["vigencia_fim_epoch_day"] is None
+
+
+class TestCollectionProfiles:
+    """Test collection creation from declarative profiles"""
+
+    def test_profile_overrides_defaults(self, tmp_path):
+        from services.collection_profile import load_collection_profiles
+
+        config = tmp_path / "collections.yml"
+        config.write_text(
+            "defaults:\n"
+            "  hnsw: {m: 16, ef_construct: 100}\n"
+            "collections:\n"
+            "  doutrina:\n"
+            "    hnsw: {m: 32}\n"
+        )
+
+        profiles = load_collection_profiles(str(config))
+
+        assert profiles.get("doutrina").hnsw["m"] == 32
+        assert profiles.get("doutrina").hnsw["ef_construct"] == 100
+        assert profiles.get("legis").hnsw["m"] == 16
+        assert "area" in profiles.get("legis").payload_indexes
+
+    def test_missing_config_uses_defaults(self, tmp_path):
+        from services.collection_profile import load_collection_profiles, DEFAULT_PROFILE
+
+        profiles = load_collection_profiles(str(tmp_path / "missing.yml"))
+
+        assert profiles.get("juris").vector_size == DEFAULT_PROFILE["vector_size"]
+
+    def test_creates_only_missing_indexes(self, rag):
+        """Existing collections get the indexes they lack, and nothing else"""
+        rag._client.get_collection.return_value.payload_schema = {"area": MagicMock(), "tipo": MagicMock()}
+
+        rag.create_collections()
+
+        rag._client.create_collection.assert_not_called()
+        indexed = {
+            (call.kwargs["collection_name"], call.kwargs["field_name"])
+            for call in rag._client.create_payload_index.call_args_list
+        }
+        assert ("legis", "orgao") in indexed
+        assert ("doutrina", "fonte_arquivo") in indexed
+        assert not any(field in ("area", "tipo") for _, field in indexed)
+
+    def test_creates_collection_with_profile(self, rag):
+        created = set()
+
+        def fake_get_collection(name):
+            if name not in created:
+                raise RuntimeError("not found")
+            return MagicMock(payload_schema={})
+
+        rag._client.get_collection.side_effect = fake_get_collection
+        rag._client.create_collection.side_effect = lambda collection_name, **kwargs: created.add(collection_name)
+
+        rag.create_collections()
+
+        kwargs = rag._client.create_collection.call_args.kwargs
+        assert kwargs["hnsw_config"].m is not None
+        assert kwargs["optimizers_config"] is not None
+        assert created == set(rag.collections.values())
+
+
+class TestQuantization:
+    """Test quantized collections with oversampling and rescoring"""
+
+    def make_profiles(self, tmp_path, quantization):
+        from services.collection_profile import load_collection_profiles
+
+        config = tmp_path / "collections.yml"
+        config.write_text(f"defaults:\n  quantization: {quantization}\n")
+        return load_collection_profiles(str(config))
+
+    def test_scalar_profile(self, tmp_path):
+        from qdrant_client.models import ScalarQuantization
+
+        profile = self.make_profiles(tmp_path, "{type: scalar, oversampling: 2.0}").get("doutrina")
+
+        assert isinstance(profile.quantization_config(), ScalarQuantization)
+        assert profile.search_params().quantization.oversampling == 2.0
+        assert profile.search_params().quantization.rescore is True
+        assert profile.estimate_vector_ram(1000)["ram_bytes"] * 4 == profile.estimate_vector_ram(1000)["original_bytes"]
+
+    def test_binary_profile(self, tmp_path):
+        from qdrant_client.models import BinaryQuantization
+
+        profile = self.make_profiles(tmp_path, "{type: binary, oversampling: 3.0}").get("doutrina")
+
+        assert isinstance(profile.quantization_config(), BinaryQuantization)
+        assert profile.search_params(oversampling=4.0).quantization.oversampling == 4.0
+
+    def test_disabled_profile(self, tmp_path):
+        profile = self.make_profiles(tmp_path, "{type: none}").get("legis")
+
+        assert profile.quantization_config() is None
+        assert profile.search_params() is None
+
+    def test_quantization_is_opt_in_per_collection(self, tmp_path):
+        from services.collection_profile import load_collection_profiles
+
+        config = tmp_path / "collections.yml"
+        config.write_text("collections:\n  doutrina:\n    quantization: {type: scalar}\n")
+        profiles = load_collection_profiles(str(config))
+
+        assert profiles.get("legis").quantization_config() is None
+        assert profiles.get("doutrina").quantization_type == "scalar"
+        assert profiles.get("doutrina").quantization["quantile"] == 0.99
+
+    def test_migrate_updates_in_place(self, tmp_path):
+        from services.collection_profile import load_collection_profiles
+
+        config = tmp_path / "collections.yml"
+        config.write_text("defaults:\n  on_disk_vectors: true\n  quantization: {type: scalar}\n")
+        profile = load_collection_profiles(str(config)).get("doutrina")
+        client = MagicMock()
+
+        profile.migrate(client)
+
+        kwargs = client.update_collection.call_args.kwargs
+        assert kwargs["collection_name"] == "doutrina"
+        assert kwargs["vectors_config"][""].on_disk is True
+        assert kwargs["quantization_config"] is not None
+
+    def test_search_passes_oversampling(self, rag, tmp_path):
+        rag._profiles = self.make_profiles(tmp_path, "{type: scalar}")
+        rag._client.search.return_value = []
+
+        rag.search(query="responsabilidade civil", tipo="doutrina", oversampling=3.0)
+
+        params = rag._client.search.call_args.kwargs["search_params"]
+        assert params.quantization.oversampling == 3.0
+        assert params.quantization.rescore is True
+
+
+class TestMatryoshka:
+    """Test short indexed vectors with full-vector rescoring"""
+
+    @pytest.fixture
+    def short_rag(self, rag, tmp_path):
+        from services.collection_profile import load_collection_profiles
+
+        config = tmp_path / "collections.yml"
+        config.write_text("defaults:\n  vector_size: 8\n  matryoshka: {dim: 4, oversampling: 3.0}\n")
+        rag._profiles = load_collection_profiles(str(config))
+        rag.hybrid_enabled = False
+        return rag
+
+    def test_profile_layout(self, tmp_path):
+        import numpy as np
+        from services.collection_profile import load_collection_profiles, SHORT_VECTOR, FULL_VECTOR
+
+        config = tmp_path / "collections.yml"
+        config.write_text("defaults:\n  matryoshka: {dim: 256}\n  quantization: {type: none}\n")
+        profile = load_collection_profiles(str(config)).get("doutrina")
+
+        vectors = profile.vectors_config()
+        assert vectors[SHORT_VECTOR].size == 256
+        assert vectors[FULL_VECTOR].size == 1024
+        assert vectors[FULL_VECTOR].hnsw_config.m == 0
+
+        stored = profile.point_vector(list(np.arange(1024, dtype=float)))
+        assert len(stored[SHORT_VECTOR]) == 256
+        assert np.linalg.norm(stored[SHORT_VECTOR]) == pytest.approx(1.0)
+        assert len(stored[FULL_VECTOR]) == 1024
+        assert profile.estimate_vector_ram(1000)["ram_bytes"] * 4 == profile.estimate_vector_ram(1000)["original_bytes"]
+
+    def test_ram_estimate_counts_quantized_full_vector(self, tmp_path):
+        from services.collection_profile import load_collection_profiles
+
+        config = tmp_path / "collections.yml"
+        config.write_text("defaults:\n  matryoshka: {dim: 256}\n  quantization: {type: scalar, always_ram: true}\n")
+        profile = load_collection_profiles(str(config)).get("doutrina")
+
+        # int8 short vector plus the int8 copy of the full vector
+        assert profile.estimate_vector_ram(1000)["ram_bytes"] == 1000 * (256 + 1024)
+
+    def test_search_short_then_rescore_full(self, short_rag):
+        from services.collection_profile import SHORT_VECTOR, FULL_VECTOR
+
+        candidates = [MagicMock(id=i) for i in range(6)]
+        final = make_hit(0.9, tipo="doutrina", titulo="Doutrina")
+        short_rag._client.search.side_effect = [candidates, [final]]
+
+        results = short_rag.search(query="responsabilidade civil", tipo="doutrina", limit=2)
+
+        first, second = [call.kwargs for call in short_rag._client.search.call_args_list]
+        assert first["query_vector"][0] == SHORT_VECTOR
+        assert len(first["query_vector"][1]) == 4
+        assert first["limit"] == 12  # limit * 2 candidates per collection * oversampling 3
+        assert first["with_payload"] is False
+        assert second["query_vector"][0] == FULL_VECTOR
+        assert len(second["query_vector"][1]) == 8
+        assert second["query_filter"].must[0].has_id == list(range(6))
+        assert second["search_params"].exact is True
+        assert [r["titulo"] for r in results] == ["Doutrina"]
+
+    def test_ingest_stores_named_vectors(self, short_rag):
+        from services.collection_profile import SHORT_VECTOR, FULL_VECTOR
+
+        short_rag.bulk_insert("doutrina", [(1, {"titulo": "Doutrina"}, "texto")])
+
+        vector = short_rag._client.upsert.call_args.kwargs["points"][0].vector
+        assert len(vector[SHORT_VECTOR]) == 4
+        assert len(vector[FULL_VECTOR]) == 8
+
+
+class TestHybridSearch:
+    """Test BM25 + vector fusion"""
+
+    @pytest.fixture
+    def hybrid_rag(self, rag, tmp_path, monkeypatch):
+        from services.lexical import BM25IndexBuilder
+
+        builder = BM25IndexBuilder()
+        builder.add(1, "Dano moral por negativação indevida do consumidor")
+        builder.add(2, "Súmula 385 do STJ: anotação irregular preexistente afasta o dano moral")
+        builder.add(3, "Responsabilidade civil objetiva do fornecedor")
+        builder.write(tmp_path / "sumulas")
+        monkeypatch.setenv("LEXICAL_INDEX_DIR", str(tmp_path))
+        return rag
+
+    def test_exact_citation_fused_to_top(self, hybrid_rag):
+        """An exact citation ranked second by the vectors and first by BM25 ends up first"""
+        vector_hits = [make_hit(0.85, tipo="sumula", titulo="Súmula 37"), make_hit(0.84, tipo="sumula", titulo="Súmula 385")]
+        vector_hits[0].id, vector_hits[1].id = 10, 2
+        hybrid_rag._client.search.return_value = vector_hits
+
+        results = hybrid_rag.search(query="Súmula 385", tipo="sumula", limit=2)
+
+        assert results[0]["titulo"] == "Súmula 385"
+        assert results[0]["_lexical_score"] > 0
+
+    def test_lexical_only_hit_gets_only_lexical_term(self, hybrid_rag):
+        """A BM25-only hit is not appended to the vector ranking"""
+        vector_hits = [make_hit(0.85, tipo="sumula", titulo="Súmula 37"), make_hit(0.84, tipo="sumula", titulo="Súmula 227")]
+        vector_hits[0].id, vector_hits[1].id = 10, 11
+        hybrid_rag._client.search.return_value = vector_hits
+
+        point = MagicMock(id=2, payload={"tipo": "sumula", "titulo": "Súmula 385"})
+        hybrid_rag._client.scroll.return_value = ([point], None)
+
+        results = hybrid_rag.search(query="Súmula 385", tipo="sumula", limit=3)
+        by_id = {r["_id"]: r for r in results}
+
+        scroll_filter = hybrid_rag._client.scroll.call_args.kwargs["scroll_filter"]
+        assert scroll_filter.must[0].has_id == [2]
+        # Lexical rank 1 alone: 1 / (k + 1), the same as the top vector-only hit
+        k = hybrid_rag.rrf_k
+        top = 1 / (k + 1)
+        assert by_id[2]["_score"] == pytest.approx((1 / (k + 1)) / top)
+        assert by_id[10]["_score"] == pytest.approx((1 / (k + 1)) / top)
+        assert by_id[11]["_score"] == pytest.approx((1 / (k + 2)) / top)
+
+    def test_lexical_hits_respect_filter(self, hybrid_rag):
+        """Lexical hits filtered out by Qdrant are not returned"""
+        hit = make_hit(0.8, tipo="sumula", titulo="Súmula 37")
+        hit.id = 10
+        hybrid_rag._client.search.return_value = [hit]
+        hybrid_rag._client.scroll.return_value = ([], None)
+
+        results = hybrid_rag.search(query="Súmula 385", tipo="sumula", area="familia", limit=5)
+
+        assert [r["titulo"] for r in results] == ["Súmula 37"]
+        scroll_filter = hybrid_rag._client.scroll.call_args.kwargs["scroll_filter"]
+        assert len(scroll_filter.must) == 2
+
+    def test_no_index_keeps_vector_scores(self, rag):
+        rag._client.search.return_value = [make_hit(0.7, tipo="lei", titulo="CDC")]
+
+        results = rag.search(query="art. 14 CDC", tipo="lei")
+
+        assert results[0]["_score"] == 0.7
+        rag._client.scroll.assert_not_called()
+
+
+class TestRankResults:
+    """Test vectorized ranking"""
+
+    def test_matches_weighted_formula(self, rag):
+        from datetime import date, timedelta
+
+        recent = (date.today() - timedelta(days=365)).isoformat()
+        results = [
+            {"tipo": "doutrina", "_score": 0.95, "vigencia_fim": None},
+            {"tipo": "lei", "_score": 0.80, "vigencia_fim": None, "data": recent},
+            {"tipo": "lei", "_score": 0.90, "vigencia_fim": "2010-01-01"},
+        ]
+
+        ranked = rag._rank_results(results)
+
+        # Revoked law (no vigência bonus) falls behind vigente doutrina
+        assert [r["_score"] for r in ranked] == [0.80, 0.95, 0.90]
+        expected = 0.80 * 0.3 + 1.0 * 0.4 + 0.2 + (1 - 1 / 10) * 0.1
+        assert ranked[0]["_final_score"] == pytest.approx(expected, abs=1e-3)
+        assert ranked[1]["_final_score"] == pytest.approx(0.95 * 0.3 + 0.6 * 0.4 + 0.2)
+        assert ranked[2]["_final_score"] == pytest.approx(0.90 * 0.3 + 1.0 * 0.4)
+
+    def test_prefers_epoch_day_payload(self, rag):
+        from datetime import date
+        from rag import to_epoch_day
+
+        old = {"tipo": "juris", "_score": 0.5, "data": "2000-01-01"}
+        new = {"tipo": "juris", "_score": 0.5, "data": "2000-01-01", "data_epoch_day": to_epoch_day(date.today())}
+
+        ranked = rag._rank_results([old, new])
+
+        assert ranked[0] is new
+
+    def test_top_k_partial_sort(self, rag):
+        results = [{"tipo": "juris", "_score": i / 1000} for i in range(1000)]
+
+        ranked = rag._rank_results(results, top_k=5)
+
+        assert [r["_score"] for r in ranked] == [0.999, 0.998, 0.997, 0.996, 0.995]
+
+    def test_configurable_weights(self, rag):
+        rag.rank_weights = {"similarity": 1.0, "hierarchy": 0.0, "vigencia": 0.0, "recency": 0.0}
+        results = [{"tipo": "lei", "_score": 0.1}, {"tipo": "doutrina", "_score": 0.9}]
+
+        assert rag._rank_results(results)[0]["tipo"] == "doutrina"
+
+    def test_invalid_dates_and_empty_input(self, rag):
+        assert rag._rank_results([]) == []
+        ranked = rag._rank_results([{"tipo": "lei", "_score": 0.5, "data": "sem data"}])
+        assert ranked[0]["_final_score"] == pytest.approx(0.5 * 0.3 + 0.4 + 0.2)
+
+
+class TestCitationLookup:
+    """Test direct retrieval of exact references"""
+
+    @pytest.fixture
+    def cited_rag(self, rag, tmp_path):
+        from services.citation_index import CitationIndex
+
+        index = CitationIndex(path=str(tmp_path / "citations.sqlite"))
+        index.add("stj:sumula:385", "sumulas", 7)
+        index.add("cpc:art:300", "legis", 3)
+        rag._citation_index = index
+
+        def fake_retrieve(collection_name, ids, **kwargs):
+            titles = {("sumulas", 7): "Súmula 385", ("legis", 3): "CPC Art. 300"}
+            return [MagicMock(id=i, payload={"titulo": titles[(collection_name, i)]}) for i in ids]
+
+        rag._client.retrieve.side_effect = fake_retrieve
+        return rag
+
+    def test_exact_reference_skips_embedding(self, cited_rag):
+        results = cited_rag.search(query="Súmula 385 do STJ", limit=1)
+
+        assert results[0]["titulo"] == "Súmula 385"
+        assert results[0]["_citation_key"] == "stj:sumula:385"
+        cited_rag._encoder.encode.assert_not_called()
+        cited_rag._client.search.assert_not_called()
+
+    def test_direct_hits_come_first_without_duplicates(self, cited_rag):
+        hit = make_hit(0.9, tipo="sumula", titulo="Súmula 385")
+        hit.id = 7
+        other = make_hit(0.8, tipo="sumula", titulo="Súmula 37")
+        other.id = 8
+        cited_rag._client.search.return_value = [hit, other]
+
+        results = cited_rag.search(query="Súmula 385 STJ negativação", tipo="sumula", limit=5)
+
+        assert [r["titulo"] for r in results] == ["Súmula 385", "Súmula 37"]
+
+    def test_direct_hits_honor_filters(self, cited_rag):
+        """A filtered search only returns referenced documents that match the filter"""
+        from qdrant_client.models import HasIdCondition
+
+        cited_rag._client.scroll.return_value = ([], None)
+
+        results = cited_rag.search(query="Súmula 385 do STJ", tribunal="STF", limit=1)
+
+        scroll_filter = cited_rag._client.scroll.call_args.kwargs["scroll_filter"]
+        assert isinstance(scroll_filter.must[0], HasIdCondition)
+        assert scroll_filter.must[0].has_id == [7]
+        cited_rag._client.retrieve.assert_not_called()
+        assert all(r.get("_citation_key") is None for r in results)
+
+    def test_search_by_article_uses_index(self, cited_rag):
+        results = cited_rag.search_by_article("Art. 300", "CPC")
+
+        assert results[0]["titulo"] == "CPC Art. 300"
+        cited_rag._client.search.assert_not_called()
+
+
+class TestDiversification:
+    """Test contiguous-chunk merging and MMR before context building"""
+
+    def test_merges_contiguous_chunks(self):
+        from services.diversify import merge_contiguous
+
+        base = "O fornecedor responde objetivamente pelos danos causados ao consumidor. "
+        results = [
+            {"fonte_arquivo": "livro.md", "chunk_index": 4, "texto": base + "Trecho A continua aqui.", "_final_score": 0.9},
+            {"fonte_arquivo": "livro.md", "chunk_index": 5, "texto": "Trecho A continua aqui. E segue o B.", "_final_score": 0.8},
+            {"fonte_arquivo": "livro.md", "chunk_index": 9, "texto": "Outro trecho distante.", "_final_score": 0.7},
+            {"fonte_arquivo": "outro.md", "chunk_index": 5, "texto": "Fonte diferente.", "_final_score": 0.6},
+        ]
+
+        merged = merge_contiguous(results)
+
+        assert len(merged) == 3
+        assert merged[0]["texto"] == base + "Trecho A continua aqui. E segue o B."
+        assert merged[0]["_chunk_range"] == (4, 5)
+        assert merged[0]["_final_score"] == 0.9
+
+    def test_adjacent_law_articles_are_not_merged(self):
+        from services.diversify import merge_contiguous
+
+        results = [
+            {"tipo": "lei", "documento_id": "doc_cdc", "chunk_index": 0, "artigo_ou_tema": "Art. 14",
+             "titulo": "CDC", "texto": "O fornecedor de serviços responde...", "_final_score": 0.9},
+            {"tipo": "lei", "documento_id": "doc_cdc", "chunk_index": 1, "artigo_ou_tema": "Art. 15",
+             "titulo": "CDC", "texto": "(Vetado).", "_final_score": 0.5},
+        ]
+
+        merged = merge_contiguous(results)
+
+        assert [r["artigo_ou_tema"] for r in merged] == ["Art. 14", "Art. 15"]
+        assert merged[0]["texto"] == "O fornecedor de serviços responde..."
+        assert "_chunk_range" not in merged[0]
+
+    def test_mmr_prefers_distinct_evidence(self):
+        from services.diversify import mmr
+
+        results = [
+            {"titulo": "A", "_final_score": 1.0, "_vector": [1.0, 0.0]},
+            {"titulo": "A'", "_final_score": 0.95, "_vector": [0.99, 0.01]},
+            {"titulo": "B", "_final_score": 0.8, "_vector": [0.0, 1.0]},
+        ]
+
+        picked = mmr(results, k=2, lambda_=0.5)
+
+        assert [r["titulo"] for r in picked] == ["A", "B"]
+
+    def test_context_requests_vectors_and_diversifies(self, rag):
+        hits = []
+        for i in range(6):
+            hit = make_hit(0.9 - i * 0.01, tipo="doutrina", titulo=f"Livro [{i + 1}/6]",
+                           texto=f"Parágrafo número {i} do mesmo livro sobre alimentos.",
+                           fonte_arquivo="alimentos.md", chunk_index=i)
+            hit.id = i
+            hit.vector = [1.0, float(i)]
+            hits.append(hit)
+        rag._client.search.return_value = hits
+
+        results = rag.search_multi(query="pensão alimentícia", limits={"doutrina": 2}, diversify=True)
+
+        assert rag._client.search.call_args.kwargs["with_vectors"] is True
+        # Six adjacent slices of one book collapse into a single entry
+        assert len(results["doutrina"]) == 1
+        assert results["doutrina"][0]["_chunk_range"] == (0, 5)
+        assert "_vector" not in results["doutrina"][0]
+
+
+class TestContextCompression:
+    """Test extractive compression inside get_context_for_case"""
+
+    LONG_TEXT = " ".join(f"Frase {i} do capítulo sobre responsabilidade civil do banco." for i in range(40))
+
+    def test_compresses_long_chunks_with_one_extra_encode(self, rag):
+        rag._client.search.return_value = [make_hit(0.9, tipo="doutrina", titulo="Livro [3/9]", texto=self.LONG_TEXT)]
+
+        context = rag.get_context_for_case("Sofri fraude PIX e o banco não devolve o valor")
+
+        # One call for the description, one batched call for every sentence
+        assert rag._encoder.encode.call_count == 2
+        assert "Livro [3/9]" in context
+        assert "[…]" in context
+        assert rag.compressor.get_stats()["tokens_after"] < rag.compressor.get_stats()["tokens_before"]
+
+    def test_toggle_off(self, rag):
+        rag.compression_enabled = False
+        rag._client.search.return_value = [make_hit(0.9, tipo="doutrina", titulo="Livro [3/9]", texto=self.LONG_TEXT)]
+
+        rag.get_context_for_case("Sofri fraude PIX e o banco não devolve o valor")
+
+        assert rag._encoder.encode.call_count == 1
+
+
+class TestAreaInference:
+    """Test area filtering and collection pruning from the query classifier"""
+
+    @pytest.fixture
+    def area_rag(self, rag):
+        classifier = MagicMock()
+        classifier.confident_area.return_value = "familia"
+        classifier.may_contain.side_effect = lambda collection, area: collection in ("legis", "doutrina")
+        rag._area_classifier = classifier
+        rag._client.search.return_value = []
+        return rag
+
+    def test_confident_area_filters_and_prunes(self, area_rag):
+        area_rag.search(query="pensão alimentícia atrasada")
+
+        searched = {call.kwargs["collection_name"] for call in area_rag._client.search.call_args_list}
+        assert searched == {"legis", "doutrina"}
+
+        area_filter = area_rag._client.search.call_args.kwargs["query_filter"].must[0]
+        assert area_filter.should[0].match.value == "familia"
+        assert area_filter.should[1].is_empty.key == "area"
+
+    def test_explicit_area_wins(self, area_rag):
+        area_rag.search(query="pensão alimentícia atrasada", area="consumidor")
+
+        assert area_rag._client.search.call_count == 5
+        assert area_rag._area_classifier.confident_area.call_count == 0
+
+    def test_search_multi_returns_empty_for_pruned_types(self, area_rag):
+        results = area_rag.search_multi(query="guarda compartilhada", limits={"lei": 2, "juris": 2})
+
+        assert results["juris"] == []
+        assert area_rag._client.search.call_count == 1
+
+
+class TestLocalBackend:
+    """Test RAGSystem on the embedded vector index (no Qdrant)"""
+
+    @pytest.fixture
+    def local_rag(self, tmp_path, monkeypatch):
+        from rag import RAGSystem
+        from services.cache import embedding_cache
+
+        monkeypatch.setenv("VECTOR_BACKEND", "local")
+        monkeypatch.setenv("LOCAL_INDEX_DIR", str(tmp_path / "vectors"))
+        monkeypatch.setenv("LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+        monkeypatch.setenv("CITATION_INDEX_PATH", str(tmp_path / "citations.sqlite"))
+        monkeypatch.setenv("AREA_CLASSIFIER_PATH", str(tmp_path / "areas.npz"))
+        monkeypatch.setenv("CHUNK_STORE_PATH", str(tmp_path / "chunks.sqlite"))
+        embedding_cache.clear()
+
+        def encode(texts, **kwargs):
+            # Two-dimensional toy embedding: "banco" vs "família"
+            one = lambda t: np.array([1.0, 0.1] if "banco" in t else [0.1, 1.0], dtype=np.float32)
+            return one(texts) if isinstance(texts, str) else np.stack([one(t) for t in texts])
+
+        system = RAGSystem()
+        system._encoder = MagicMock()
+        system._encoder.encode.side_effect = encode
+        return system
+
+    def test_ingest_and_search_without_qdrant(self, local_rag):
+        from qdrant_client.models import VectorParams, Distance
+        from services.local_index import LocalIndexClient
+
+        assert isinstance(local_rag.client, LocalIndexClient)
+        local_rag.client.create_collection("juris", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+        local_rag.bulk_insert("juris", [
+            (1, {"tipo": "precedente", "titulo": "Fraude bancária", "area": "bancario", "data": "2022-01-01"}, "banco fraude"),
+            (2, {"tipo": "precedente", "titulo": "Guarda", "area": "familia", "data": "2021-01-01"}, "guarda dos filhos"),
+        ])
+
+        results = local_rag.search("golpe no banco", tipo="juris", limit=2)
+        assert results[0]["titulo"] == "Fraude bancária"
+
+        filtered = local_rag.search("golpe no banco", tipo="juris", area="familia", data_inicio="2020-06-01")
+        assert [r["titulo"] for r in filtered] == ["Guarda"]
+
+    def test_lexical_index_keeps_earlier_batches(self, local_rag):
+        from qdrant_client.models import VectorParams, Distance
+
+        local_rag.client.create_collection("juris", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+        local_rag.bulk_insert("juris", [(1, {"tipo": "precedente", "titulo": "Fraude", "texto": "banco fraude pix"}, "banco fraude pix")])
+        local_rag.build_lexical_index("juris")
+        local_rag.bulk_insert("juris", [(2, {"tipo": "precedente", "titulo": "Guarda", "texto": "guarda dos filhos"}, "guarda dos filhos")])
+
+        assert local_rag.build_lexical_index("juris") == 2
+        index = local_rag.lexical_index("juris")
+        assert [point_id for point_id, _ in index.search("pix")] == [1]
+        assert [point_id for point_id, _ in index.search("guarda")] == [2]
+
+
+class TestChunkStoreRetrieval:
+    """Test two-phase retrieval: metadata from the index, texts from the chunk store"""
+
+    def test_search_excludes_texto_and_hydrates_top_k(self, rag):
+        from qdrant_client.models import PayloadSelectorExclude
+        from services.chunk_store import ChunkStore
+
+        rag._chunk_store = ChunkStore()
+        rag._chunk_store.put_many("legis", [(1, "Texto integral do art. 14 do CDC.")])
+        hit = make_hit(0.9, tipo="lei", titulo="CDC Art. 14")
+        hit.id = 1
+        rag._client.search.return_value = [hit]
+
+        results = rag.search(query="fornecedor responde por defeito", tipo="lei")
+
+        assert isinstance(rag._client.search.call_args.kwargs["with_payload"], PayloadSelectorExclude)
+        assert results[0]["texto"] == "Texto integral do art. 14 do CDC."
+        assert rag._client.retrieve.call_count == 0
+
+    def test_falls_back_to_index_for_unstored_points(self, rag):
+        from services.chunk_store import ChunkStore
+
+        rag._chunk_store = ChunkStore()
+        hit = make_hit(0.9, tipo="lei", titulo="CDC Art. 14")
+        hit.id = 2
+        rag._client.search.return_value = [hit]
+        stored = MagicMock(id=2, payload={"texto": "Texto vindo do Qdrant."})
+        rag._client.retrieve.return_value = [stored]
+
+        results = rag.search(query="fornecedor responde por defeito", tipo="lei")
+
+        assert results[0]["texto"] == "Texto vindo do Qdrant."
+        assert rag._client.retrieve.call_args.kwargs["with_payload"] == ["texto"]
+
+    def test_reads_index_when_store_is_not_deployed(self, rag):
+        """Texts stripped from Qdrant are read back when this host has no chunk store"""
+        rag.chunk_store_enabled = True
+        hit = make_hit(0.9, tipo="lei", titulo="CDC Art. 14")
+        hit.id = 3
+        rag._client.search.return_value = [hit]
+        rag._client.retrieve.return_value = [MagicMock(id=3, payload={"texto": "Texto vindo do Qdrant."})]
+
+        results = rag.search(query="fornecedor responde por defeito", tipo="lei")
+
+        assert rag.chunk_store is None
+        assert results[0]["texto"] == "Texto vindo do Qdrant."
+
+    def test_ingest_moves_texto_out_of_payload(self, rag):
+        rag.chunk_store_enabled = True
+        rag.bulk_insert("legis", [(1, {"titulo": "CDC Art. 14", "texto": "O fornecedor responde."}, "O fornecedor responde.")])
+
+        payload = rag._client.upsert.call_args.kwargs["points"][0].payload
+        assert "texto" not in payload
+        assert rag.chunk_store.get_many("legis", [1]) == {1: "O fornecedor responde."}
+
+    def test_bulk_insert_streams_without_waiting(self, rag):
+        """bulk_insert takes an iterator and sends batched, non-blocking upserts, waiting on the last one"""
+        documents = ((i, {"titulo": f"Art. {i}"}, f"texto {i}") for i in range(5))
+
+        stats = rag.bulk_insert("legis", documents, batch_size=2)
+
+        assert stats["chunks"] == 5
+        assert rag._encoder.encode.call_count == 3
+        calls = rag._client.upsert.call_args_list
+        assert [call.kwargs["wait"] for call in calls] == [False, False, True]
+        assert sum(len(call.kwargs["points"]) for call in calls) == 5
+
+    def test_stored_passages_use_ingest_backend(self, rag, monkeypatch):
+        """Passages are encoded on EMBEDDING_INGEST_BACKEND even when queries run elsewhere"""
+        ingest_encoder = MagicMock()
+        ingest_encoder.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 8), dtype=np.float32)
+        monkeypatch.setenv("EMBEDDING_INGEST_BACKEND", "onnx-test")
+
+        with patch("rag.model_registry.get", return_value=ingest_encoder) as get:
+            rag.bulk_insert("legis", [(1, {"titulo": "CDC"}, "texto")])
+
+        assert get.call_args.args[3] == "onnx-test"
+        assert ingest_encoder.encode.call_count == 1
+        assert rag._encoder.encode.call_count == 0
+
+
+class TestAsyncSearch:
+    """Test the async search path"""
+
+    def test_asearch_uses_async_client(self, rag):
+        """Collections are searched concurrently over the async client"""
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        rag._aclient = MagicMock()
+        rag._aclient.search = AsyncMock(return_value=[make_hit(0.9, tipo="lei", titulo="CDC Art. 14")])
+
+        results = asyncio.run(rag.asearch(query="fraude PIX banco", tipo="lei", limit=5))
+
+        assert [r["titulo"] for r in results] == ["CDC Art. 14"]
+        assert rag._aclient.search.await_count == 1
+        assert rag._aclient.search.call_args.kwargs["collection_name"] == "legis"
+        rag._client.search.assert_not_called()
+
+    def test_no_async_client_without_qdrant(self, rag):
+        """Qdrant unreachable and no local index: async searches fall back to sync, no retries"""
+        rag._client = None
+
+        with patch("rag.create_async_qdrant_client") as create:
+            assert rag.aclient is None
+        create.assert_not_called()
+
+    def test_aclient_does_not_connect_on_the_event_loop(self, rag):
+        """Before warm-up creates the sync client, asearch runs the sync search in a thread"""
+        import asyncio
+        import threading
+        from unittest.mock import PropertyMock
+
+        rag._client = None
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def fake_search(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return []
+
+        with patch.object(type(rag), "client", new_callable=PropertyMock) as client, \
+                patch.object(rag, "search", side_effect=fake_search), \
+                patch("rag.create_async_qdrant_client") as create:
+            asyncio.run(rag.asearch(query="fraude PIX banco", limit=5))
+
+        client.assert_not_called()
+        create.assert_not_called()
+        assert threads and threads[0] != loop_thread
+
+    def test_asearch_multi_matches_sync(self, rag):
+        """asearch_multi returns the same per-type results as search_multi"""
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        hits = [make_hit(0.9 - i * 0.1, tipo="lei", titulo=f"Lei {i}") for i in range(3)]
+        rag._client.search.return_value = hits
+        rag._aclient = MagicMock()
+        rag._aclient.search = AsyncMock(return_value=hits)
+        limits = {"lei": 2, "juris": 1}
+
+        expected = rag.search_multi(query="plano de saúde", limits=limits)
+        results = asyncio.run(rag.asearch_multi(query="plano de saúde", limits=limits))
+
+        assert results == expected
+        assert rag._aclient.search.await_count == 2
+
+
+class TestResetConnections:
+    """Test dropping per-process state after fork"""
+
+    def test_clients_are_recreated_lazily(self, rag):
+        encoder = rag._encoder
+        rag._aclient = MagicMock()
+        rag._batcher = MagicMock()
+
+        rag.reset_connections()
+
+        assert rag._client is None
+        assert rag._aclient is None
+        assert rag._batcher is None
+        assert rag._search_pool is None
+        # Read-only state shared with the parent is kept
+        assert rag._encoder is encoder
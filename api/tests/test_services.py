@@ -361,3 +361,1023 @@ class TestPrompts:
 
         assert isinstance(date_str, str)
         assert "/" in date_str or "de" in date_str
+
+
+class TestEmbeddingCache:
+    """Test two-tier query embedding cache"""
+
+    def test_key_normalizes_text(self):
+        """Whitespace and Unicode composition differences map to the same key, case does not"""
+        from services.cache import EmbeddingCache
+
+        cache = EmbeddingCache(max_items=10)
+        key_a = cache.make_key("e5", "query: ", "Pensão do PIX")
+        key_b = cache.make_key("e5", "query: ", "  Pensa\u0303o   do PIX ")
+        key_c = cache.make_key("other-model", "query: ", "Pensão do PIX")
+        key_d = cache.make_key("e5", "query: ", "pensão do pix")
+
+        assert key_a == key_b
+        assert key_a != key_c
+        assert key_a != key_d
+
+    def test_get_or_encode_counts_hits(self):
+        """Second lookup is served from memory without encoding"""
+        from services.cache import EmbeddingCache
+
+        cache = EmbeddingCache(max_items=10)
+        encode = MagicMock(return_value=[0.5, -0.25, 0.125])
+
+        first = cache.get_or_encode("e5", "query: ", "golpe do PIX", encode)
+        second = cache.get_or_encode("e5", "query: ", " golpe  do PIX", encode)
+
+        assert encode.call_count == 1
+        assert first == second == [0.5, -0.25, 0.125]
+
+        stats = cache.get_stats()
+        assert stats["memory_hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 50.0
+
+    def test_lru_is_bounded(self):
+        """Oldest entries are evicted once max_items is reached"""
+        from services.cache import EmbeddingCache
+
+        cache = EmbeddingCache(max_items=2)
+        for text in ["a", "b", "c"]:
+            cache.set("e5", "query: ", text, [1.0, 0.0])
+
+        assert cache.get_stats()["memory_items"] == 2
+        assert cache.get("e5", "query: ", "a") is None
+        assert cache.get("e5", "query: ", "c") == [1.0, 0.0]
+
+
+class TestEmbeddingBatcher:
+    """Test micro-batching embedding executor"""
+
+    def test_concurrent_requests_share_a_batch(self):
+        """Requests arriving within max_wait are encoded together"""
+        import asyncio
+        from services.embeddings import EmbeddingBatcher
+
+        calls = []
+
+        def encode(texts):
+            calls.append(list(texts))
+            return [[float(len(t))] for t in texts]
+
+        batcher = EmbeddingBatcher(encode, max_batch=16, max_wait_ms=50)
+
+        async def run():
+            return await asyncio.gather(*(batcher.aencode("x" * i) for i in range(1, 6)))
+
+        vectors = asyncio.run(run())
+
+        assert vectors == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+        assert sum(len(c) for c in calls) == 5
+        assert len(calls) < 5
+
+        stats = batcher.get_stats()
+        assert stats["items"] == 5
+        assert stats["queue_depth"] == 0
+
+    def test_max_batch_is_respected(self):
+        """No batch exceeds max_batch items"""
+        from concurrent.futures import wait
+        from services.embeddings import EmbeddingBatcher
+
+        sizes = []
+
+        def encode(texts):
+            sizes.append(len(texts))
+            return [[0.0] for _ in texts]
+
+        batcher = EmbeddingBatcher(encode, max_batch=3, max_wait_ms=20)
+        futures = [batcher.submit(str(i)) for i in range(10)]
+        wait(futures, timeout=5)
+
+        assert all(f.result() == [0.0] for f in futures)
+        assert max(sizes) <= 3
+
+    def test_errors_propagate_to_callers(self):
+        """An encoder failure is raised in every waiting caller"""
+        from services.embeddings import EmbeddingBatcher
+
+        def encode(texts):
+            raise RuntimeError("model not loaded")
+
+        batcher = EmbeddingBatcher(encode, max_batch=4, max_wait_ms=1)
+
+        with pytest.raises(RuntimeError):
+            batcher.encode("golpe do pix")
+
+    def test_aencode_query_keeps_cache_off_the_event_loop(self):
+        """The Redis tier of the embedding cache is read and written in worker threads"""
+        import asyncio
+        import threading
+        from services.embeddings import EmbeddingBatcher, EmbeddingService
+
+        service = object.__new__(EmbeddingService)
+        service.cache_model = "e5/float32/torch"
+        service.batcher = EmbeddingBatcher(lambda texts: [[1.0] for _ in texts], max_wait_ms=1)
+        threads = []
+
+        with patch("services.embeddings.embedding_cache") as cache:
+            cache.get.side_effect = lambda *args: threads.append(threading.current_thread())
+            cache.set.side_effect = lambda *args: threads.append(threading.current_thread())
+            assert asyncio.run(service.aencode_query("golpe do pix")) == [1.0]
+
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+
+class TestLLMGateway:
+    """Test async LLM gateway"""
+
+    def _gateway(self, **kwargs):
+        from services.llm import LLMGateway
+
+        gateway = LLMGateway(base_url="http://llm.test/v1", api_key="test", model="test", **kwargs)
+        gateway._client = MagicMock()
+        return gateway
+
+    def test_concurrency_is_bounded(self):
+        """No more than max_concurrency generations run at once"""
+        import asyncio
+
+        gateway = self._gateway(max_concurrency=2, max_queue=10)
+        peak = {"running": 0, "max": 0}
+
+        async def fake_create(**kwargs):
+            peak["running"] += 1
+            peak["max"] = max(peak["max"], peak["running"])
+            await asyncio.sleep(0.01)
+            peak["running"] -= 1
+            completion = MagicMock()
+            completion.choices[0].message.content = "ok"
+            return completion
+
+        gateway._client.chat.completions.create = fake_create
+
+        async def run():
+            return await asyncio.gather(*(gateway.chat([{"role": "user", "content": "oi"}]) for _ in range(5)))
+
+        results = asyncio.run(run())
+
+        assert results == ["ok"] * 5
+        assert peak["max"] == 2
+        stats = gateway.get_stats()
+        assert stats["requests"] == 5
+        assert stats["in_flight"] == 0
+        assert stats["max_wait_ms"] > 0
+
+    def test_queue_full_is_rejected(self):
+        """Requests beyond max_queue fail fast instead of piling up"""
+        import asyncio
+        from services.llm import LLMQueueFullError
+
+        gateway = self._gateway(max_concurrency=1, max_queue=1)
+        release = None
+
+        async def fake_create(**kwargs):
+            await release.wait()
+            completion = MagicMock()
+            completion.choices[0].message.content = "ok"
+            return completion
+
+        gateway._client.chat.completions.create = fake_create
+
+        async def run():
+            nonlocal release
+            release = asyncio.Event()
+            running = asyncio.create_task(gateway.chat([]))
+            await asyncio.sleep(0)
+            queued = asyncio.create_task(gateway.chat([]))
+            await asyncio.sleep(0)
+
+            with pytest.raises(LLMQueueFullError):
+                await gateway.chat([])
+
+            release.set()
+            return await asyncio.gather(running, queued)
+
+        assert asyncio.run(run()) == ["ok", "ok"]
+        assert gateway.get_stats()["rejected"] == 1
+
+
+class TestSemanticAnalysisCache:
+    """Test semantic answer cache for case analyses"""
+
+    @pytest.fixture(autouse=True)
+    def enabled(self, monkeypatch):
+        monkeypatch.setenv("SEMANTIC_CACHE_ENABLED", "true")
+
+    def _cache(self, hits):
+        from services.semantic_cache import SemanticAnalysisCache
+
+        rag = MagicMock()
+        rag.encode_text.return_value = [0.1, 0.2, 0.3]
+        rag.client.search.return_value = hits
+        return SemanticAnalysisCache(rag, threshold=0.9, corpus_version="test"), rag
+
+    def test_semantic_hit_returns_stored_analysis(self):
+        """A close paraphrase returns the stored analysis"""
+        hit = MagicMock(score=0.97, payload={"analysis": {"tipificacao": "Fraude PIX"}})
+        cache, rag = self._cache([hit])
+
+        result = cache.lookup("Caí no golpe do PIX e o banco não devolveu", False, "ana@example.com")
+
+        assert result == {"tipificacao": "Fraude PIX"}
+        kwargs = rag.client.search.call_args.kwargs
+        assert kwargs["score_threshold"] == 0.9
+        keys = [c.key for c in kwargs["query_filter"].must]
+        assert {"corpus_version", "scope", "detalhado", "created_at"} <= set(keys)
+        assert cache.get_stats()["semantic_hits"] == 1
+
+    def test_miss_when_nothing_above_threshold(self):
+        """No hit above the threshold means the LLM must run"""
+        cache, _ = self._cache([])
+
+        assert cache.lookup("Meu voo foi cancelado sem aviso", True, "ana@example.com") is None
+        assert cache.get_stats()["misses"] == 1
+
+    def test_store_upserts_with_deterministic_id(self):
+        """Re-storing the same description overwrites the same point"""
+        from models import ProbabilityLevel
+
+        cache, rag = self._cache([])
+        cache.store("Golpe do PIX", False, {"probabilidade": ProbabilityLevel.ALTA}, "ana@example.com")
+        cache.store("  Golpe do  PIX ", False, {"probabilidade": ProbabilityLevel.ALTA}, "ana@example.com")
+        cache.store("Golpe do PIX", False, {"probabilidade": ProbabilityLevel.ALTA}, "bruno@example.com")
+
+        first, second, other_user = [c.kwargs["points"][0] for c in rag.client.upsert.call_args_list]
+        assert first.id == second.id
+        assert other_user.id != first.id
+        assert first.payload["analysis"]["probabilidade"] == "alta"
+        assert first.payload["corpus_version"] == "test"
+        assert "descricao" not in first.payload
+
+    def test_anonymous_requests_bypass_user_scoped_cache(self):
+        """Without a user, the per-user cache is neither read nor written"""
+        cache, rag = self._cache([MagicMock(score=0.99, payload={"analysis": {}})])
+
+        assert cache.lookup("Golpe do PIX no banco", False) is None
+        cache.store("Golpe do PIX no banco", False, {"tipificacao": "Fraude PIX"})
+
+        rag.client.search.assert_not_called()
+        rag.client.upsert.assert_not_called()
+        assert cache.get_stats()["bypassed"] == 1
+
+    def test_exact_tier_is_keyed_by_corpus_version(self):
+        """Bumping CORPUS_VERSION does not serve analyses cached for the old corpus"""
+        from services.cache import cache_service
+
+        cache, _ = self._cache([])
+        with patch.object(cache_service, "set") as set_key, patch.object(cache_service, "get", return_value=None) as get_key:
+            cache.store("Golpe do PIX", False, {"tipificacao": "Fraude PIX"}, "ana@example.com")
+            cache.corpus_version = "2"
+            cache.lookup("Golpe do PIX", False, "ana@example.com")
+
+        assert get_key.call_args.args[0] != set_key.call_args.args[0]
+
+
+class TestLexicalIndex:
+    """Test BM25 lexical index"""
+
+    def test_tokenize_citations(self):
+        from services.lexical import tokenize
+
+        tokens = tokenize("Art. 300 do CPC e Súmula 385 do STJ; REsp 1.737.412")
+
+        assert "art_300" in tokens
+        assert "sumula_385" in tokens
+        assert "resp_1737412" in tokens
+        assert "cpc" in tokens
+
+    def test_exact_citation_ranks_first(self, tmp_path):
+        from services.lexical import BM25IndexBuilder, BM25Index
+
+        builder = BM25IndexBuilder()
+        builder.add(1, "A inscrição indevida em cadastro de inadimplentes gera dano moral.")
+        builder.add(2, "Súmula 385 do STJ: da anotação irregular em cadastro de proteção ao crédito, "
+                       "não cabe indenização por dano moral quando preexistente legítima inscrição.")
+        builder.add(3, "Súmula 38 trata de competência da Justiça Estadual.")
+        builder.write(tmp_path)
+
+        index = BM25Index(tmp_path)
+        results = index.search("súmula 385 dano moral", limit=2)
+
+        assert results[0][0] == 2
+        assert len(results) == 2
+
+    def test_string_ids_and_unknown_terms(self, tmp_path):
+        from services.lexical import BM25IndexBuilder, BM25Index
+
+        builder = BM25IndexBuilder()
+        builder.add("lei_abc", "Art. 14 do Código de Defesa do Consumidor")
+        builder.write(tmp_path)
+
+        index = BM25Index(tmp_path)
+
+        assert index.search("art. 14")[0][0] == "lei_abc"
+        assert index.search("inexistente") == []
+
+    def test_spilled_runs_merge_into_the_same_index(self, tmp_path):
+        import numpy as np
+        from services.lexical import BM25IndexBuilder, BM25Index
+
+        texts = [
+            "Art. 14 do CDC: responsabilidade do fornecedor de serviços",
+            "Súmula 385 do STJ sobre inscrição em cadastro de inadimplentes",
+            "Tema 106 do STJ: fornecimento de medicamentos pelo poder público",
+            "Art. 300 do CPC: tutela de urgência",
+            "Dano moral por inscrição indevida em cadastro"
+        ]
+        in_memory = BM25IndexBuilder()
+        spilled = BM25IndexBuilder(spill_dir=tmp_path / "spill", max_postings=8)
+        for i, text in enumerate(texts):
+            in_memory.add(i, text)
+            spilled.add(i, text)
+        assert len(spilled._runs) > 1
+
+        in_memory.write(tmp_path / "memory")
+        spilled.write(tmp_path / "spilled")
+
+        for name in ("terms", "offsets", "docs", "tfs", "doc_lens", "ids"):
+            assert np.array_equal(
+                np.load(tmp_path / "memory" / f"{name}.npy"), np.load(tmp_path / "spilled" / f"{name}.npy")
+            )
+        assert BM25Index(tmp_path / "spilled").search("inscrição cadastro", limit=2)[0][0] in (1, 4)
+        assert list((tmp_path / "spill").iterdir()) == []
+
+    def test_reciprocal_rank_fusion(self):
+        from services.lexical import reciprocal_rank_fusion
+
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]], k=60)
+
+        assert fused[3] > fused[1] > fused[4]
+
+
+class TestCitationIndex:
+    """Test exact citation parsing and lookup"""
+
+    def test_parse_citations(self):
+        from services.citation_index import parse_citations
+
+        assert parse_citations("Tutela de urgência do art. 300 do CPC") == ["cpc:art:300"]
+        assert parse_citations("Súmula 385 do STJ") == ["stj:sumula:385"]
+        assert parse_citations("Tema 106/STJ e REsp 1.737.412") == ["stj:tema:106", "stj:resp:1737412"]
+        assert parse_citations("Súmula Vinculante 13") == ["stf:sumula_vinculante:13"]
+        assert parse_citations("cobertura negada apesar da RN 465") == ["ans:rn:465"]
+        assert parse_citations("Sofri fraude PIX e o banco não devolve") == []
+
+    def test_court_defaults_when_missing(self):
+        from services.citation_index import parse_citations
+
+        assert parse_citations("Súmula 385") == ["stj:sumula:385", "stf:sumula:385"]
+
+    def test_keys_for_payload(self):
+        from services.citation_index import citation_keys_for_payload
+
+        assert citation_keys_for_payload({
+            "tipo": "lei", "titulo": "Código de Processo Civil - Art. 300", "artigo_ou_tema": "Art. 300"
+        }) == ["cpc:art:300"]
+        assert citation_keys_for_payload({
+            "tipo": "sumula", "titulo": "Súmula 385", "tribunal": "STJ", "numero": "385"
+        }) == ["stj:sumula:385"]
+
+    def test_lookup_with_lru(self, tmp_path):
+        from services.citation_index import CitationIndex
+
+        index = CitationIndex(path=str(tmp_path / "citations.sqlite"))
+        index.add_payloads("sumulas", [(7, {"tipo": "sumula", "titulo": "Súmula 385", "tribunal": "STJ"})])
+        index.add("cpc:art:300", "legis", "lei_abc")
+
+        assert index.lookup("stj:sumula:385") == [("sumulas", 7)]
+        assert index.lookup("stj:sumula:385") == [("sumulas", 7)]
+        assert index.lookup_text("conforme o art. 300 do CPC") == {"cpc:art:300": [("legis", "lei_abc")]}
+        assert index.lookup("stj:sumula:1") == []
+
+        stats = index.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 3
+
+
+class TestContextPacker:
+    """Test token-budgeted context packing"""
+
+    class WordCounter:
+        """One token per word, so budgets are easy to reason about"""
+        def count(self, text):
+            return len(text.split())
+
+    def make_packer(self, budget, min_tokens=3):
+        from services.context_packer import ContextPacker
+        return ContextPacker(budget=budget, counter=self.WordCounter(), min_tokens=min_tokens)
+
+    def test_split_sentences_keeps_abbreviations(self):
+        from services.context_packer import split_sentences
+
+        sentences = split_sentences("Nos termos do Art. 300 do CPC, cabe tutela. O juiz decide. Fim!")
+
+        assert sentences == ["Nos termos do Art. 300 do CPC, cabe tutela.", "O juiz decide.", "Fim!"]
+
+    def test_respects_budget_and_sentence_boundaries(self):
+        packer = self.make_packer(budget=40)
+        texto = " ".join(f"Frase número {i} sobre o tema." for i in range(30))
+
+        context = packer.pack({"lei": [{"titulo": "CDC", "texto": texto, "_final_score": 0.9}]})
+
+        assert "=== LEGISLAÇÃO APLICÁVEL ===" in context
+        assert len(context.split()) <= 40
+        assert context.rstrip().endswith("tema.")
+
+    def test_higher_scores_get_more_tokens(self):
+        packer = self.make_packer(budget=80)
+        texto = " ".join(f"Sentença {i} do documento." for i in range(40))
+
+        packed = packer.allocate({
+            "lei": [{"titulo": "A", "texto": texto, "_final_score": 0.9}],
+            "doutrina": [{"titulo": "B", "texto": texto, "_final_score": 0.3}],
+        })
+
+        assert len(packed["lei"][0][1]) > len(packed["doutrina"][0][1])
+
+    def test_drops_sources_without_room(self):
+        packer = self.make_packer(budget=30, min_tokens=10)
+        texto = " ".join(f"Frase {i} longa o bastante." for i in range(20))
+
+        packed = packer.allocate({
+            "lei": [{"titulo": "A", "texto": texto, "_final_score": 0.9}],
+            "sumula": [{"titulo": f"S{i}", "texto": texto, "_final_score": 0.1} for i in range(5)],
+        })
+
+        assert "lei" in packed
+        assert len(packed.get("sumula", [])) < 5
+
+    def test_estimates_without_tokenizer(self):
+        from services.context_packer import TokenCounter
+
+        counter = TokenCounter(tokenizer_name="")
+
+        assert counter.count("a" * 40) == 10
+
+    def test_ollama_model_tag_is_estimated_and_reported(self, monkeypatch, caplog):
+        from services.context_packer import TokenCounter
+
+        monkeypatch.delenv("CONTEXT_TOKENIZER", raising=False)
+        monkeypatch.setenv("VLLM_MODEL", "llama3.1:8b")
+        counter = TokenCounter()
+
+        assert counter.tokenizer_name == ""
+        assert counter.load() is False
+        assert counter.count("a" * 40) == 10
+        assert sum("estimating tokens" in r.getMessage() for r in caplog.records) == 1
+
+        monkeypatch.setenv("VLLM_MODEL", "Qwen/Qwen2.5-7B-Instruct")
+        assert TokenCounter().tokenizer_name == "Qwen/Qwen2.5-7B-Instruct"
+
+        monkeypatch.setenv("CONTEXT_TOKENIZER", "none")
+        assert TokenCounter().tokenizer_name == ""
+
+
+class TestSentenceCompressor:
+    """Test extractive compression of retrieved chunks"""
+
+    def make_compressor(self, calls):
+        import numpy as np
+        from services.compression import SentenceCompressor
+
+        def encode(texts):
+            calls.append(texts)
+            # Sentences mentioning "fraude" point along the query axis
+            return np.array([[1.0, 0.0] if "fraude" in t else [0.0, 1.0] for t in texts])
+
+        return SentenceCompressor(encode, max_sentences=2, min_chars=50)
+
+    def test_keeps_relevant_sentences_in_order(self):
+        calls = []
+        compressor = self.make_compressor(calls)
+        texto = (
+            "O contrato foi assinado em 2020. A fraude ocorreu via PIX. "
+            "O banco foi notificado. A fraude não foi reconhecida pelo banco. O processo segue."
+        )
+
+        results = compressor.compress([1.0, 0.0], {"doutrina": [{"titulo": "Livro [2/9]", "texto": texto}]})
+
+        compressed = results["doutrina"][0]
+        assert compressed["texto"] == (
+            "[…] A fraude ocorreu via PIX. […] A fraude não foi reconhecida pelo banco. […]"
+        )
+        assert compressed["titulo"] == "Livro [2/9]"
+        assert compressor.get_stats()["tokens_before"] > compressor.get_stats()["tokens_after"]
+
+    def test_single_batched_call_and_short_texts_untouched(self):
+        calls = []
+        compressor = self.make_compressor(calls)
+        longo = "Primeira frase qualquer. A fraude aconteceu. Outra frase neutra. Mais uma frase."
+        curto = {"titulo": "Súmula", "texto": "Texto curto."}
+
+        results = compressor.compress([1.0, 0.0], {
+            "lei": [curto],
+            "juris": [{"texto": longo}],
+            "doutrina": [{"texto": longo}],
+        })
+
+        assert len(calls) == 1
+        assert len(calls[0]) == 8
+        assert results["lei"][0] is curto
+
+
+class TestAreaClassifier:
+    """Test the nearest-centroid query area classifier"""
+
+    def build(self, tmp_path):
+        from services.area_classifier import AreaClassifierBuilder, AreaClassifier
+
+        builder = AreaClassifierBuilder()
+        builder.add("legis", "consumidor", [1.0, 0.0, 0.0])
+        builder.add("juris", "consumidor", [0.9, 0.1, 0.0])
+        builder.add("legis", "familia", [0.0, 1.0, 0.0])
+        builder.add("doutrina", None, [0.0, 0.0, 1.0])
+        builder.write(tmp_path / "centroids.npz")
+        return AreaClassifier.load(tmp_path / "centroids.npz")
+
+    def test_predicts_nearest_area_with_confidence(self, tmp_path):
+        classifier = self.build(tmp_path)
+
+        area, confidence = classifier.predict([0.95, 0.05, 0.0])
+
+        assert area == "consumidor"
+        assert confidence > 0.99
+        assert classifier.confident_area([0.5, 0.5, 0.0], min_confidence=0.99) is None
+
+    def test_collections_for_area(self, tmp_path):
+        classifier = self.build(tmp_path)
+
+        assert classifier.may_contain("juris", "consumidor")
+        assert not classifier.may_contain("juris", "familia")
+        # Unlabeled documents (doutrina) never rule a collection out
+        assert classifier.may_contain("doutrina", "familia")
+        assert not classifier.may_contain("sumulas", "consumidor")
+
+
+class TestLocalIndex:
+    """Test the embedded (Qdrant-free) vector index backend"""
+
+    def make_client(self, tmp_path):
+        from qdrant_client.models import VectorParams, Distance, PointStruct
+        from services.local_index import LocalIndexClient
+
+        client = LocalIndexClient(tmp_path)
+        client.create_collection("legis", vectors_config=VectorParams(size=3, distance=Distance.COSINE))
+        client.create_payload_index("legis", "area")
+        client.upsert("legis", [
+            PointStruct(id=1, vector=[1.0, 0.0, 0.0], payload={"area": "consumidor", "data_epoch_day": 100}),
+            PointStruct(id=2, vector=[0.9, 0.1, 0.0], payload={"area": "familia", "data_epoch_day": 200}),
+            PointStruct(id=3, vector=[0.0, 1.0, 0.0], payload={"data_epoch_day": 300}),
+        ])
+        return client
+
+    def test_exact_top_k(self, tmp_path):
+        client = self.make_client(tmp_path)
+
+        hits = client.search("legis", query_vector=[1.0, 0.0, 0.0], limit=2)
+
+        assert [hit.id for hit in hits] == [1, 2]
+        assert hits[0].score == pytest.approx(1.0, abs=1e-3)
+        assert hits[0].payload["area"] == "consumidor"
+
+    def test_filters_like_qdrant(self, tmp_path):
+        from qdrant_client.models import Filter, FieldCondition, MatchValue, Range, IsEmptyCondition, PayloadField
+
+        client = self.make_client(tmp_path)
+        area_or_empty = Filter(must=[Filter(should=[
+            FieldCondition(key="area", match=MatchValue(value="familia")),
+            IsEmptyCondition(is_empty=PayloadField(key="area"))
+        ])])
+        recent = Filter(must=[FieldCondition(key="data_epoch_day", range=Range(gte=150))])
+
+        assert [h.id for h in client.search("legis", [1.0, 0.0, 0.0], query_filter=area_or_empty)] == [2, 3]
+        assert [h.id for h in client.search("legis", [1.0, 0.0, 0.0], query_filter=recent)] == [2, 3]
+
+    def test_selective_filter_grows_the_window(self, tmp_path):
+        """Sparse matches deep in the ranking are found in the same order as a full sort"""
+        import numpy as np
+        from qdrant_client.models import VectorParams, Distance, PointStruct, Filter, HasIdCondition
+        from services.local_index import LocalIndexClient
+
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 4)).astype(np.float32)
+        client = LocalIndexClient(tmp_path)
+        client.create_collection("juris", vectors_config=VectorParams(size=4, distance=Distance.COSINE))
+        client.upsert("juris", [PointStruct(id=i, vector=v.tolist(), payload={}) for i, v in enumerate(vectors)])
+
+        query = vectors[0]
+        wanted = list(range(0, 500, 37))
+        hits = client.search("juris", query.tolist(), query_filter=Filter(must=[HasIdCondition(has_id=wanted)]), limit=5)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = sorted(wanted, key=lambda i: -float(normalized[i] @ (query / np.linalg.norm(query))))[:5]
+        assert [hit.id for hit in hits] == expected
+
+    def test_upsert_overwrites_and_reopens(self, tmp_path):
+        from qdrant_client.models import PointStruct
+        from services.local_index import LocalIndexClient
+
+        self.make_client(tmp_path).upsert("legis", [PointStruct(id=1, vector=[0.0, 0.0, 1.0], payload={"area": "saude"})])
+
+        reopened = LocalIndexClient(tmp_path)
+        assert reopened.get_collection("legis").points_count == 3
+        assert reopened.search("legis", [0.0, 0.0, 1.0], limit=1)[0].id == 1
+        assert reopened.retrieve("legis", ids=[1])[0].payload == {"area": "saude"}
+
+    def test_scroll_and_export(self, tmp_path):
+        from services.local_index import LocalIndexClient, export_from_qdrant
+
+        source = self.make_client(tmp_path / "source")
+        page, offset = source.scroll("legis", limit=2, with_vectors=True)
+        assert [r.id for r in page] == [1, 2] and offset == 3
+
+        target = LocalIndexClient(tmp_path / "target")
+        copied = export_from_qdrant(source, target, ["legis"], batch_size=2)
+
+        assert copied == {"legis": 3}
+        assert target.get_collection("legis").payload_schema.keys() == {"area"}
+        assert target.search("legis", [0.0, 1.0, 0.0], limit=1)[0].id == 3
+
+
+class TestChunkStore:
+    """Test the external chunk text store"""
+
+    def test_round_trip_and_missing_ids(self, tmp_path):
+        from services.chunk_store import ChunkStore
+
+        store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        texto = "A responsabilidade do banco é objetiva. " * 50
+        store.put_many("doutrina", [(1, texto), ("lei_cdc_14", "Art. 14")])
+
+        assert store.get_many("doutrina", [1, "lei_cdc_14", 99]) == {1: texto, "lei_cdc_14": "Art. 14"}
+        assert store.get_many("legis", [1]) == {}
+        assert store.get_stats()["misses"] == 2
+        # Stored compressed
+        assert store.get_stats()["bytes_read"] < len(texto)
+
+    def test_large_batches_share_a_dictionary(self, tmp_path):
+        import zlib
+        from services.chunk_store import ChunkStore, DICT_MIN_SAMPLES
+
+        texts = [
+            f"Art. {i}. O fornecedor de serviços responde, independentemente da existência de culpa, "
+            f"pela reparação dos danos causados aos consumidores por defeitos relativos à prestação {i}."
+            for i in range(DICT_MIN_SAMPLES)
+        ]
+        store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        store.put_many("legis", list(enumerate(texts)))
+
+        assert store.get_many("legis", [0, 7]) == {0: texts[0], 7: texts[7]}
+        store.get_many("legis", list(range(len(texts))))
+        assert store.get_stats()["dictionaries"] == 1
+        per_row = sum(len(zlib.compress(text.encode("utf-8"), 9)) for text in texts)
+        assert store.get_stats()["bytes_read"] < per_row / 2
+
+        # A reopened store reads the dictionary back
+        reopened = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        assert reopened.get_many("legis", [5]) == {5: texts[5]}
+
+
+class TestVectorClient:
+    """Test the resilient Qdrant client wrappers"""
+
+    def test_retries_transient_errors(self):
+        from services.vector_client import ResilientClient, ClientMetrics
+
+        inner = MagicMock()
+        inner.search.side_effect = [ConnectionError("reset"), ["hit"]]
+        metrics = ClientMetrics()
+        client = ResilientClient(inner, "grpc", retries=2, backoff_ms=0, metrics=metrics)
+
+        assert client.search(collection_name="legis") == ["hit"]
+        assert inner.search.call_count == 2
+
+        stats = metrics.get_stats()["grpc.search"]
+        assert stats["calls"] == 2
+        assert stats["errors"] == 1
+        assert stats["retries"] == 1
+        assert stats["p50_ms"] is not None
+
+    def test_does_not_retry_other_errors(self):
+        from services.vector_client import ResilientClient, ClientMetrics
+
+        inner = MagicMock()
+        inner.search.side_effect = ValueError("bad filter")
+        client = ResilientClient(inner, "rest", retries=3, backoff_ms=0, metrics=ClientMetrics())
+
+        with pytest.raises(ValueError):
+            client.search(collection_name="legis")
+        assert inner.search.call_count == 1
+        # Non-retryable methods pass through untouched
+        assert client.delete_collection is inner.delete_collection
+
+    def test_async_client_times_out_and_retries(self):
+        import asyncio
+        from services.vector_client import AsyncResilientClient, ClientMetrics
+
+        calls = []
+
+        async def search(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return ["hit"]
+
+        inner = MagicMock()
+        inner.search = search
+        metrics = ClientMetrics()
+        client = AsyncResilientClient(inner, "grpc", timeout=0.05, retries=1, backoff_ms=0, metrics=metrics)
+
+        assert asyncio.run(client.search(collection_name="legis")) == ["hit"]
+        assert len(calls) == 2
+        assert metrics.get_stats()["grpc.search"]["retries"] == 1
+
+
+class TestIngestPipeline:
+    """Test the streaming ingestion pipeline"""
+
+    def test_batches_are_length_sorted_and_bounded(self):
+        import numpy as np
+        from services.ingest_pipeline import IngestPipeline
+
+        encoded, upserted = [], []
+
+        def encode(texts):
+            encoded.append([len(t) for t in texts])
+            return np.ones((len(texts), 4), dtype=np.float32)
+
+        pipeline = IngestPipeline(encode, upserted.append, batch_size=2, sort_window=4, upserts_in_flight=2)
+        documents = ((i, {"n": i}, "x" * length) for i, length in enumerate([1, 9, 3, 7, 5, 2]))
+        stats = pipeline.run(documents)
+
+        # Sorted within each window of 4, never across windows
+        assert encoded == [[9, 7], [3, 1], [5, 2]]
+        assert sorted(p.id for batch in upserted for p in batch) == list(range(6))
+        assert all(p.payload == {"n": p.id} for batch in upserted for p in batch)
+        assert stats["chunks"] == 6
+        assert stats["batches"] == 3
+
+    def test_last_batch_goes_through_final_upsert(self):
+        import numpy as np
+        from services.ingest_pipeline import IngestPipeline
+
+        upserted, final = [], []
+
+        def final_upsert(points):
+            # Every other batch was acknowledged before
+            assert len(upserted) == 2
+            final.append(points)
+
+        pipeline = IngestPipeline(
+            lambda texts: np.ones((len(texts), 2)), upserted.append, final_upsert=final_upsert,
+            batch_size=2, sort_window=2, upserts_in_flight=2
+        )
+        pipeline.run((i, {}, "texto") for i in range(6))
+
+        assert [p.id for p in final[0]] == [4, 5]
+
+    def test_upsert_time_is_cumulative_worker_time(self):
+        import time
+        import numpy as np
+        from services.ingest_pipeline import IngestPipeline
+
+        def upsert(points):
+            time.sleep(0.02)
+
+        pipeline = IngestPipeline(
+            lambda texts: np.ones((len(texts), 2)), upsert,
+            batch_size=1, sort_window=6, upserts_in_flight=3
+        )
+        stats = pipeline.run((i, {}, "texto") for i in range(6))
+
+        # Every upsert is counted once, even when the workers overlap
+        assert stats["upsert_worker_time_s"] >= 0.12
+        assert stats["upsert_wait_s"] <= stats["elapsed_s"]
+
+    def test_upsert_errors_are_raised(self):
+        import numpy as np
+        from services.ingest_pipeline import IngestPipeline
+
+        def upsert(points):
+            raise ConnectionError("qdrant down")
+
+        pipeline = IngestPipeline(
+            lambda texts: np.zeros((len(texts), 2)), upsert,
+            batch_size=1, sort_window=1, upserts_in_flight=1
+        )
+
+        with pytest.raises(ConnectionError):
+            pipeline.run((i, {}, "texto") for i in range(10))
+
+
+class TestEncoderBackend:
+    """Test the pluggable embedding encoder backends"""
+
+    def test_onnx_encoder_pools_and_keeps_input_order(self):
+        import numpy as np
+        from services.encoder_backend import OnnxEncoder
+
+        encoder = object.__new__(OnnxEncoder)
+        encoder.meta = {"dimension": 2}
+        encoder.max_seq_length = 16
+        encoder.input_names = {"input_ids", "attention_mask"}
+
+        def tokenize(texts, **kwargs):
+            length = max(len(t) for t in texts)
+            mask = np.array([[1] * len(t) + [0] * (length - len(t)) for t in texts])
+            return {"input_ids": mask.copy(), "attention_mask": mask}
+
+        encoder.tokenizer = tokenize
+        encoder.session = MagicMock()
+        # Hidden state of each real token is (text length, 1); padding is garbage
+        encoder.session.run.side_effect = lambda _, inputs: [np.stack([
+            [[row.sum(), 1.0] if m else [99.0, 99.0] for m in row] for row in inputs["attention_mask"]
+        ]).astype(np.float32)]
+
+        vectors = encoder.encode(["ab", "abcd", "a"], batch_size=2)
+
+        assert vectors.tolist() == [[2.0, 1.0], [4.0, 1.0], [1.0, 1.0]]
+        assert np.allclose(np.linalg.norm(encoder.encode("abc", normalize_embeddings=True)), 1.0)
+
+    def test_missing_export_falls_back_to_torch(self, tmp_path, monkeypatch):
+        import sentence_transformers
+        from services.encoder_backend import load_encoder
+
+        monkeypatch.setenv("EMBEDDING_ONNX_DIR", str(tmp_path))
+        monkeypatch.setattr(sentence_transformers, "SentenceTransformer", MagicMock())
+
+        encoder = load_encoder("intfloat/multilingual-e5-large", backend="onnx")
+
+        assert encoder.backend == "torch"
+
+    def test_parity_check_reports_drift(self):
+        import numpy as np
+        from services.encoder_backend import parity_check
+
+        base = np.eye(3, dtype=np.float32)
+        noisy = base + np.array([[0, 0.1, 0], [0, 0, 0], [0, 0, 0]], dtype=np.float32)
+        noisy /= np.linalg.norm(noisy, axis=1, keepdims=True)
+
+        reference = MagicMock()
+        reference.encode.return_value = base
+        candidate = MagicMock()
+        candidate.encode.return_value = noisy
+
+        report = parity_check(reference, candidate, ["a", "b", "c"])
+
+        assert report["min_cosine"] == pytest.approx(1 / np.sqrt(1.01), abs=1e-4)
+        assert report["max_drift"] > 0
+        assert report["mean_cosine"] > report["min_cosine"]
+
+
+class TestModelRegistry:
+    """Test the shared embedding model registry"""
+
+    @pytest.fixture
+    def registry(self, monkeypatch):
+        import time
+        import services.model_registry as registry_module
+
+        loads = []
+
+        def fake_load(model, device="cpu", backend=None):
+            loads.append((model, device, backend))
+            time.sleep(0.05)
+            return MagicMock(name=model)
+
+        monkeypatch.setattr(registry_module, "load_encoder", fake_load)
+        monkeypatch.setenv("EMBEDDING_BACKEND", "torch")
+        registry = registry_module.ModelRegistry()
+        registry.loads = loads
+        return registry
+
+    def test_concurrent_gets_share_one_load(self, registry):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            encoders = list(pool.map(lambda _: registry.get("e5", "cpu"), range(8)))
+
+        assert len(registry.loads) == 1
+        assert all(encoder is encoders[0] for encoder in encoders)
+        # auto/env defaults resolve to the same key
+        assert registry.get("e5") is encoders[0]
+        assert registry.get("e5", dtype="float16") is not encoders[0]
+
+    def test_warm_up_loads_in_background(self, registry):
+        future = registry.warm_up("e5")
+
+        encoder = future.result(timeout=5)
+
+        assert registry.is_ready("e5")
+        encoder._encoder.encode.assert_called_once()
+        stats = registry.get_stats()["models"]
+        assert stats["e5@cpu/float32/torch"]["state"] == "ready"
+        assert stats["e5@cpu/float32/torch"]["load_time_s"] is not None
+
+    def test_failed_load_is_retried(self, registry, monkeypatch):
+        import services.model_registry as registry_module
+
+        monkeypatch.setattr(registry_module, "load_encoder", MagicMock(side_effect=[OSError("no disk"), MagicMock()]))
+
+        with pytest.raises(OSError):
+            registry.get("e5")
+        assert registry.get_stats()["models"]["e5@cpu/float32/torch"]["state"] == "failed"
+        assert registry.get("e5") is not None
+
+
+class TestPrefork:
+    """Test the gunicorn --preload helpers"""
+
+    def test_worker_threads_split_cores(self, monkeypatch):
+        from services.prefork import worker_threads
+
+        monkeypatch.setattr("os.cpu_count", lambda: 8)
+        monkeypatch.setenv("EMBEDDING_TORCH_THREADS", "0")
+        monkeypatch.setenv("WEB_CONCURRENCY", "4")
+        assert worker_threads() == 2
+
+        monkeypatch.setenv("WEB_CONCURRENCY", "16")
+        assert worker_threads() == 1
+
+        monkeypatch.setenv("EMBEDDING_TORCH_THREADS", "3")
+        assert worker_threads() == 3
+
+    def test_preload_skips_onnx(self, monkeypatch):
+        from services.model_registry import ModelKey, model_registry
+        from services.prefork import preload_models
+
+        get = MagicMock()
+        monkeypatch.setattr(model_registry, "resolve", lambda *args, **kwargs: ModelKey("e5", "cpu", "int8", "onnx"))
+        monkeypatch.setattr(model_registry, "get", get)
+
+        assert preload_models("e5", "cpu") is None
+        get.assert_not_called()
+
+    def test_preload_loads_torch_single_threaded(self, monkeypatch):
+        import gc
+        import torch
+        from services.model_registry import ModelKey, model_registry
+        from services.prefork import preload_models
+
+        encoder = MagicMock()
+        monkeypatch.setattr(model_registry, "resolve", lambda *args, **kwargs: ModelKey("e5", "cpu", "float32", "torch"))
+        monkeypatch.setattr(model_registry, "get", MagicMock(return_value=encoder))
+
+        threads = torch.get_num_threads()
+        try:
+            assert preload_models("e5", "cpu") is encoder
+            assert torch.get_num_threads() == 1
+        finally:
+            gc.unfreeze()
+            torch.set_num_threads(threads)
+
+
+class TestStartupReport:
+    """Test the cold start timeline"""
+
+    def test_phases_are_timed_in_order(self):
+        from services.startup import StartupReport
+
+        report = StartupReport()
+        with report.phase("services"):
+            pass
+        with pytest.raises(RuntimeError):
+            with report.phase("qdrant"):
+                raise RuntimeError("connection refused")
+
+        phases = report.get_stats()["phases"]
+        assert list(phases) == ["services", "qdrant"]
+        assert phases["services"]["state"] == "done"
+        assert phases["qdrant"]["state"] == "failed"
+        assert phases["qdrant"]["error"] == "connection refused"
+        assert report.failed_phases() == ["qdrant"]
+
+    def test_tracked_future_ends_its_phase(self):
+        from concurrent.futures import Future
+        from services.startup import StartupReport
+
+        report = StartupReport()
+        future = report.track("embedding_model", Future())
+        assert report.get_stats()["phases"]["embedding_model"]["state"] == "running"
+
+        future.set_result(MagicMock())
+        assert report.get_stats()["phases"]["embedding_model"]["state"] == "done"
+
+    def test_ready_flag(self):
+        from services.startup import StartupReport
+
+        report = StartupReport()
+        assert not report.wait_ready(timeout=0.01)
+
+        report.mark_ready()
+
+        assert report.is_ready
+        assert report.get_stats()["ready_after_s"] is not None
+        assert "ready after" in report.summary()
@@ -85,11 +85,22 @@ def ingest_to_qdrant(documents: dict):
 
         # Bulk insert
         try:
-            rag.bulk_insert(collection, bulk_data)
-            print(f"✓ Successfully ingested {len(docs)} documents into {collection}")
+            stats = rag.bulk_insert(collection, bulk_data)
+            print(f"✓ Successfully ingested {len(docs)} documents into {collection} ({stats['chunks_per_s']} chunks/s)")
+            indexed = rag.build_lexical_index(collection)
+            print(f"✓ Built BM25 index for {collection} ({indexed} chunks)")
+            keys = rag.build_citation_index(collection, bulk_data)
+            print(f"✓ Indexed {keys} citation keys for {collection}")
         except Exception as e:
             print(f"✗ Error ingesting into {collection}: {e}")
 
+    # Area centroids are trained over every collection at once
+    try:
+        areas = rag.build_area_classifier()
+        print(f"\n✓ Trained area classifier ({areas} areas)")
+    except Exception as e:
+        print(f"\n✗ Error training area classifier: {e}")
+
 
 def build_sample_corpus(output_dir: str):
     """
@@ -257,6 +268,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Build and ingest legal corpus")
     parser.add_argument("--sample", action="store_true", help="Build sample corpus")
     parser.add_argument("--ingest", type=str, help="Ingest JSON files from directory")
+    parser.add_argument("--backfill-dates", action="store_true",
+                        help="Add epoch-day date fields and indexes to existing collections")
+    parser.add_argument("--build-area-classifier", action="store_true",
+                        help="Train the query area classifier from existing collections")
 
     args = parser.parse_args()
 
@@ -278,5 +293,16 @@ if __name__ == "__main__":
         print("\nIngesting into Qdrant...")
         ingest_to_qdrant(docs)
 
+    elif args.backfill_dates:
+        rag = get_rag_system()
+        rag.create_collections()
+        for collection in rag.collections.values():
+            updated = rag.backfill_date_payloads(collection)
+            print(f"✓ {collection}: {updated} points updated")
+
+    elif args.build_area_classifier:
+        areas = get_rag_system().build_area_classifier()
+        print(f"✓ Trained area classifier ({areas} areas)")
+
     else:
         parser.print_help()
@@ -13,9 +13,11 @@ from datetime import datetime
 from typing import List, Dict, Optional
 import PyPDF2
 from tqdm import tqdm
-from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from services.vector_client import create_qdrant_client
+from services.model_registry import model_registry
 
 # Configuração
 EBOOKS_DIR = Path("D:/doutora-ia/direito")
@@ -26,8 +28,8 @@ CHUNK_SIZE = 500  # caracteres por chunk
 CHUNK_OVERLAP = 50  # overlap entre chunks
 
 # Inicializar
-encoder = SentenceTransformer(EMBEDDING_MODEL)
-qdrant = QdrantClient(url=QDRANT_URL)
+encoder = model_registry.get(EMBEDDING_MODEL, backend="torch")
+qdrant = create_qdrant_client(url=QDRANT_URL)
 
 # Metadata para rastreamento
 METADATA_FILE = Path("D:/doutora-ia/ingest/processed_books.json")
@@ -2,12 +2,19 @@
 Normalize legal documents to JSON format for RAG ingestion
 """
 import json
+import os
 import re
+import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 import hashlib
 
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.services.dates import epoch_days
+
 
 def generate_id(text: str, prefix: str = "") -> str:
     """Generate unique ID from text"""
@@ -15,6 +22,12 @@ def generate_id(text: str, prefix: str = "") -> str:
     return f"{prefix}_{hash_obj.hexdigest()[:12]}"
 
 
+def add_epoch_days(chunk: Dict) -> Dict:
+    """Store data/vigência as integer epoch days so Qdrant can range-filter them"""
+    chunk.update(epoch_days(chunk))
+    return chunk
+
+
 def chunk_text(text: str, max_length: int = 1000, overlap: int = 100) -> List[str]:
     """
     Split text into chunks with overlap
@@ -283,18 +296,28 @@ def normalize_document(data: Dict, tipo: str) -> List[Dict]:
         List of normalized chunks
     """
     if tipo == "lei":
-        return normalize_lei(data)
+        chunks = normalize_lei(data)
     elif tipo == "sumula":
-        return [normalize_sumula(data)]
+        chunks = [normalize_sumula(data)]
     elif tipo == "juris":
-        return normalize_jurisprudencia(data)
+        chunks = normalize_jurisprudencia(data)
     elif tipo == "regulatorio":
-        return normalize_regulatorio(data)
+        chunks = normalize_regulatorio(data)
     elif tipo == "doutrina":
-        return normalize_doutrina(data)
+        chunks = normalize_doutrina(data)
     else:
         raise ValueError(f"Unknown document type: {tipo}")
 
+    # Source document and position of text-split chunks, so retrieval can
+    # merge adjacent ones (a single article or súmula has nothing to merge)
+    if len(chunks) > 1:
+        documento_id = generate_id(f"{tipo}_{data.get('titulo', '')}_{data.get('numero', '')}", "doc")
+        for i, chunk in enumerate(chunks):
+            chunk["documento_id"] = documento_id
+            chunk["chunk_index"] = i
+
+    return [add_epoch_days(chunk) for chunk in chunks]
+
 
 if __name__ == "__main__":
     # Example usage
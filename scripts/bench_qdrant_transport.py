@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compara a latência de busca do Qdrant via REST (JSON) e gRPC (protobuf)
+
+Usa vetores da própria coleção como consultas e roda as mesmas buscas nos
+dois transportes, com e sem payload, para expor o custo de serialização.
+Os números são os mesmos que a API publica em /metrics ("qdrant").
+
+Uso:
+    python scripts/bench_qdrant_transport.py
+    python scripts/bench_qdrant_transport.py --collection doutrina --queries 200 --limit 20
+"""
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "api"))
+
+from services.vector_client import create_qdrant_client, client_metrics
+from services.collection_profile import load_collection_profiles, full_vector
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qdrant search latency over REST and gRPC")
+    parser.add_argument("--collection", type=str, default="legis")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    clients = {
+        "rest": create_qdrant_client(prefer_grpc=False),
+        "grpc": create_qdrant_client(prefer_grpc=True)
+    }
+
+    points, _ = clients["rest"].scroll(
+        collection_name=args.collection,
+        limit=args.queries,
+        with_payload=False,
+        with_vectors=True
+    )
+    profile = load_collection_profiles().get(args.collection)
+    vectors = [profile.query_vector(full_vector(p.vector)) for p in points if p.vector is not None]
+    if not vectors:
+        logger.error(f"No vectors found in {args.collection}")
+        return
+
+    for with_payload in (False, True):
+        client_metrics.reset()
+        for transport, client in clients.items():
+            for vector in vectors:
+                client.search(
+                    collection_name=args.collection,
+                    query_vector=vector,
+                    limit=args.limit,
+                    with_payload=with_payload
+                )
+
+        stats = client_metrics.get_stats()
+        label = "with payload" if with_payload else "ids only"
+        for transport in clients:
+            search = stats[f"{transport}.search"]
+            logger.info(
+                f"{transport:4s} {label:12s}: p50 {search['p50_ms']} ms, p95 {search['p95_ms']} ms "
+                f"({search['calls']} calls)"
+            )
+
+
+if __name__ == "__main__":
+    main()
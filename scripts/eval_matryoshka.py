@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Avalia vetores Matryoshka (prefixo truncado + rescoring com o vetor completo)
+
+Para cada coleção, compara o top-k da busca exata com o vetor completo de
+1024 dimensões (baseline) com:
+  - busca só no prefixo truncado e renormalizado (dim 256, 384, ...);
+  - busca no prefixo de limit * oversampling candidatos, reordenados com o
+    vetor completo (o que a API faz com matryoshka.dim > 0).
+
+A simulação usa os vetores já gravados (amostra de --max-points pontos) e as
+consultas de exemplo, então serve para escolher a dimensão antes de recriar
+as coleções. Com --live, mede também a busca real nas coleções que já estão
+no layout Matryoshka.
+
+Uso:
+    python scripts/eval_matryoshka.py
+    python scripts/eval_matryoshka.py --dims 256 384 --oversampling 4 --collection doutrina
+    python scripts/eval_matryoshka.py --queries consultas.txt --live
+"""
+
+import sys
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "api"))
+
+from qdrant_client.models import SearchParams, QuantizationSearchParams
+
+from rag import get_rag_system
+from services.collection_profile import FULL_VECTOR, full_vector
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+SAMPLE_QUERIES = [
+    "fraude PIX banco não devolve o valor",
+    "golpe do boleto falso responsabilidade do banco",
+    "negativação indevida no SPC dano moral",
+    "cobrança de tarifa bancária não contratada",
+    "pensão alimentícia atrasada prisão do devedor",
+    "revisão de pensão alimentícia por desemprego",
+    "guarda compartilhada e convivência com os filhos",
+    "divórcio e partilha de bens na união estável",
+    "plano de saúde negou cobertura de cirurgia",
+    "reajuste abusivo de plano de saúde por faixa etária",
+    "home care negado pelo plano de saúde",
+    "voo cancelado indenização por dano moral",
+    "extravio de bagagem em voo internacional",
+    "overbooking companhia aérea direitos do passageiro",
+    "produto com defeito troca no prazo de garantia",
+    "compra pela internet direito de arrependimento",
+    "tutela de urgência requisitos",
+    "prescrição da pretensão de reparação civil",
+    "inversão do ônus da prova no código de defesa do consumidor",
+    "responsabilidade objetiva do fornecedor de serviços",
+]
+
+
+def load_vectors(client, collection: str, max_points: int, batch_size: int = 512) -> np.ndarray:
+    """Full vectors of up to max_points points, normalized"""
+    vectors = []
+    offset = None
+    while len(vectors) < max_points:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=min(batch_size, max_points - len(vectors)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=True
+        )
+        vectors.extend(full_vector(p.vector) for p in points if p.vector is not None)
+        if offset is None:
+            break
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def truncate(matrix: np.ndarray, dim: int) -> np.ndarray:
+    prefix = matrix[:, :dim]
+    return prefix / np.maximum(np.linalg.norm(prefix, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best scores per row, best first"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def simulate(queries: np.ndarray, corpus: np.ndarray, dims: List[int], k: int, oversampling: float) -> List[dict]:
+    truth = top_k(queries @ corpus.T, k)
+    rows = []
+
+    for dim in dims:
+        short_corpus = truncate(corpus, dim)
+        started = time.perf_counter()
+        short_scores = truncate(queries, dim) @ short_corpus.T
+        short_ms = (time.perf_counter() - started) / len(queries) * 1000
+
+        candidates = top_k(short_scores, int(np.ceil(k * oversampling)))
+        rescored = []
+        for query, ids in zip(queries, candidates):
+            full_scores = corpus[ids] @ query
+            rescored.append(ids[np.argsort(-full_scores)[:k]])
+
+        rows.append({
+            "dim": dim,
+            "recall_short": recall(top_k(short_scores, k), truth),
+            "recall_rescored": recall(np.asarray(rescored), truth),
+            "ram_ratio": dim / corpus.shape[1],
+            "short_ms": short_ms
+        })
+    return rows
+
+
+def live_recall(rag, collection: str, queries: np.ndarray, k: int) -> float:
+    """Recall@k of the API search path (short search + rescoring) against exact full-vector search"""
+    profile = rag.profiles.get(collection)
+    exact = SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+    rag.hybrid_enabled = False
+
+    found = truth = 0
+    for query in queries.tolist():
+        expected = {
+            hit.id for hit in rag.client.search(
+                collection, query_vector=(FULL_VECTOR, query) if profile.matryoshka else query,
+                limit=k, search_params=exact, with_payload=False
+            )
+        }
+        results = rag._search_collection(collection, query, None, k)
+        found += len(expected & {r["_id"] for r in results})
+        truth += len(expected)
+    return found / max(truth, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of Matryoshka short vectors vs full vectors")
+    parser.add_argument("--collection", type=str, help="Single collection (default: all)")
+    parser.add_argument("--dims", type=int, nargs="*", default=[256, 384, 512])
+    parser.add_argument("--oversampling", type=float, default=4.0, help="Candidates = k * oversampling")
+    parser.add_argument("--k", type=int, default=10, help="Recall cutoff")
+    parser.add_argument("--max-points", type=int, default=50000, help="Points sampled per collection")
+    parser.add_argument("--queries", type=str, help="File with one query per line (default: built-in samples)")
+    parser.add_argument("--live", action="store_true", help="Also measure collections already in the Matryoshka layout")
+    args = parser.parse_args()
+
+    texts = SAMPLE_QUERIES
+    if args.queries:
+        texts = [line.strip() for line in open(args.queries, encoding="utf-8") if line.strip()]
+
+    rag = get_rag_system()
+    queries = np.asarray(rag._encode_queries(texts), dtype=np.float32)
+    collections = [args.collection] if args.collection else list(rag.collections.values())
+
+    print("\n" + "=" * 78)
+    print(f"{'collection':<14}{'points':>9}{'dim':>6}{'RAM':>7}{f'recall@{args.k}':>11}"
+          f"{'+rescore':>10}{'ms/query':>10}")
+    print("-" * 78)
+
+    for collection in collections:
+        try:
+            corpus = load_vectors(rag.client, collection, args.max_points)
+        except Exception as e:
+            logger.warning(f"{collection}: {e}")
+            continue
+        if len(corpus) < args.k:
+            print(f"{collection:<14}{len(corpus):>9}  (too few points)")
+            continue
+
+        for row in simulate(queries, corpus, args.dims, args.k, args.oversampling):
+            print(f"{collection:<14}{len(corpus):>9}{row['dim']:>6}{row['ram_ratio']:>7.0%}"
+                  f"{row['recall_short']:>11.4f}{row['recall_rescored']:>10.4f}{row['short_ms']:>10.2f}")
+
+        if args.live and rag.profiles.get(collection).matryoshka:
+            print(f"{collection:<14}{'live':>9}{rag.profiles.get(collection).matryoshka_dim:>6}{'':>7}"
+                  f"{'':>11}{live_recall(rag, collection, queries, args.k):>10.4f}")
+
+    print("=" * 78)
+    print(f"Baseline: exact search over the full vectors; rescoring over {args.k} x {args.oversampling:g} candidates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Exporta as coleções do Qdrant para o índice vetorial local (sem Qdrant)
+
+Copia vetores (float16, mapeados em memória), payloads e índices de payload
+para LOCAL_INDEX_DIR. Com VECTOR_BACKEND=auto a API usa esse índice quando
+o Qdrant não responde; com VECTOR_BACKEND=local, sempre.
+
+Para gerar o índice direto da ingestão, sem Qdrant, rode a ingestão com
+VECTOR_BACKEND=local (ex.: python ingest/build_corpus.py --sample).
+
+Uso:
+    python scripts/export_local_index.py
+    python scripts/export_local_index.py --collection legis sumulas --output /data/vectors
+"""
+
+import sys
+import time
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "api"))
+
+from services.local_index import LocalIndexClient, export_from_qdrant, local_index_dir
+from services.vector_client import create_qdrant_client
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ["legis", "sumulas", "juris", "regulatorio", "doutrina"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Qdrant collections to the local vector index")
+    parser.add_argument("--collection", nargs="*", default=COLLECTIONS, help="Collections to export")
+    parser.add_argument("--output", type=str, default=None, help="Target directory (default: LOCAL_INDEX_DIR)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    source = create_qdrant_client()
+    target = LocalIndexClient(args.output or local_index_dir())
+
+    started = time.perf_counter()
+    copied = export_from_qdrant(source, target, args.collection, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    for name, count in copied.items():
+        logger.info(f"{name}: {count} points")
+    logger.info(f"Exported {sum(copied.values())} points to {target.path} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Exporta o modelo de embeddings para ONNX com quantização int8 dinâmica
+
+Gera EMBEDDING_ONNX_DIR/<modelo>/ (modelo int8 + tokenizer) e compara os
+vetores do ONNX com os do modelo fp32 (PyTorch) em consultas e trechos
+jurídicos de exemplo: cosseno médio/mínimo e ganho de velocidade. Com
+EMBEDDING_BACKEND=auto a API passa a usar o export na próxima subida.
+
+Requer as dependências de exportação (onnx), fora da imagem da API:
+    pip install -r api/requirements-export.txt
+
+Uso:
+    python scripts/export_onnx_encoder.py
+    python scripts/export_onnx_encoder.py --check-only --threads 4
+"""
+
+import os
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "api"))
+
+from services.encoder_backend import OnnxEncoder, export_onnx, onnx_model_dir, parity_check
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+SAMPLE_TEXTS = [
+    "query: fraude PIX banco não devolve o valor",
+    "query: pensão alimentícia atrasada prisão do devedor",
+    "query: plano de saúde negou cobertura de cirurgia",
+    "query: dano moral por negativação indevida",
+    "query: guarda compartilhada dos filhos",
+    "query: rescisão indireta por atraso de salário",
+    "passage: O fornecedor de serviços responde, independentemente da existência de culpa, "
+    "pela reparação dos danos causados aos consumidores por defeitos relativos à prestação dos serviços.",
+    "passage: A tutela de urgência será concedida quando houver elementos que evidenciem a probabilidade "
+    "do direito e o perigo de dano ou o risco ao resultado útil do processo.",
+    "passage: As instituições financeiras respondem objetivamente pelos danos gerados por fortuito interno "
+    "relativo a fraudes e delitos praticados por terceiros no âmbito de operações bancárias.",
+    "passage: A obrigação alimentar dos avós tem natureza complementar e subsidiária, somente se configurando "
+    "no caso de impossibilidade total ou parcial de seu cumprimento pelos pais.",
+]
+
+# Minimum mean cosine against fp32 to accept the export
+MIN_MEAN_COSINE = 0.99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX and check parity")
+    parser.add_argument("--model", type=str, default=os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large"))
+    parser.add_argument("--output", type=str, default=None, help="Target directory (default: EMBEDDING_ONNX_DIR/<model>)")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--check-only", action="store_true", help="Skip the export, only run the parity check")
+    args = parser.parse_args()
+
+    output = Path(args.output) if args.output else onnx_model_dir(args.model)
+    if not args.check_only:
+        logger.info(f"Exporting {args.model} to {output}...")
+        export_onnx(args.model, output)
+        size = sum(f.stat().st_size for f in output.iterdir()) / 1e6
+        logger.info(f"Export done ({size:.0f} MB)")
+
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(args.model, device="cpu")
+    candidate = OnnxEncoder(output, intra_op_threads=args.threads)
+
+    # Warm-up, so the timings exclude first-call allocation
+    parity_check(reference, candidate, SAMPLE_TEXTS[:2])
+    report = parity_check(reference, candidate, SAMPLE_TEXTS * 4)
+
+    logger.info(
+        f"Cosine vs fp32: mean {report['mean_cosine']}, min {report['min_cosine']} "
+        f"(max drift {report['max_drift']})"
+    )
+    logger.info(
+        f"{report['texts']} texts: PyTorch {report['reference_ms']} ms, "
+        f"ONNX int8 {report['candidate_ms']} ms ({report['speedup']}x, {candidate.intra_op_threads} threads)"
+    )
+
+    if report["mean_cosine"] < MIN_MEAN_COSINE:
+        logger.error(f"Mean cosine below {MIN_MEAN_COSINE}: do not deploy this export")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
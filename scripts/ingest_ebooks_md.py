@@ -20,6 +20,12 @@ from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 from collections import Counter, defaultdict
 
+# BM25 index helpers live in the API package
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from services.lexical import BM25IndexBuilder, lexical_index_dir, build_lexical_index_from_qdrant
+from services.vector_client import create_qdrant_client
+from services.collection_profile import load_collection_profiles
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(message)s',
@@ -32,7 +38,6 @@ logger = logging.getLogger(__name__)
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
-VECTOR_DIM = 1024
 CHUNK_SIZE = 4000       # characters (~1000 tokens)
 CHUNK_OVERLAP = 800     # characters (~200 tokens)
 ENCODE_BATCH_SIZE = 256 # texts per GPU batch
@@ -212,6 +217,11 @@ def process_file_to_chunks(md_file: Path, collection: str, area: Optional[str]):
             "fonte_arquivo": md_file.name,
             "chunk_index": i,
             "total_chunks": total,
+            # Ebooks carry no publication/vigência dates; explicit nulls keep
+            # them matching date-filtered searches (is_empty condition)
+            "data_epoch_day": None,
+            "vigencia_inicio_epoch_day": None,
+            "vigencia_fim_epoch_day": None,
             "metadata": {
                 "source_file": md_file.name,
                 "source_dir": md_file.parent.name,
@@ -221,7 +231,7 @@ def process_file_to_chunks(md_file: Path, collection: str, area: Optional[str]):
         yield (f"passage: {chunk}", payload, doc_id)
 
 
-def flush_buffer(buffer, model, client, collection, qdrant_batch_size):
+def flush_buffer(buffer, model, client, collection, qdrant_batch_size, profile):
     """Encode a buffer of chunks and upsert to Qdrant. Returns count inserted."""
     if not buffer:
         return 0
@@ -250,7 +260,7 @@ def flush_buffer(buffer, model, client, collection, qdrant_batch_size):
         points = [
             PointStruct(
                 id=ids[j],
-                vector=embeddings[j].tolist(),
+                vector=profile.point_vector(embeddings[j].tolist()),
                 payload=payloads[j]
             )
             for j in range(i, batch_end)
@@ -324,22 +334,21 @@ def main():
 
     # ---- Step 2: Initialize model + Qdrant ----
     logger.info(f"\nLoading embedding model: {EMBEDDING_MODEL} ...")
-    from sentence_transformers import SentenceTransformer
     import torch
+    from services.model_registry import model_registry, ingest_backend
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     logger.info(f"Device: {device}" + (f" ({torch.cuda.get_device_name(0)})" if device == "cuda" else ""))
 
-    model = SentenceTransformer(EMBEDDING_MODEL, device=device)
-    if device == "cuda":
-        model.half()
-        logger.info("Using FP16 for faster GPU encoding")
+    # FP16 for faster GPU encoding; same backend as RAGSystem.bulk_insert for every stored passage
+    model = model_registry.get(
+        EMBEDDING_MODEL, device, dtype="float16" if device == "cuda" else "float32", backend=ingest_backend()
+    )
     logger.info(f"Model loaded. Vector dim: {model.get_sentence_embedding_dimension()}")
 
-    from qdrant_client import QdrantClient
-    from qdrant_client.models import Distance, VectorParams
-
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    client = create_qdrant_client()
+    # Same layout as the API expects (named short/full vectors when Matryoshka is on)
+    profiles = load_collection_profiles()
     logger.info(f"Connected to Qdrant at {QDRANT_HOST}:{QDRANT_PORT}")
 
     # Create collections if needed
@@ -353,10 +362,8 @@ def main():
                 logger.info(f"  Skipping (--skip-existing)")
                 skip_collections.add(col_name)
         except Exception:
-            client.create_collection(
-                collection_name=col_name,
-                vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE)
-            )
+            profiles.get(col_name).create(client)
+            profiles.get(col_name).ensure_payload_indexes(client)
             logger.info(f"Created collection '{col_name}'")
 
     # ---- Step 3: Stream process each collection ----
@@ -399,6 +406,10 @@ def main():
         col_inserted = 0
         col_chunks = 0
         buffer = []  # list of (text, payload, id)
+        # BM25 postings over the same ids/texts, spilled to disk at every flush
+        # and merged at the end; a resumed collection is rebuilt from Qdrant
+        # instead since earlier chunks are not re-read
+        lexical = BM25IndexBuilder(spill_dir=lexical_index_dir()) if start_file == 0 else None
 
         for file_idx, (md_file, area) in enumerate(files):
             # Skip files already processed in previous run
@@ -409,15 +420,19 @@ def main():
             for item in process_file_to_chunks(md_file, collection, area):
                 buffer.append(item)
                 col_chunks += 1
+                if lexical is not None:
+                    lexical.add(item[2], item[1]["texto"])
 
                 # Flush buffer when full
                 if len(buffer) >= FLUSH_EVERY:
                     logger.info(f"  Flush {col_inserted}-{col_inserted+len(buffer)} "
                                 f"(file {file_idx+1}/{len(files)}, {col_chunks:,} chunks so far)")
-                    inserted = flush_buffer(buffer, model, client, collection, QDRANT_BATCH_SIZE)
+                    inserted = flush_buffer(buffer, model, client, collection, QDRANT_BATCH_SIZE, profiles.get(collection))
                     col_inserted += inserted
                     total_inserted += inserted
                     buffer.clear()
+                    if lexical is not None:
+                        lexical.spill()
                     gc.collect()
 
                     # Save checkpoint
@@ -434,12 +449,18 @@ def main():
         # Flush remaining buffer
         if buffer:
             logger.info(f"  Final flush: {len(buffer)} chunks")
-            inserted = flush_buffer(buffer, model, client, collection, QDRANT_BATCH_SIZE)
+            inserted = flush_buffer(buffer, model, client, collection, QDRANT_BATCH_SIZE, profiles.get(collection))
             col_inserted += inserted
             total_inserted += inserted
             buffer.clear()
             gc.collect()
 
+        if lexical is not None:
+            lexical.write(lexical_index_dir() / collection)
+        else:
+            logger.info(f"  Rebuilding BM25 index for '{collection}' from Qdrant...")
+            build_lexical_index_from_qdrant(client, collection)
+
         col_time = time.time() - col_t0
         logger.info(f"  Collection '{collection}' done: {col_inserted:,} chunks "
                     f"in {col_time:.0f}s ({col_time/60:.1f}min)")
@@ -208,6 +208,8 @@ def process_pdf_to_chunks(pdf_path: Path, chunk_size: int = 1000) -> List[Dict]:
                     "area": detect_area(filename + " " + chunk_text[:500]),
                     "fonte_url": None,
                     "hierarquia": get_hierarchy_score(doc_type),
+                    "fonte_arquivo": pdf_path.name,
+                    "chunk_index": chunk_num,
                     "metadata": {
                         "source_file": pdf_path.name,
                         "chunk_number": chunk_num,
@@ -233,6 +235,8 @@ def process_pdf_to_chunks(pdf_path: Path, chunk_size: int = 1000) -> List[Dict]:
                 "area": detect_area(filename + " " + chunk_text[:500]),
                 "fonte_url": None,
                 "hierarquia": get_hierarchy_score(doc_type),
+                "fonte_arquivo": pdf_path.name,
+                "chunk_index": chunk_num,
                 "metadata": {
                     "source_file": pdf_path.name,
                     "chunk_number": chunk_num,
@@ -311,22 +315,15 @@ def ingest_to_qdrant(documents: Dict[str, List[Dict]], batch_size: int = 100):
 
             logger.info(f"\nIngesting {len(docs)} documents into '{collection}'...")
 
-            # Process in batches
-            for i in range(0, len(docs), batch_size):
-                batch = docs[i:i + batch_size]
-
-                # Prepare for bulk insert: (id, payload, text)
-                bulk_data = [
-                    (doc["id"], doc, doc["texto"])
-                    for doc in batch
-                ]
-
-                try:
-                    rag.bulk_insert(collection, bulk_data)
-                    total_ingested += len(batch)
-                    logger.info(f"  Batch {i // batch_size + 1}: {len(batch)} docs ingested")
-                except Exception as e:
-                    logger.error(f"  Error ingesting batch: {e}")
+            # Stream the whole collection: encode batches overlap with in-flight upserts
+            bulk_data = ((doc["id"], doc, doc["texto"]) for doc in docs)
+
+            try:
+                stats = rag.bulk_insert(collection, bulk_data, batch_size=batch_size)
+                total_ingested += stats["chunks"]
+                logger.info(f"  {stats['chunks']} docs ingested ({stats['chunks_per_s']} chunks/s)")
+            except Exception as e:
+                logger.error(f"  Error ingesting collection: {e}")
 
         logger.info(f"\n{'='*50}")
         logger.info(f"Total documents ingested: {total_ingested}")
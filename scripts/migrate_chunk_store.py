@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Move o texto dos chunks do payload do Qdrant para o chunk store externo
+
+Copia o campo texto de cada ponto para CHUNK_STORE_PATH (SQLite, zstd) e,
+com --strip, remove o campo do payload no Qdrant. As buscas passam a
+trafegar só metadados e buscam o texto dos resultados finais no chunk store.
+
+Uso:
+    python scripts/migrate_chunk_store.py
+    python scripts/migrate_chunk_store.py --strip
+    python scripts/migrate_chunk_store.py --collection doutrina --strip
+"""
+
+import sys
+import time
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "api"))
+
+from rag import get_rag_system
+from services.chunk_store import ChunkStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+
+def migrate_collection(client, store: ChunkStore, collection: str, strip: bool, batch_size: int) -> dict:
+    moved = raw_bytes = 0
+    offset = None
+
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["texto"],
+            with_vectors=False
+        )
+        items = [(point.id, point.payload["texto"]) for point in points if "texto" in (point.payload or {})]
+        if items:
+            store.put_many(collection, items)
+            if strip:
+                client.delete_payload(
+                    collection_name=collection,
+                    keys=["texto"],
+                    points=[point_id for point_id, _ in items]
+                )
+            moved += len(items)
+            raw_bytes += sum(len(text.encode("utf-8")) for _, text in items)
+        if offset is None:
+            break
+
+    return {"moved": moved, "raw_bytes": raw_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move chunk texts from Qdrant payloads to the chunk store")
+    parser.add_argument("--collection", nargs="*", default=None, help="Collections to migrate (default: all)")
+    parser.add_argument("--strip", action="store_true", help="Remove texto from the Qdrant payloads after copying")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    rag = get_rag_system()
+    store = rag.chunk_store or ChunkStore()
+    collections = args.collection or list(rag.collections.values())
+
+    for collection in collections:
+        started = time.perf_counter()
+        stats = migrate_collection(rag.client, store, collection, args.strip, args.batch_size)
+        logger.info(
+            f"{collection}: {stats['moved']} texts ({stats['raw_bytes'] / 1e6:.1f} MB) moved "
+            f"in {time.perf_counter() - started:.1f}s{' and stripped from Qdrant' if args.strip else ''}"
+        )
+
+    logger.info(f"Chunk store: {store.path} ({store.path.stat().st_size / 1e6:.1f} MB on disk)")
+
+
+if __name__ == "__main__":
+    main()
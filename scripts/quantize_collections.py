@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Converte as coleções existentes do Qdrant para vetores quantizados (in-place)
+e mede a perda de recall
+
+Aplica o perfil de ingest/cfg/collections.yml (quantização scalar/binary,
+vetores originais em disco) e gera um relatório comparando a busca
+quantizada com rescoring contra a busca exata nos vetores originais.
+A quantização é opt-in: ative por coleção em collections.yml.
+
+Uso:
+    python scripts/quantize_collections.py --migrate
+    python scripts/quantize_collections.py --report --samples 200 --k 10
+    python scripts/quantize_collections.py --migrate --report --collection doutrina
+    python scripts/quantize_collections.py --report --oversampling 1.5 3.0
+"""
+
+import sys
+import time
+import random
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "api"))
+
+from qdrant_client.models import SearchParams, QuantizationSearchParams, Filter, HasIdCondition
+
+from rag import get_rag_system
+from services.collection_profile import full_vector
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def wait_until_green(client, collection: str, timeout: float = 3600):
+    """Wait for Qdrant to finish rebuilding segments after a config change"""
+    started = time.time()
+    while time.time() - started < timeout:
+        status = client.get_collection(collection).status
+        if str(getattr(status, "value", status)).lower() == "green":
+            return True
+        time.sleep(2)
+    return False
+
+
+def migrate(rag, collections: List[str], wait: bool):
+    for collection in collections:
+        profile = rag.profiles.get(collection)
+        logger.info(
+            f"{collection}: quantization={profile.quantization_type}, "
+            f"on_disk_vectors={profile.on_disk_vectors}"
+        )
+        profile.migrate(rag.client)
+        for field in profile.ensure_payload_indexes(rag.client):
+            logger.info(f"  Created payload index {collection}.{field}")
+        if wait:
+            logger.info(f"  Waiting for {collection} to be re-optimized...")
+            if not wait_until_green(rag.client, collection):
+                logger.warning(f"  {collection} still optimizing, recall report may be partial")
+
+
+def sample_query_vectors(client, collection: str, samples: int, batch_size: int = 10000) -> list:
+    """
+    Use stored vectors as queries (no encoder needed)
+
+    Ids are drawn uniformly over the whole collection (reservoir sampling
+    over an id-only scroll), not from the first scrolled segment.
+
+    Returns:
+        (point id, full vector) pairs
+    """
+    reservoir, seen, offset = [], 0, None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        for point in points:
+            seen += 1
+            if len(reservoir) < samples:
+                reservoir.append(point.id)
+            else:
+                slot = random.randrange(seen)
+                if slot < samples:
+                    reservoir[slot] = point.id
+        if offset is None:
+            break
+
+    if not reservoir:
+        return []
+    points = client.retrieve(collection_name=collection, ids=reservoir, with_payload=False, with_vectors=True)
+    return [(p.id, full_vector(p.vector)) for p in points if p.vector is not None]
+
+
+def excluding(point_id) -> Filter:
+    """A query vector taken from the collection must not find its own point"""
+    return Filter(must_not=[HasIdCondition(has_id=[point_id])])
+
+
+def recall_report(rag, collections: List[str], samples: int, k: int, oversamplings: List[Optional[float]]):
+    exact = SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+
+    print("\n" + "=" * 78)
+    print(f"{'collection':<14}{'points':>10}{'RAM before':>13}{'RAM after':>12}"
+          f"{'oversampl.':>11}{f'recall@{k}':>11}{'ms/query':>9}")
+    print("-" * 78)
+
+    for collection in collections:
+        profile = rag.profiles.get(collection)
+        info = rag.client.get_collection(collection)
+        points = info.points_count or 0
+        ram = profile.estimate_vector_ram(points)
+
+        queries = sample_query_vectors(rag.client, collection, samples)
+        if not queries:
+            print(f"{collection:<14}{points:>10}  (empty)")
+            continue
+
+        truth = [
+            {
+                hit.id for hit in rag.client.search(
+                    collection, query_vector=profile.query_vector(q), query_filter=excluding(point_id),
+                    limit=k, search_params=exact
+                )
+            }
+            for point_id, q in queries
+        ]
+
+        for oversampling in oversamplings:
+            params = profile.search_params(oversampling)
+            found = 0
+            started = time.perf_counter()
+            for (point_id, q), expected in zip(queries, truth):
+                hits = rag.client.search(
+                    collection, query_vector=profile.query_vector(q), query_filter=excluding(point_id),
+                    limit=k, search_params=params
+                )
+                found += len(expected & {hit.id for hit in hits})
+            elapsed = (time.perf_counter() - started) / len(queries) * 1000
+
+            recall = found / max(sum(len(t) for t in truth), 1)
+            label = "-" if params is None else f"{params.quantization.oversampling or 1.0:.1f}"
+            print(f"{collection:<14}{points:>10}{format_bytes(ram['original_bytes']):>13}"
+                  f"{format_bytes(ram['ram_bytes']):>12}{label:>11}{recall:>11.4f}{elapsed:>9.1f}")
+
+    print("=" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize Qdrant collections and report recall")
+    parser.add_argument("--migrate", action="store_true", help="Apply quantization/on-disk profile in place")
+    parser.add_argument("--report", action="store_true", help="Measure recall vs exact search")
+    parser.add_argument("--collection", type=str, help="Single collection (default: all)")
+    parser.add_argument("--samples", type=int, default=100, help="Query vectors sampled per collection")
+    parser.add_argument("--k", type=int, default=10, help="Recall cutoff")
+    parser.add_argument("--oversampling", type=float, nargs="*", default=None,
+                        help="Oversampling factors to compare (default: profile value)")
+    parser.add_argument("--no-wait", action="store_true", help="Do not wait for re-optimization")
+    args = parser.parse_args()
+
+    if not (args.migrate or args.report):
+        parser.print_help()
+        return
+
+    rag = get_rag_system()
+    collections = [args.collection] if args.collection else list(rag.collections.values())
+
+    if args.migrate:
+        migrate(rag, collections, wait=not args.no_wait)
+
+    if args.report:
+        recall_report(rag, collections, args.samples, args.k, args.oversampling or [None])
+
+
+if __name__ == "__main__":
+    main()